@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Body, HTTPException
+from backend.app.core.model_registry import model_registry
+from backend.app.core.rbac import RequireViewer
+from backend.app.schemas.admin import ModelsResponse, WarmupRequest
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+def _models() -> ModelsResponse:
+    return ModelsResponse(idle_ttl_s=model_registry.ttl_s, models=model_registry.stats())
+
+@router.get("/models", response_model=ModelsResponse)
+def models(role=RequireViewer):
+    return _models()
+
+@router.post("/warmup", response_model=ModelsResponse)
+def warmup(req: WarmupRequest = Body(default=WarmupRequest()), role=RequireViewer):
+    unknown = set(req.models or []) - set(model_registry.names())
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown models: {sorted(unknown)}")
+    model_registry.warmup(req.models)
+    return _models()
@@ -1,6 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Path
-from typing import Dict, Any, Optional
-from backend.app.schemas.retrieval import QueryRequest, RetrievalResponse, StatsResponse
+from fastapi import APIRouter, Depends, HTTPException, Body, Path, Query
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Any, Literal, Optional
+from backend.app.schemas.retrieval import (
+    BatchQueryRequest,
+    BatchRetrievalResponse,
+    ClusterRequest,
+    ClusterResponse,
+    DeleteRequest,
+    IndexUpdateResponse,
+    QueryRequest,
+    RetrievalResponse,
+    StatsResponse,
+    UpsertRequest,
+    VersionsResponse,
+)
 from backend.app.core.rbac import RequireViewer
 from backend.app.services.retrieval_service import RetrievalService
 
@@ -8,22 +21,87 @@ router = APIRouter(prefix="/retrieval", tags=["retrieval"])
 _service = RetrievalService()
 
 @router.post("/search", response_model=RetrievalResponse)
-def search(req: QueryRequest, role=RequireViewer):
-    if not req.query.strip():
+async def search(req: QueryRequest, role=RequireViewer):
+    if not req.cursor and not req.query.strip():
         raise HTTPException(status_code=400, detail="Query is empty")
-    hits = _service.search(
-        req.query,
+    # the embedding is micro-batched with concurrent requests; the rest runs in the threadpool.
+    # Cursor pages usually come from the cached candidate list and need no embedding.
+    qv = await _service.encode_query(req.query) if req.faiss_weight and not req.cursor else None
+    try:
+        return await run_in_threadpool(
+            _service.search_page,
+            req.query,
+            k=req.k,
+            bm25_weight=req.bm25_weight,
+            faiss_weight=req.faiss_weight,
+            filters=req.filters or {},
+            fusion=req.fusion,
+            query_vector=qv,
+            cursor=req.cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/search_batch", response_model=BatchRetrievalResponse)
+def search_batch(req: BatchQueryRequest, role=RequireViewer):
+    if not req.queries or any(not q.strip() for q in req.queries):
+        raise HTTPException(status_code=400, detail="Queries must be a non-empty list of non-empty strings")
+    results = _service.search_many(
+        req.queries,
         k=req.k,
         bm25_weight=req.bm25_weight,
         faiss_weight=req.faiss_weight,
         filters=req.filters or {},
+        fusion=req.fusion,
+    )
+    return BatchRetrievalResponse(
+        results=[RetrievalResponse(query=q, hits=hits) for q, hits in zip(req.queries, results)]
     )
-    return RetrievalResponse(query=req.query, hits=hits)
 
 @router.get("/stats", response_model=StatsResponse)
 def stats(role=RequireViewer):
     return _service.stats()
 
+# ---- Incremental index updates ----
+@router.post("/documents", response_model=IndexUpdateResponse)
+def upsert_documents(req: UpsertRequest, role=RequireViewer):
+    if not req.documents or any(not d.doc_id.strip() or not d.text.strip() for d in req.documents):
+        raise HTTPException(status_code=400, detail="Documents need a non-empty doc_id and text")
+    added, replaced, alerts = _service.upsert_documents([d.model_dump() for d in req.documents])
+    return IndexUpdateResponse(added=added, replaced=replaced, alerts=alerts, stats=_service.stats())
+
+@router.post("/documents/delete", response_model=IndexUpdateResponse)
+def delete_documents(req: DeleteRequest, role=RequireViewer):
+    deleted = _service.delete_documents(req.doc_ids)
+    return IndexUpdateResponse(deleted=deleted, stats=_service.stats())
+
+@router.post("/compact", response_model=StatsResponse)
+def compact(role=RequireViewer):
+    return _service.compact()
+
+# ---- Near-duplicate / version clusters ----
+@router.get("/clusters", response_model=ClusterResponse)
+def corpus_clusters(
+    threshold: Optional[float] = Query(default=None, ge=0.0, le=1.0),
+    min_size: int = Query(default=2, ge=1),
+    limit: int = Query(default=100, ge=1, le=10000),
+    role=RequireViewer,
+):
+    threshold, clusters = _service.version_clusters(threshold=threshold, min_size=min_size, limit=limit)
+    return ClusterResponse(threshold=threshold, clusters=clusters)
+
+@router.post("/clusters", response_model=ClusterResponse)
+def clusters(req: ClusterRequest, role=RequireViewer):
+    threshold, clusters = _service.version_clusters(req.doc_ids, req.threshold, req.min_size, req.limit)
+    return ClusterResponse(threshold=threshold, clusters=clusters)
+
+@router.get("/clusters/{doc_id:path}", response_model=VersionsResponse)
+def document_versions(doc_id: str, threshold: Optional[float] = Query(default=None, ge=0.0, le=1.0), role=RequireViewer):
+    threshold, versions = _service.versions_of(doc_id, threshold)
+    if versions is None:
+        raise HTTPException(status_code=404, detail=f"Document not indexed: {doc_id}")
+    return VersionsResponse(doc_id=doc_id, threshold=threshold, versions=versions)
+
 # ---- Saved Queries ----
 @router.get("/saved_queries", response_model=Dict[str, Any])
 def list_saved_queries(role=RequireViewer):
@@ -53,3 +131,18 @@ def save_watchlist(name: str = Body(..., embed=True), doc_ids: list[str] = Body(
 def delete_watchlist(name: str = Path(...)):
     _service.delete_watchlist(name)
     return {"ok": True, "name": name}
+
+# ---- Alerts (saved query / watchlist matches of upserted documents) ----
+@router.get("/alerts", response_model=Dict[str, Any])
+def list_alerts(
+    kind: Optional[Literal["query", "watchlist"]] = Query(default=None),
+    name: Optional[str] = Query(default=None),
+    since: int = Query(default=0, description="return alerts with a larger id"),
+    limit: int = Query(default=100, ge=1, le=1000),
+    role=RequireViewer,
+):
+    return {"alerts": _service.alerts(kind, name, since, limit)}
+
+@router.delete("/alerts/{kind}/{name}", response_model=Dict[str, Any])
+def clear_alerts(kind: Literal["query", "watchlist"], name: str = Path(...)):
+    return {"ok": True, "name": name, "deleted": _service.clear_alerts(kind, name)}
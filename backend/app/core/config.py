@@ -8,6 +8,74 @@ class Settings(BaseSettings):
     INDEX_DIR: str = "./indices"
     EXPORTS_DIR: str = "./exports"
     MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # sentence encoder runtime: torch (fp32) | torch_int8 (dynamic quantization) | onnx (ONNX Runtime)
+    EMBED_BACKEND: str = "torch"
+    # index build: encoder worker processes, torch/ORT threads per worker (0 = cores // workers), docs per chunk
+    EMBED_WORKERS: int = 1
+    EMBED_THREADS_PER_WORKER: int = 0
+    EMBED_CHUNK_SIZE: int = 8192
+    # index every clause of the CUAD full_contract_txt files as a passage (longer clauses split at this size)
+    INDEX_CUAD_CONTRACTS: bool = True
+    PASSAGE_MAX_CHARS: int = 1500
+
+    # FAISS index layout: flat (exact) | ivf_flat | ivf_pq | hnsw | pq
+    FAISS_INDEX_TYPE: str = "flat"
+    FAISS_NLIST: int = 1024
+    FAISS_NPROBE: int = 16
+    FAISS_HNSW_M: int = 32
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200
+    FAISS_HNSW_EF_SEARCH: int = 64
+    FAISS_PQ_M: int = 16
+    FAISS_PQ_NBITS: int = 8
+    # vector storage for flat / ivf_flat / hnsw: fp32 | fp16 | sq8 (8-bit scalar quantization, 4x smaller);
+    # saved indices are opened memory-mapped so every worker shares one page-cached copy
+    FAISS_STORAGE: str = "fp32"
+    FAISS_MMAP: bool = True
+    # the build's recall / latency report rebuilds each compared index type over a random sample of this many vectors
+    FAISS_REPORT_SAMPLE: int = 50000
+
+    # incremental updates: delta segments are merged / compacted by a background thread
+    RETRIEVAL_COMPACT_INTERVAL_S: float = 30.0
+    RETRIEVAL_DELTA_MAX_SEGMENTS: int = 8
+    RETRIEVAL_DELTA_MAX_DOCS: int = 2000
+    # rebuilt / compacted indices are published as generations under INDEX_DIR/generations;
+    # workers poll current.json and swap a new generation in without a restart
+    INDEX_WATCH_INTERVAL_S: float = 5.0
+    INDEX_KEEP_GENERATIONS: int = 2
+    # builds split the corpus into this many shards by document-id hash (1 = a single index);
+    # served shards run as one server process each ("process") or inside the worker ("inline")
+    RETRIEVAL_SHARDS: int = 1
+    RETRIEVAL_SHARD_TRANSPORT: str = "process"
+    # score upserted documents against saved queries / watchlists and store the matches as alerts
+    PERCOLATE_ON_UPSERT: bool = True
+    # near-duplicate / version clusters: MinHash over word shingles, LSH with MINHASH_BANDS bands
+    # (rows per band = NUM_PERM / BANDS); clusters join documents with estimated Jaccard >= threshold
+    MINHASH_NUM_PERM: int = 128
+    MINHASH_BANDS: int = 32
+    MINHASH_SHINGLE: int = 3
+    VERSION_CLUSTER_THRESHOLD: float = 0.7
+
+    # concurrent /retrieval/search requests arriving within the window share one query encode
+    QUERY_BATCH_ENABLED: bool = True
+    QUERY_BATCH_MAX_SIZE: int = 32
+    QUERY_BATCH_WINDOW_MS: float = 2.0
+
+    # LRU caches for repeated queries (0 disables)
+    QUERY_EMBED_CACHE_SIZE: int = 1024
+    RESULT_CACHE_SIZE: int = 2048
+
+    # cursor pagination: fused candidate lists per search (LRU, expiring after the TTL); retrieval
+    # only reruns, twice as deep, when a page runs past them, up to SEARCH_MAX_DEPTH per retriever
+    SEARCH_CURSOR_CACHE_SIZE: int = 256
+    SEARCH_CURSOR_TTL_S: float = 600.0
+    SEARCH_MAX_DEPTH: int = 5000
+
+    # persistent (model, sha256(text)) -> embedding store under INDEX_DIR/embeddings
+    EMBED_STORE_ENABLED: bool = True
+    EMBED_STORE_DTYPE: str = "float16"
+
+    # models load on first use; unused ones are dropped after this many seconds (0 = keep forever)
+    MODEL_IDLE_TTL_S: float = 1800.0
 
     JWT_SECRET: str = "change-me-local-only"
     JWT_ALG: str = "HS256"
@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def _param_bytes(obj: Any) -> int:
+    """Size of the torch parameters/buffers reachable from `obj` (itself or its `.model`)."""
+    try:
+        import torch
+    except ImportError:
+        return 0
+    module = obj if isinstance(obj, torch.nn.Module) else getattr(obj, "model", None)
+    if not isinstance(module, torch.nn.Module):
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+@dataclass
+class _Entry:
+    loader: Callable[[], Any]
+    model: Any = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    load_seconds: Optional[float] = None
+    memory_bytes: int = 0
+    rss_delta_bytes: Optional[int] = None
+    last_used: float = 0.0
+
+class ModelRegistry:
+    """
+    Process-wide registry of heavyweight models. Services register a
+    loader at import time (cheap) and call get() when they need the model,
+    so a worker only loads what it actually serves. Models unused for
+    `ttl_s` seconds are dropped by a background reaper; the next get()
+    loads them again.
+    """
+
+    def __init__(self, ttl_s: float = 0.0):
+        self.ttl_s = ttl_s
+        self._entries: Dict[str, _Entry] = {}
+        self._reaper: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(loader)
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        entry.last_used = time.monotonic()
+        model = entry.model
+        if model is not None:
+            return model
+        with entry.lock:
+            if entry.model is None:
+                rss0, t0 = _rss_bytes(), time.perf_counter()
+                entry.model = entry.loader()
+                entry.load_seconds = time.perf_counter() - t0
+                rss1 = _rss_bytes()
+                entry.rss_delta_bytes = rss1 - rss0 if rss0 is not None and rss1 is not None else None
+                entry.memory_bytes = _param_bytes(entry.model)
+                logger.info("Loaded model %s in %.2fs", name, entry.load_seconds)
+            entry.last_used = time.monotonic()
+            self._ensure_reaper()
+            return entry.model
+
+    def warmup(self, names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        for name in names or self.names():
+            self.get(name)
+        return self.stats()
+
+    def evict(self, name: str) -> bool:
+        """Drop the registry's reference; callers still holding the model keep using it."""
+        entry = self._entries.get(name)
+        if entry is None or entry.model is None:
+            return False
+        with entry.lock:
+            entry.model = None
+            entry.memory_bytes = 0
+        logger.info("Evicted model %s", name)
+        return True
+
+    def evict_idle(self) -> List[str]:
+        if self.ttl_s <= 0:
+            return []
+        now = time.monotonic()
+        idle = [n for n, e in self._entries.items() if e.model is not None and now - e.last_used > self.ttl_s]
+        return [n for n in idle if self.evict(n)]
+
+    def _ensure_reaper(self):
+        if self.ttl_s <= 0 or self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="model-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(min(self.ttl_s, 60.0))
+            try:
+                self.evict_idle()
+            except Exception:
+                logger.exception("Model eviction failed")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "name": n,
+                "loaded": e.model is not None,
+                "load_seconds": e.load_seconds,
+                "memory_bytes": e.memory_bytes,
+                "rss_delta_bytes": e.rss_delta_bytes,
+                "idle_seconds": now - e.last_used if e.last_used else None,
+            }
+            for n, e in self._entries.items()
+        ]
+
+model_registry = ModelRegistry(ttl_s=settings.MODEL_IDLE_TTL_S)
@@ -0,0 +1,17 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+class ModelInfo(BaseModel):
+    name: str
+    loaded: bool
+    load_seconds: Optional[float] = None
+    memory_bytes: int = 0
+    rss_delta_bytes: Optional[int] = None
+    idle_seconds: Optional[float] = None
+
+class WarmupRequest(BaseModel):
+    models: Optional[List[str]] = None  # default: every registered model
+
+class ModelsResponse(BaseModel):
+    idle_ttl_s: float
+    models: List[ModelInfo]
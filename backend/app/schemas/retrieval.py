@@ -1,12 +1,29 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Any, List, Literal, Optional, Dict
 
 class QueryRequest(BaseModel):
-    query: str
+    query: str = ""
+    k: int = 10
+    bm25_weight: float = 0.5
+    faiss_weight: float = 0.5
+    filters: Optional[Dict[str, str]] = None
+    fusion: Literal["weighted_rrf", "weighted", "rrf"] = Field(
+        default="weighted_rrf", description="weighted_rrf: weighted top-k in RRF order | weighted | rrf"
+    )
+    cursor: Optional[str] = Field(
+        default=None, description="next_cursor of a previous response: its next k hits (query, weights, "
+                                  "filters and fusion come from the cursor)"
+    )
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
     k: int = 10
     bm25_weight: float = 0.5
     faiss_weight: float = 0.5
     filters: Optional[Dict[str, str]] = None
+    fusion: Literal["weighted_rrf", "weighted", "rrf"] = Field(
+        default="weighted_rrf", description="weighted_rrf: weighted top-k in RRF order | weighted | rrf"
+    )
 
 class RetrievalHit(BaseModel):
     doc_id: str
@@ -21,9 +38,73 @@ class RetrievalHit(BaseModel):
 class RetrievalResponse(BaseModel):
     query: str
     hits: List[RetrievalHit]
+    offset: int = 0
+    next_cursor: Optional[str] = None
+
+class BatchRetrievalResponse(BaseModel):
+    results: List[RetrievalResponse]
 
 class StatsResponse(BaseModel):
     bm25_docs: int
     faiss_docs: int
+    serving_generation: Optional[str] = Field(default=None, description="index generation answering queries")
+    generation_loaded_at: Optional[str] = None
+    loading_generation: Optional[str] = Field(default=None, description="published generation being loaded in the background")
+    shards: int = Field(default=1, description="index shards queried per request (1 = a single index)")
     last_build: Optional[str] = None
     model_name: Optional[str] = None
+    pending_docs: int = 0
+    delta_segments: int = 0
+    tombstones: int = 0
+    last_compaction: Optional[str] = None
+    index_generation: int = 0
+    caches: Dict[str, Dict[str, Any]] = Field(default_factory=dict, description="size/hits/misses per cache")
+    query_batching: Dict[str, Any] = Field(default_factory=dict, description="micro-batched query encodes: batch-size histogram")
+    faiss: Dict[str, Any] = Field(default_factory=dict, description="vector storage / mmap, bytes vs float32, private heap "
+                                  "bytes; build_report: recall@10 and latency vs exact float32 search")
+
+class ClusterRequest(BaseModel):
+    doc_ids: Optional[List[str]] = Field(default=None, description="cluster only these documents (e.g. a result page); whole corpus when omitted")
+    threshold: Optional[float] = Field(default=None, ge=0.0, le=1.0, description="minimum estimated Jaccard similarity")
+    min_size: int = Field(default=2, ge=1)
+    limit: int = Field(default=100, ge=1, le=10000)
+
+class ClusterMember(BaseModel):
+    doc_id: str
+    similarity: float = Field(description="estimated Jaccard similarity to the cluster's first member (or the queried document)")
+    title: Optional[str] = None
+    source: Optional[str] = None
+
+class VersionCluster(BaseModel):
+    members: List[ClusterMember]
+
+class ClusterResponse(BaseModel):
+    threshold: float
+    clusters: List[VersionCluster]
+
+class VersionsResponse(BaseModel):
+    doc_id: str
+    threshold: float
+    versions: List[ClusterMember]
+
+class DocumentIn(BaseModel):
+    doc_id: str
+    text: str
+    title: Optional[str] = None
+    snippet: Optional[str] = None
+    path: Optional[str] = None
+    source: Optional[str] = None
+    meta: Optional[Dict[str, str]] = Field(default=None, description="filter fields: type, BU, jurisdiction, counterparty, date")
+
+class UpsertRequest(BaseModel):
+    documents: List[DocumentIn]
+
+class DeleteRequest(BaseModel):
+    doc_ids: List[str]
+
+class IndexUpdateResponse(BaseModel):
+    added: int = 0
+    replaced: int = 0
+    deleted: int = 0
+    alerts: int = Field(default=0, description="saved query / watchlist alerts raised by this update")
+    stats: StatsResponse
@@ -6,17 +6,27 @@ from backend.app.schemas.classify import (
     ClassifyResponse,
     TrainLoraResponse,
 )
-from models.inference import LoraClassifier, ART_DIR
-from models.lora_finetune_cuad import train_lora as lora_train
 from backend.app.core.config import settings
+from backend.app.core.model_registry import model_registry
+
+MODEL_KEY = "lora_classifier"
+
+def _load_classifier():
+    # torch/transformers/peft are imported on first use, not when the router is imported
+    from models.inference import LoraClassifier
+
+    return LoraClassifier()
+
+model_registry.register(MODEL_KEY, _load_classifier)
 
 class LoraClassifierService:
-    def __init__(self):
-        self._clf = LoraClassifier()
+    @property
+    def _clf(self):
+        return model_registry.get(MODEL_KEY)
 
     def _reload(self):
-        # re-instantiate to pick up new adapters after training
-        self._clf = LoraClassifier()
+        # dropped from the registry; the next call loads the new adapters
+        model_registry.evict(MODEL_KEY)
 
     def classify(self, text: str) -> ClassifyResponse:
         label, prob, spans = self._clf.predict(text)
@@ -36,6 +46,9 @@ class LoraClassifierService:
         epochs: int = 1,
         batch_size: int = 8,
     ) -> TrainLoraResponse:
+        from models.inference import ART_DIR
+        from models.lora_finetune_cuad import train_lora as lora_train
+
         if csv_path:
             csv_p = Path(csv_path)
         else:
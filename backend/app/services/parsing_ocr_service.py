@@ -9,6 +9,7 @@ from typing import List, Optional, Dict, Any
 import fitz  # PyMuPDF
 import pdfplumber
 from fastapi import UploadFile, HTTPException
+from retrieval.contract_passages import clause_spans
 
 try:
     from docx import Document  # python-docx
@@ -98,36 +99,9 @@ def has_tables_pdfplumber(pl_page) -> bool:
         return False
 
 def clause_segment(text: str) -> List[ClauseOut]:
-    lines = text.splitlines()
-    clauses: List[ClauseOut] = []
-    offsets: List[int] = []
-    pos = 0
-    for ln in lines:
-        offsets.append(pos)
-        pos += len(ln) + 1  # + newline
-    heads = []
-    for i, ln in enumerate(lines):
-        if ln.strip() and (ln.isupper() or re.match(r"^[A-Z][A-Za-z0-9 ,/&\\-]{2,}$", ln.strip())):
-            heads.append(i)
-    if not heads:
-        return [ClauseOut(id="C1", title=lines[0].strip()[:80] if lines else "Document",
-                          heading=lines[0].strip() if lines else "Document",
-                          start=0, end=len(text))]
-    for idx, start_i in enumerate(heads):
-        end_i = heads[idx+1] if idx + 1 < len(heads) else len(lines)
-        start_offset = offsets[start_i]
-        end_offset = offsets[end_i-1] + len(lines[end_i-1]) + 1 if end_i-1 < len(offsets) else len(text)
-        title = lines[start_i].strip()
-        clauses.append(
-            ClauseOut(
-                id=f"C{idx+1}",
-                title=title[:80] or f"Clause {idx+1}",
-                heading=title or f"Clause {idx+1}",
-                start=start_offset,
-                end=end_offset
-            )
-        )
-    return clauses
+    # the splitter lives with the indexer, which cuts CUAD contracts into passages the same way
+    return [ClauseOut(id=cid, title=heading[:80], heading=heading, start=start, end=end)
+            for cid, heading, start, end in clause_spans(text)]
 
 
 # ---------- Core service ----------
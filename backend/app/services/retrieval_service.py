@@ -1,97 +1,515 @@
+import base64
+import binascii
 import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
 from typing import List, Tuple, Dict, Optional
+import numpy as np
 from backend.app.core.config import settings
+from backend.app.core.model_registry import model_registry
 from backend.app.core.path_resolver import index_dir
-from backend.app.schemas.retrieval import RetrievalHit, StatsResponse
+from backend.app.schemas.retrieval import ClusterMember, RetrievalHit, RetrievalResponse, StatsResponse, VersionCluster
 from retrieval.bm25_local import BM25Local
-from retrieval.embed_faiss import EmbedFAISS
-from retrieval.rrf import rrf_fuse
+from retrieval.cache import LRUCache, TTLCache
+from retrieval.delta_log import LOCK, LOG, archive, doc_entry, file_lock, iter_ops
+from retrieval.doc_store import DocStore
+from retrieval.embed_faiss import EmbedFAISS, IndexConfig
+from retrieval.embedding_store import EmbeddingStore, store_model_key
+from retrieval.encoders import load_encoder
+from retrieval.fusion import FUSION_STRATEGIES, fuse, fuse_all, fused_page
+from retrieval.generations import change_token, current as current_generation, new_generation, publish
+from retrieval.meta_columns import MetaColumns
+from retrieval.micro_batch import MicroBatcher
+from retrieval.minhash import MinHashIndex
+from retrieval.percolator import Percolator
+from retrieval.saved_store import SavedStore
+from retrieval.shards import SHARDS, ShardedBM25, ShardedFAISS, ShardSet
+
+logger = logging.getLogger(__name__)
+
+def _new_minhash() -> MinHashIndex:
+    return MinHashIndex(settings.MINHASH_NUM_PERM, settings.MINHASH_BANDS, settings.MINHASH_SHINGLE)
+
+def _encode_cursor(page: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(page, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Dict:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        page = {"q": str(raw["q"]), "bw": float(raw["bw"]), "fw": float(raw["fw"]), "fusion": str(raw["fusion"]),
+                "filters": {str(f): str(v) for f, v in (raw["filters"] or {}).items()}, "offset": int(raw["offset"])}
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError, UnicodeError):
+        raise ValueError("Invalid cursor") from None
+    if page["offset"] < 0 or page["fusion"] not in FUSION_STRATEGIES:
+        raise ValueError("Invalid cursor")
+    return page
+
+class _Candidates:
+    """A search's fused candidate list (fuse_all() arrays), cached for cursor pages."""
+
+    __slots__ = ("gen", "fused", "depth", "exhausted")
+
+    def __init__(self, gen: "_Generation", fused: Tuple[np.ndarray, ...], depth: int, exhausted: bool):
+        # weak: a cached list must not keep a swapped-out generation (and its shard servers) alive
+        self.gen = weakref.ref(gen)
+        self.fused = fused
+        self.depth = depth
+        self.exhausted = exhausted
+
+class _Generation:
+    """
+    One loaded index generation: both retrievers, their metadata and how
+    much of the delta log has been applied. Queries read the serving one
+    once and use that snapshot throughout; a reload swaps the whole object.
+    """
+
+    def __init__(self, name: str, path: Path, bm25: BM25Local, faissi: EmbedFAISS, meta: Dict,
+                 docs_meta: DocStore, meta_cols: Optional[MetaColumns] = None,
+                 shards: Optional[ShardSet] = None, minhash: Optional[MinHashIndex] = None):
+        self.name, self.path = name, path
+        self.bm25, self.faiss = bm25, faissi
+        # sharded generations: bm25/faiss are views fanning out to these (their servers stop with the generation)
+        self.shards = shards
+        # per-document metadata is read from the store for the returned hits only
+        self.meta, self.docs_meta = meta, docs_meta
+        # the same metadata as per-slot columns; filters become masks pushed into both retrievers
+        slot_ids = bm25.doc_ids if bm25.bm25 else faissi.doc_ids
+        if meta_cols is None or len(meta_cols) != len(slot_ids):
+            # generations written before the columns were saved with them
+            meta_cols = MetaColumns.build(slot_ids, docs_meta)
+        self.meta_cols = meta_cols
+        # contract-level MinHash signatures for version clusters
+        self.minhash = minhash if minhash is not None else _new_minhash()
+        self.token: Optional[Tuple[int, int]] = None  # generations.change_token() when it was read
+        self.log_pos, self.log_ino = 0, None
+        self.loaded_at = datetime.utcnow().isoformat() + "Z"
 
 class RetrievalService:
     def __init__(self):
         idx = index_dir()
-        self.bm25_path = idx / "bm25.pkl"
-        self.faiss_dir = idx / "faiss"
-        self.meta_path = idx / "meta.json"
-        self.meta = {}
-        self._bm25 = BM25Local()
-        self._faiss = EmbedFAISS(settings.MODEL_NAME)
+        self.index_root = idx
+        self._store = None
+        if settings.EMBED_STORE_ENABLED:
+            self._store = EmbeddingStore(idx / "embeddings", store_model_key(settings.MODEL_NAME, settings.EMBED_BACKEND),
+                                         settings.EMBED_STORE_DTYPE)
+        self._model_key = f"embedder:{settings.MODEL_NAME}:{settings.EMBED_BACKEND}"
+        model_registry.register(self._model_key, lambda: load_encoder(settings.MODEL_NAME, settings.EMBED_BACKEND))
+        # query embeddings do not depend on the index, so the cache outlives generation swaps
+        self._query_cache = LRUCache(settings.QUERY_EMBED_CACHE_SIZE)
+        self._gen = _Generation("empty", idx, BM25Local(), self._new_faiss(), {}, DocStore())
         self._loaded = False
+        # concurrent async searches share one query-encoder forward pass
+        self._query_batcher = MicroBatcher(lambda queries: self._gen.faiss.encode_queries(queries),
+                                           settings.QUERY_BATCH_MAX_SIZE, settings.QUERY_BATCH_WINDOW_MS)
+        # rebuilt generations are loaded off the query path, then swapped in
+        self._reload_lock = threading.Lock()
+        self._reloader: Optional[threading.Thread] = None
+        self._loading: Optional[str] = None
+        self._failed_token: Optional[Tuple[int, int]] = None
+        self._watcher: Optional[threading.Thread] = None
+
+        # fused results keyed on the request + index generation; any index change bumps the
+        # generation, so stale entries are never hit again and simply age out of the LRU
+        self._results = LRUCache(settings.RESULT_CACHE_SIZE)
+        self._generation = 0
+        # cursor pagination: fused candidate lists, keyed like the results minus k
+        self._candidates = TTLCache(settings.SEARCH_CURSOR_CACHE_SIZE, settings.SEARCH_CURSOR_TTL_S)
+
+        # saved queries & watchlists (SQLite, WAL)
+        self.saved_store_path = idx / "saved_store.sqlite3"
+        self._saved: Optional[SavedStore] = None
+        # saved queries indexed for alerting on upserts; rebuilt when they or the indices change
+        self._percolator: Optional[Percolator] = None
+        self._percolator_src: Optional[Dict] = None
+        self._watch_src: Optional[Dict] = None
+        self._watched: Dict[str, List[str]] = {}
+
+        # incremental updates: every worker appends to / replays the same log
+        self.delta_log_path = idx / LOG
+        self.lock_path = idx / LOCK
+        self._write_lock = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
 
-        # optional metadata for filtering (doc_id -> fields)
-        self.docs_meta_path = idx / "docs_meta.json"
-        self._docs_meta: Dict[str, Dict[str, str]] = {}
+    # the serving generation's parts (read-only views; writers go through the generation)
+    @property
+    def _bm25(self) -> BM25Local:
+        return self._gen.bm25
 
-        # saved queries & watchlists
-        self.saved_store_path = idx / "saved_store.json"
+    @property
+    def _faiss(self) -> EmbedFAISS:
+        return self._gen.faiss
+
+    @property
+    def _meta_cols(self) -> MetaColumns:
+        return self._gen.meta_cols
+
+    @property
+    def _docs_meta(self) -> DocStore:
+        return self._gen.docs_meta
+
+    @property
+    def meta(self) -> Dict:
+        return self._gen.meta
+
+    def _new_faiss(self) -> EmbedFAISS:
+        faissi = EmbedFAISS(settings.MODEL_NAME, IndexConfig.from_settings(settings), store=self._store,
+                            model_loader=lambda: model_registry.get(self._model_key), backend=settings.EMBED_BACKEND)
+        faissi.query_cache = self._query_cache
+        return faissi
 
     def load(self):
-        if self.bm25_path.exists():
-            self._bm25.load(str(self.bm25_path))
-        if (self.faiss_dir / "index.faiss").exists():
-            self._faiss.load(str(self.faiss_dir))
-        if self.meta_path.exists():
-            self.meta = json.loads(self.meta_path.read_text())
-        if self.docs_meta_path.exists():
-            try:
-                self._docs_meta = json.loads(self.docs_meta_path.read_text())
-            except Exception:
-                self._docs_meta = {}
-        self._ensure_saved_store()
+        with self._write_lock, file_lock(self.lock_path):
+            self._load_indices()
+        self._saved_store()
         self._loaded = True
+        if settings.INDEX_WATCH_INTERVAL_S > 0 and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_loop, name="retrieval-watcher", daemon=True)
+            self._watcher.start()
 
-    def _ensure_saved_store(self):
-        if not self.saved_store_path.exists():
-            self.saved_store_path.write_text(json.dumps({"saved_queries": {}, "watchlists": {}}, indent=2))
+    def _open_generation(self) -> _Generation:
+        """Read the published generation from disk; nothing is swapped yet and no lock is needed."""
+        token = change_token(self.index_root)
+        name, path = current_generation(self.index_root)
+        bm25, faissi, shards = BM25Local(), self._new_faiss(), None
+        if (path / SHARDS / "manifest.json").exists():
+            shards = ShardSet.open(path / SHARDS, faissi.config, settings.MODEL_NAME, settings.EMBED_BACKEND,
+                                   settings.RETRIEVAL_SHARD_TRANSPORT)
+            bm25, faissi = ShardedBM25(shards), ShardedFAISS(shards, faissi)
+        if (path / "bm25" / "manifest.json").exists():
+            # memory-mapped: workers share the page cache instead of each holding a copy
+            bm25.load(str(path / "bm25"))
+        if (path / "faiss" / "index.faiss").exists():
+            faissi.load(str(path / "faiss"))
+        meta = json.loads((path / "meta.json").read_text()) if (path / "meta.json").exists() else {}
+        meta_cols = MetaColumns.load(str(path / "meta_cols")) if (path / "meta_cols" / "manifest.json").exists() else None
+        minhash = MinHashIndex.load(str(path / "minhash")) if (path / "minhash" / "manifest.json").exists() else None
+        gen = _Generation(name, path, bm25, faissi, meta, DocStore.open(path), meta_cols, shards=shards, minhash=minhash)
+        gen.token = token
+        return gen
 
-    def _read_saved(self) -> Dict[str, Dict]:
+    def _install(self, gen: _Generation):
+        """Catch `gen` up with the delta log, then make it the serving generation (caller holds both locks)."""
+        self._replay_log(gen)
+        self._gen = gen
+        self._generation += 1
+        self._percolator = None
+
+    def _load_indices(self):
+        self._install(self._open_generation())
+
+    def _reload_in_background(self):
+        with self._reload_lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            self._reloader = threading.Thread(target=self._reload, name="retrieval-reload", daemon=True)
+            self._reloader.start()
+
+    def _reload(self):
+        token = change_token(self.index_root)
         try:
-            return json.loads(self.saved_store_path.read_text())
+            self._loading = current_generation(self.index_root)[0]
+            gen = self._open_generation()  # the slow part: queries keep using the serving generation
+            with self._write_lock, file_lock(self.lock_path):
+                # a newer one may have been published meanwhile; the next check loads that instead
+                if gen.token == change_token(self.index_root):
+                    self._install(gen)
+                    logger.info("Serving index generation %s", gen.name)
         except Exception:
-            return {"saved_queries": {}, "watchlists": {}}
+            self._failed_token = token
+            logger.exception("Loading index generation %s failed; still serving %s", self._loading, self._gen.name)
+        finally:
+            self._loading = None
+
+    def _generation_moved(self) -> bool:
+        token = change_token(self.index_root)
+        return token != self._gen.token and token != self._failed_token
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(settings.INDEX_WATCH_INTERVAL_S)
+            if self._generation_moved():
+                self._reload_in_background()
 
-    def _write_saved(self, data: Dict[str, Dict]):
-        self.saved_store_path.write_text(json.dumps(data, indent=2))
+    def _saved_store(self) -> SavedStore:
+        # independent of the indices: opened on first use, the legacy JSON store is imported once
+        if self._saved is None:
+            with self._write_lock:
+                if self._saved is None:
+                    self._saved = SavedStore(self.saved_store_path, legacy_json=self.saved_store_path.with_suffix(".json"))
+        return self._saved
+
+    def _current_percolator(self) -> Percolator:
+        # the store hands out the same dict until the saved queries change
+        saved = self._saved_store().saved_queries()
+        if self._percolator is None or self._percolator_src is not saved:
+            gen = self._gen
+            percolator = Percolator.build(saved, gen.bm25, gen.faiss, gen.meta_cols)
+            with self._write_lock:
+                self._percolator, self._percolator_src = percolator, saved
+        return self._percolator
+
+    def _record_alerts(self, docs: List[Dict], matches: List[Tuple[str, str, Optional[float], Optional[float]]]) -> int:
+        """Store percolator matches and watchlist hits of an upsert, one alert per (name, document)."""
+        store = self._saved_store()
+        watchlists = store.watchlists()
+        if self._watch_src is not watchlists:
+            watched: Dict[str, List[str]] = {}
+            for name, doc_ids in watchlists.items():
+                for d in doc_ids:
+                    watched.setdefault(d, []).append(name)
+            self._watched, self._watch_src = watched, watchlists
+
+        def parent(doc_id: str) -> str:
+            # a passage alerts as its contract
+            return (self._docs_meta.get(doc_id) or {}).get("parent") or doc_id
+
+        def best(a: Optional[float], b: Optional[float]) -> Optional[float]:
+            return b if a is None else a if b is None else max(a, b)
+
+        rows: Dict[Tuple[str, str, str], List[Optional[float]]] = {}
+        for name, doc_id, b, f in matches:
+            row = rows.setdefault(("query", name, parent(doc_id)), [None, None])
+            row[0], row[1] = best(row[0], b), best(row[1], f)
+        for doc in docs:
+            for d in dict.fromkeys((doc["doc_id"], parent(doc["doc_id"]))):
+                for name in self._watched.get(d, []):
+                    rows.setdefault(("watchlist", name, d), [None, None])
+        return store.add_alerts((kind, name, d, b, f) for (kind, name, d), (b, f) in rows.items())
+
+    def alerts(self, kind: Optional[str] = None, name: Optional[str] = None, since: int = 0,
+               limit: int = 100) -> List[Dict]:
+        return self._saved_store().alerts(kind, name, since, limit)
+
+    def clear_alerts(self, kind: str, name: str) -> int:
+        return self._saved_store().clear_alerts(kind, name)
 
     # ---- public saved queries/watchlists API ----
     def saved_queries(self) -> Dict[str, Dict]:
-        if not self._loaded:
-            self.load()
-        return self._read_saved().get("saved_queries", {})
+        return self._saved_store().saved_queries()
 
     def save_query(self, name: str, payload: Dict):
-        if not self._loaded:
-            self.load()
-        data = self._read_saved()
-        data.setdefault("saved_queries", {})[name] = payload
-        self._write_saved(data)
+        self._saved_store().save_query(name, payload)
 
     def delete_query(self, name: str):
-        if not self._loaded:
-            self.load()
-        data = self._read_saved()
-        data.get("saved_queries", {}).pop(name, None)
-        self._write_saved(data)
+        self._saved_store().delete_query(name)
 
     def watchlists(self) -> Dict[str, List[str]]:
+        return self._saved_store().watchlists()
+
+    def save_watchlist(self, name: str, doc_ids: List[str]):
+        self._saved_store().save_watchlist(name, doc_ids)
+
+    def delete_watchlist(self, name: str):
+        self._saved_store().delete_watchlist(name)
+
+    # ---- incremental updates ----
+    def upsert_documents(self, docs: List[Dict]) -> Tuple[int, int, int]:
+        """Add or replace documents in both indices; returns (added, replaced, alerts raised)."""
         if not self._loaded:
             self.load()
-        return self._read_saved().get("watchlists", {})
+        percolator = self._current_percolator() if settings.PERCOLATE_ON_UPSERT else None
+        # the encoder is the part that can fail (and the slow part): run it before the log or any index changes
+        items = self._upsert_items(docs)
+        vectors = self._faiss.encode_corpus([t for _, t in items], show_progress_bar=False) if items else None
+        with self._write_lock, file_lock(self.lock_path):
+            self._replay_log()
+            with self._logged({"op": "upsert", "docs": docs}):
+                added, replaced, matches = self._apply_upsert(docs, percolator, vectors=vectors)
+        self._ensure_compactor()
+        alerts = self._record_alerts(docs, matches) if settings.PERCOLATE_ON_UPSERT else 0
+        return added, replaced, alerts
 
-    def save_watchlist(self, name: str, doc_ids: List[str]):
+    def delete_documents(self, doc_ids: List[str]) -> int:
         if not self._loaded:
             self.load()
-        data = self._read_saved()
-        data.setdefault("watchlists", {})[name] = list(dict.fromkeys(doc_ids))
-        self._write_saved(data)
+        with self._write_lock, file_lock(self.lock_path):
+            self._replay_log()
+            with self._logged({"op": "delete", "doc_ids": list(doc_ids)}):
+                deleted = self._apply_delete(doc_ids)
+        self._ensure_compactor()
+        return deleted
 
-    def delete_watchlist(self, name: str):
+    @contextmanager
+    def _logged(self, op: Dict):
+        """
+        Append `op` to the delta log for the block that applies it (caller
+        holds both locks). If applying fails, the entry is cut off again so
+        no worker replays it, and the generation is reopened from disk to
+        drop whatever the failed apply had already changed in memory.
+        """
+        try:
+            start = os.stat(self.delta_log_path).st_size
+        except FileNotFoundError:
+            start = 0
+        self._append_log(op)
+        try:
+            yield
+        except Exception:
+            os.truncate(self.delta_log_path, start)
+            self._load_indices()
+            raise
+
+    @staticmethod
+    def _upsert_items(docs: List[Dict]) -> List[Tuple[str, str]]:
+        latest = {d["doc_id"]: d for d in docs}  # last write wins within a batch
+        return [(d, doc["text"]) for d, doc in latest.items()]
+
+    def _apply_upsert(self, docs: List[Dict], percolator: Optional[Percolator] = None,
+                      gen: Optional[_Generation] = None, vectors: Optional[np.ndarray] = None) -> Tuple[int, int, List]:
+        gen = gen or self._gen
+        latest = {d["doc_id"]: d for d in docs}
+        items = self._upsert_items(docs)
+        if vectors is None and items:
+            # encode before anything changes: a failing encoder must not leave BM25 ahead of FAISS
+            vectors = gen.faiss.encode_corpus([t for _, t in items], show_progress_bar=False)
+        entries = {d: doc_entry(doc) for d, doc in latest.items()}
+        gen.docs_meta = gen.docs_meta.with_updates(entries)
+        # columns for the new slots go in first so a concurrent search never sees a slot without them
+        gen.meta_cols = gen.meta_cols.extended(latest, entries)
+        new, replaced = gen.bm25.add(items)
+        gen.faiss.delete(replaced)
+        gen.faiss.add_vectors([d for d, _ in items], new, vectors)
+        gen.minhash.add(items, key=lambda d: entries[d].get("parent") or d)
+        self._generation += 1
+        # matched here, while the new docs' vectors are at hand; replayed upserts are not re-alerted
+        matches = [] if percolator is None else [
+            (name, items[j][0], b, f) for name, j, b, f in
+            percolator.match(items, new, vectors, gen.bm25, gen.meta_cols)
+        ]
+        return len(items) - len(replaced), len(replaced), matches
+
+    def _apply_delete(self, doc_ids: List[str], gen: Optional[_Generation] = None) -> int:
+        gen = gen or self._gen
+        gone = set(doc_ids)
+        # deleting a contract deletes its clause passages too
+        gone |= {c for d in list(gone) for c in gen.docs_meta.children(d)}
+        removed = gen.bm25.delete(list(gone))
+        gen.faiss.delete(removed)
+        gen.minhash.delete(gone)
+        gen.docs_meta = gen.docs_meta.without(gone)
+        self._generation += 1
+        return len(removed)
+
+    def _append_log(self, op: Dict):
+        with open(self.delta_log_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(op, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+            self._gen.log_pos = fh.tell()
+        self._gen.log_ino = os.stat(self.delta_log_path).st_ino
+
+    def _replay_log(self, gen: Optional[_Generation] = None):
+        """Apply log entries written by other workers since we last looked (to `gen`, default the serving one)."""
+        gen = gen or self._gen
+        try:
+            st = os.stat(self.delta_log_path)
+        except FileNotFoundError:
+            return
+        if gen.log_ino is not None and (st.st_ino != gen.log_ino or st.st_size < gen.log_pos):
+            # another worker compacted: the generation it published already contains the log
+            self._load_indices()
+            return
+        gen.log_ino = st.st_ino
+        if st.st_size == gen.log_pos:
+            return
+        with open(self.delta_log_path, "rb") as fh:
+            fh.seek(gen.log_pos)
+            data = fh.read()
+        data = data[: data.rfind(b"\n") + 1]  # ignore a line that is still being written
+        for op in iter_ops(data.splitlines()):
+            if op["op"] == "upsert":
+                self._apply_upsert(op["docs"], gen=gen)
+            elif op["op"] == "delete":
+                self._apply_delete(op["doc_ids"], gen=gen)
+        gen.log_pos += len(data)
+
+    def _check_log(self):
+        # cheap stats on the query path; the lock is only taken when something moved
+        if self._generation_moved():
+            # a new generation was published: load it in the background, keep serving this one meanwhile
+            self._reload_in_background()
+            return
+        try:
+            st = os.stat(self.delta_log_path)
+        except FileNotFoundError:
+            return
+        gen = self._gen
+        if st.st_ino != gen.log_ino or st.st_size != gen.log_pos:
+            with self._write_lock, file_lock(self.lock_path):
+                self._replay_log()
+
+    def compact(self) -> StatsResponse:
+        """Fold deltas and tombstones into a newly published generation and truncate the log."""
         if not self._loaded:
             self.load()
-        data = self._read_saved()
-        data.get("watchlists", {}).pop(name, None)
-        self._write_saved(data)
+        with self._write_lock, file_lock(self.lock_path):
+            self._replay_log()
+            gen = self._gen
+            bm25, faissi = gen.bm25, gen.faiss
+            if bm25.segments or bm25.tombstones or faissi.pending or faissi.tombstones:
+                name, path = new_generation(self.index_root)
+                if gen.shards is not None:
+                    # each shard folds its own deltas; collection statistics are recomputed over the result
+                    gen.shards.save_compacted(path / SHARDS)
+                    # compacted shards are laid out back to back, which moves every shard's additions
+                    gen.meta_cols.take(np.concatenate(gen.shards.to_global)).save(str(path / "meta_cols"))
+                else:
+                    gen.meta_cols.save(str(path / "meta_cols"))
+                    bm25.compacted().save(str(path / "bm25"))
+                    fresh = BM25Local(bm25.k1, bm25.b, bm25.epsilon)
+                    fresh.load(str(path / "bm25"))
+                    # compacted into a copy, like BM25: searches keep running on the serving object
+                    faissi.compacted().save(str(path / "faiss"))
+                    # reopened from the file, so the compacted vectors are memory-mapped again
+                    faissi = self._new_faiss()
+                    faissi.load(str(path / "faiss"))
+                gen.minhash.save(str(path / "minhash"))
+                gen.docs_meta.save(str(path / "docs"))
+                meta = {**gen.meta, "generation": name, "last_compaction": datetime.utcnow().isoformat() + "Z"}
+                (path / "meta.json").write_text(json.dumps(meta, indent=2))
+                publish(self.index_root, name, settings.INDEX_KEEP_GENERATIONS)
+                # the log's entries move to the archive (full rebuilds read them back from there)
+                archive(self.index_root)
+                if gen.shards is not None:
+                    # shard sizes changed, and with them the global slot layout: open the generation afresh
+                    compacted = self._open_generation()
+                else:
+                    compacted = _Generation(name, path, fresh, faissi, meta, DocStore.load(str(path / "docs")),
+                                            MetaColumns.load(str(path / "meta_cols")),
+                                            minhash=MinHashIndex.load(str(path / "minhash")))
+                compacted.token = change_token(self.index_root)
+                compacted.log_pos, compacted.log_ino = 0, os.stat(self.delta_log_path).st_ino
+                self._gen = compacted
+                self._generation += 1
+            if self._store is not None:
+                # keys added by runtime upserts sit in the store's delta index; merge them into the main one
+                self._store.consolidate()
+        return self.stats()
+
+    def _ensure_compactor(self):
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._compaction_loop, name="retrieval-compactor", daemon=True)
+            self._compactor.start()
+
+    def _compaction_loop(self):
+        while True:
+            time.sleep(settings.RETRIEVAL_COMPACT_INTERVAL_S)
+            try:
+                bm25 = self._bm25
+                if (bm25.pending_docs >= settings.RETRIEVAL_DELTA_MAX_DOCS
+                        or len(bm25.tombstones) >= settings.RETRIEVAL_DELTA_MAX_DOCS):
+                    self.compact()
+                elif len(bm25.segments) > settings.RETRIEVAL_DELTA_MAX_SEGMENTS:
+                    with self._write_lock:
+                        self._bm25.merge_deltas()
+            except Exception:
+                logger.exception("Background index compaction failed")
 
     # ---- search ----
     def search(
@@ -101,93 +519,295 @@ class RetrievalService:
         bm25_weight: float,
         faiss_weight: float,
         filters: Optional[Dict[str, str]] = None,
+        fusion: str = "weighted_rrf",
+        query_vector: Optional[np.ndarray] = None,
     ) -> List[RetrievalHit]:
+        qv = None if query_vector is None else np.asarray(query_vector)[None, :]
+        return self.search_many([query], k, bm25_weight, faiss_weight, filters, fusion, qv)[0]
+
+    async def encode_query(self, query: str) -> Optional[np.ndarray]:
+        """
+        Query embedding through the shared micro-batcher, for async routes
+        (pass it to search() as `query_vector`). None when batching is off
+        or there is no FAISS index to search.
+        """
+        if not settings.QUERY_BATCH_ENABLED or not self._loaded:
+            return None
+        if not self._faiss.ntotal:
+            return None
+        return await self._query_batcher.submit(" ".join(query.split()))
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int,
+        bm25_weight: float,
+        faiss_weight: float,
+        filters: Optional[Dict[str, str]] = None,
+        fusion: str = "weighted_rrf",
+        query_vectors: Optional[np.ndarray] = None,
+    ) -> List[List[RetrievalHit]]:
+        """
+        Hybrid search for a batch of queries: one batched encode + one FAISS
+        search over the query matrix, and one BM25 pass sharing its buffers.
+        `query_vectors` (one row per query) skips the encode.
+        """
         if not self._loaded:
             self.load()
+        self._check_log()
+        # counter first, then the snapshot: a swap in between only stores newer results under an older key
+        generation = self._generation
+        gen = self._gen
+        filter_key = tuple(sorted((filters or {}).items()))
+        # both retrievers are whitespace-insensitive, so equivalent spellings share an entry
+        norm = [" ".join(q.split()) for q in queries]
+        keys = [(q, k, bm25_weight, faiss_weight, fusion, filter_key, generation) for q in norm]
+        out = [self._results.get(key) for key in keys]
+        todo = list(dict.fromkeys(q for q, hits in zip(norm, out) if hits is None))
+        if todo:
+            # passages of one contract collapse into a single hit, so fetch deeper once contracts are indexed
+            depth = max(k, 50) * (3 if gen.meta.get("passages") else 1)
+            qv = None
+            if query_vectors is not None:
+                row = {q: i for i, q in enumerate(norm)}
+                qv = np.asarray(query_vectors)[[row[q] for q in todo]]
+            bm25_all, faiss_all = self._retrieve(todo, depth, bm25_weight, faiss_weight, filters, qv, gen)
+            fresh = {
+                q: self._fuse(bm25_res, faiss_res, k, bm25_weight, faiss_weight, fusion, gen, depth)
+                for q, bm25_res, faiss_res in zip(todo, bm25_all, faiss_all)
+            }
+            for q, hits in fresh.items():
+                self._results.put((q, k, bm25_weight, faiss_weight, fusion, filter_key, generation), hits)
+            out = [hits if hits is not None else fresh[q] for q, hits in zip(norm, out)]
+        return [list(hits) for hits in out]
 
-        bm25_res = self._bm25.query(query, k=max(k, 50)) if self._bm25.bm25 else []
-        faiss_res = self._faiss.query(query, k=max(k, 50)) if self._faiss.index else []
-
-        def normalize(res: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
-            if not res:
-                return []
-            scores = [s for _, s in res]
-            mn, mx = min(scores), max(scores)
-            rng = (mx - mn) or 1.0
-            return [(d, (s - mn) / rng) for d, s in res]
+    def search_page(
+        self,
+        query: str,
+        k: int,
+        bm25_weight: float,
+        faiss_weight: float,
+        filters: Optional[Dict[str, str]] = None,
+        fusion: str = "weighted_rrf",
+        query_vector: Optional[np.ndarray] = None,
+        cursor: Optional[str] = None,
+    ) -> RetrievalResponse:
+        """
+        One page of hits plus a cursor to the next one. The first page equals
+        search() and shares its result cache (a cached full page always
+        offers a cursor, so the next page may be empty); later pages are
+        cut from the same fused candidate list,
+        cached per search and index generation, so paging does not rerun
+        retrieval until a page runs past the fused candidates (then both
+        retrievers go twice as deep and only the new keys are appended).
+        A cursor carries the whole request, so a worker without the list
+        (or after it expired) rebuilds it as deep as the page needs.
+        Raises ValueError for a malformed cursor.
+        """
+        offset = 0
+        if cursor is not None:
+            page = _decode_cursor(cursor)
+            query, bm25_weight, faiss_weight = page["q"], page["bw"], page["fw"]
+            filters, fusion, offset = page["filters"], page["fusion"], page["offset"]
+            query_vector = None
+        if not self._loaded:
+            self.load()
+        self._check_log()
+        generation = self._generation
+        gen = self._gen
+        norm = " ".join(query.split())
+        filter_key = tuple(sorted((filters or {}).items()))
 
-        nb = normalize(bm25_res)
-        nf = normalize(faiss_res)
+        def next_cursor(more: bool) -> Optional[str]:
+            if not more:
+                return None
+            return _encode_cursor({"q": norm, "bw": bm25_weight, "fw": faiss_weight, "filters": filters or {},
+                                   "fusion": fusion, "offset": offset + k})
 
-        score_map: Dict[str, float] = {}
-        for d, s in nb:
-            score_map[d] = score_map.get(d, 0.0) + bm25_weight * s
-        for d, s in nf:
-            score_map[d] = score_map.get(d, 0.0) + faiss_weight * s
-        merged_sorted = sorted(score_map.items(), key=lambda x: x[1], reverse=True)
+        result_key = (norm, k, bm25_weight, faiss_weight, fusion, filter_key, generation)
+        if cursor is None:
+            hits = self._results.get(result_key)
+            if hits is not None:
+                return RetrievalResponse(query=query, hits=list(hits), next_cursor=next_cursor(len(hits) == k))
+        key = (norm, bm25_weight, faiss_weight, fusion, filter_key, generation)
+        cand = self._candidates.get(key)
+        if cand is not None and cand.gen() is not gen:
+            cand = None
+        if cand is None or (offset + k > len(cand.fused[0]) and not cand.exhausted):
+            mult = 3 if gen.meta.get("passages") else 1
+            depth = max(offset + k, 50) * mult
+            if cand is not None:
+                depth = max(depth, 2 * cand.depth)
+            # never shallower than search(), so the first page is its result
+            depth = max(min(depth, settings.SEARCH_MAX_DEPTH), max(k, 50) * mult)
+            qv = None if query_vector is None else np.asarray(query_vector)[None, :]
+            bm25_res, faiss_res = self._retrieve([norm], depth, bm25_weight, faiss_weight, filters, qv, gen)
+            fused = fuse_all([bm25_res[0][0], faiss_res[0][0]], [bm25_res[0][1], faiss_res[0][1]],
+                             [bm25_weight, faiss_weight], fusion,
+                             keys=[self._group_keys(bm25_res[0][0], gen), self._group_keys(faiss_res[0][0], gen)],
+                             depth=depth)
+            if cand is not None:
+                # pages already cut from the list stay put; deeper candidates only extend it
+                new = ~np.isin(fused[0], cand.fused[0])
+                fused = tuple(np.concatenate([old, arr[new]]) for old, arr in zip(cand.fused, fused))
+            # fewer candidates than asked for: each retriever returned everything that matches
+            exhausted = depth >= settings.SEARCH_MAX_DEPTH or (len(bm25_res[0][0]) < depth and
+                                                                len(faiss_res[0][0]) < depth)
+            cand = _Candidates(gen, fused, depth, exhausted)
+            self._candidates.put(key, cand)
+        fused_keys, best, scores = fused_page(cand.fused, offset, k)
+        hits = self._hits(fused_keys, best, scores, gen)
+        if cursor is None:
+            self._results.put(result_key, hits)
+        more = bool(len(fused_keys)) and (offset + k < len(cand.fused[0]) or not cand.exhausted)
+        return RetrievalResponse(query=query, hits=list(hits), offset=offset, next_cursor=next_cursor(more))
 
-        # optional filtering by docs_meta
-        if filters:
-            merged_sorted = [item for item in merged_sorted if self._passes_filter(item[0], filters)]
+    def _retrieve(self, queries: List[str], depth: int, bm25_weight: float, faiss_weight: float,
+                  filters: Optional[Dict[str, str]], query_vectors: Optional[np.ndarray], gen: _Generation):
+        """(slots, scores) per query from both retrievers, filters applied inside them."""
+        allow = gen.meta_cols.mask(filters)
+        # a zero weight means that retriever is not consulted at all
+        none = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        bm25_all = gen.bm25.query_slots(queries, k=depth, allow=allow) if bm25_weight else none
+        if not faiss_weight:
+            faiss_all = none
+        elif query_vectors is not None:
+            faiss_all = gen.faiss.search_slots(query_vectors, k=depth, allow=allow)
+        else:
+            faiss_all = gen.faiss.query_slots(queries, k=depth, allow=allow)
+        return bm25_all, faiss_all
 
-        merged_sorted = merged_sorted[:k]
+    @staticmethod
+    def _group_keys(slots: np.ndarray, gen: _Generation) -> np.ndarray:
+        """Fusion key per slot: passages share their parent document's key."""
+        group = gen.meta_cols.group
+        inside = slots < len(group)
+        return np.where(inside, group[np.where(inside, slots, 0)], slots)
 
-        rrf = rrf_fuse([bm25_res, faiss_res], k=k)
-        rank_pos = {d: i for i, (d, _) in enumerate(rrf)}
-        final = sorted(merged_sorted, key=lambda x: (rank_pos.get(x[0], 1e6), -x[1]))[:k]
+    def _fuse(
+        self,
+        bm25_res: Tuple[np.ndarray, np.ndarray],
+        faiss_res: Tuple[np.ndarray, np.ndarray],
+        k: int,
+        bm25_weight: float,
+        faiss_weight: float,
+        fusion: str = "weighted_rrf",
+        gen: Optional[_Generation] = None,
+        depth: Optional[int] = None,
+    ) -> List[RetrievalHit]:
+        """
+        Fuse (slots, scores) candidates of both retrievers as integer arrays;
+        doc ids and metadata are only looked up for the k returned hits.
+        Passages are keyed by their parent document (max-passage scoring).
+        `depth` is the k both retrievers were queried with.
+        """
+        gen = gen or self._gen
+        # filters were already applied inside both retrievers
+        fused_keys, best, scores = fuse(
+            [bm25_res[0], faiss_res[0]],
+            [bm25_res[1], faiss_res[1]],
+            [bm25_weight, faiss_weight],
+            k,
+            fusion,
+            keys=[self._group_keys(bm25_res[0], gen), self._group_keys(faiss_res[0], gen)],
+            depth=depth,
+        )
+        return self._hits(fused_keys, best, scores, gen)
 
+    def _hits(self, fused_keys: np.ndarray, best: np.ndarray, scores: np.ndarray,
+              gen: _Generation) -> List[RetrievalHit]:
+        cols = gen.meta_cols
         hits = []
-        for d, s in final:
-            meta = self._docs_meta.get(d, {})
+        for key, slot, s in zip(fused_keys.tolist(), best.tolist(), scores.tolist()):
+            d = self._slot_doc_id(slot, gen)
+            p = cols.key_doc_id(key) or d
+            meta = gen.docs_meta.get(d, {})
+            doc_meta = gen.docs_meta.get(p, {}) if d != p else meta
             hits.append(
                 RetrievalHit(
-                    doc_id=d,
+                    doc_id=p,
                     score=float(s),
-                    title=meta.get("title"),
+                    title=meta.get("title") or doc_meta.get("title"),
                     snippet=meta.get("snippet"),
-                    path=meta.get("path"),
+                    path=meta.get("path") or doc_meta.get("path"),
                     source=meta.get("source", "acord"),
-                    clause_start=None,
-                    clause_end=None,
+                    clause_start=meta.get("clause_start"),
+                    clause_end=meta.get("clause_end"),
                 )
             )
         return hits
 
-    def _passes_filter(self, doc_id: str, filters: Dict[str, str]) -> bool:
-        meta = self._docs_meta.get(doc_id, {})
-        if not meta:
-            return True  # if no metadata, don't exclude
-        # exact-match filters
-        for key in ["type", "BU", "jurisdiction", "counterparty"]:
-            if key in filters and filters[key]:
-                if str(meta.get(key)) != str(filters[key]):
-                    return False
-        # date range
-        if "date_from" in filters or "date_to" in filters:
-            d = meta.get("date")
-            if d:
-                try:
-                    from datetime import datetime
-                    dt = datetime.fromisoformat(d[:10])
-                    if filters.get("date_from"):
-                        if dt < datetime.fromisoformat(filters["date_from"][:10]):
-                            return False
-                    if filters.get("date_to"):
-                        if dt > datetime.fromisoformat(filters["date_to"][:10]):
-                            return False
-                except Exception:
-                    pass
-        return True
+    # ---- version clusters ----
+    def version_clusters(self, doc_ids: Optional[List[str]] = None, threshold: Optional[float] = None,
+                         min_size: int = 2, limit: int = 100) -> Tuple[float, List[VersionCluster]]:
+        """
+        Near-duplicate / version clusters of contracts (passages count as their
+        contract) among `doc_ids`, or across the whole corpus when omitted.
+        """
+        if not self._loaded:
+            self.load()
+        self._check_log()
+        gen = self._gen
+        threshold = settings.VERSION_CLUSTER_THRESHOLD if threshold is None else threshold
+        keys = None
+        if doc_ids is not None:
+            keys = [(gen.docs_meta.get(d) or {}).get("parent") or d for d in doc_ids]
+        clusters = [c for c in gen.minhash.clusters(threshold, keys) if len(c) >= min_size][:limit]
+        return threshold, [VersionCluster(members=[self._cluster_member(d, s, gen) for d, s in c]) for c in clusters]
+
+    def versions_of(self, doc_id: str, threshold: Optional[float] = None) -> Tuple[float, Optional[List[ClusterMember]]]:
+        """Documents near-identical to `doc_id`, most similar first (None when it is not indexed)."""
+        if not self._loaded:
+            self.load()
+        self._check_log()
+        gen = self._gen
+        threshold = settings.VERSION_CLUSTER_THRESHOLD if threshold is None else threshold
+        key = (gen.docs_meta.get(doc_id) or {}).get("parent") or doc_id
+        if key not in gen.minhash:
+            return threshold, None
+        return threshold, [self._cluster_member(d, s, gen) for d, s in gen.minhash.similar(key, threshold)]
+
+    @staticmethod
+    def _cluster_member(doc_id: str, similarity: float, gen: _Generation) -> ClusterMember:
+        meta = gen.docs_meta.get(doc_id, {})
+        return ClusterMember(doc_id=doc_id, similarity=round(similarity, 4), title=meta.get("title"),
+                             source=meta.get("source"))
+
+    def _slot_doc_id(self, slot: int, gen: Optional[_Generation] = None) -> str:
+        gen = gen or self._gen
+        return gen.bm25.doc_id(slot) if gen.bm25.bm25 else gen.faiss.doc_ids[slot]
+
+    def clear_caches(self):
+        self._results.clear()
+        self._candidates.clear()
+        self._query_cache.clear()
 
     def stats(self) -> StatsResponse:
         if not self._loaded:
             self.load()
-        bm25_docs = len(self._bm25.doc_ids)
-        faiss_docs = len(self._faiss.doc_ids)
-        last_build = self.meta.get("last_build")
+        gen = self._gen
+        bm25, faissi = gen.bm25, gen.faiss
         return StatsResponse(
-            bm25_docs=bm25_docs,
-            faiss_docs=faiss_docs,
-            last_build=last_build,
+            bm25_docs=bm25.live_docs,
+            faiss_docs=faissi.ntotal - len(faissi.tombstones),
+            serving_generation=gen.name,
+            generation_loaded_at=gen.loaded_at,
+            loading_generation=self._loading,
+            shards=gen.shards.n if gen.shards is not None else 1,
+            last_build=gen.meta.get("last_build"),
             model_name=settings.MODEL_NAME,
+            pending_docs=bm25.pending_docs,
+            delta_segments=len(bm25.segments),
+            tombstones=len(bm25.tombstones),
+            last_compaction=gen.meta.get("last_compaction"),
+            index_generation=self._generation,
+            caches={
+                "query_embeddings": faissi.query_cache.stats(),
+                "results": self._results.stats(),
+                "search_cursors": self._candidates.stats(),
+                **({"embedding_store": faissi.store.stats()} if faissi.store is not None else {}),
+            },
+            query_batching=self._query_batcher.stats(),
+            # the build's recall / latency against exact float32 search sits next to the memory figures
+            faiss={**faissi.memory_stats(), "build_report": gen.meta.get("faiss_report")},
         )
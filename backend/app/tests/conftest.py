@@ -0,0 +1,21 @@
+import zlib
+import numpy as np
+import pytest
+
+class FakeEncoder:
+    """Sentence-encoder stand-in: a fixed random vector per text (seeded by its crc32)."""
+
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+
+    def encode(self, texts, **_):
+        if not len(texts):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([np.random.default_rng(zlib.crc32(t.encode())).standard_normal(self.dim) for t in texts])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+@pytest.fixture
+def fake_encoder():
+    return FakeEncoder()
@@ -0,0 +1,113 @@
+import numpy as np
+from rank_bm25 import BM25Okapi
+from retrieval.bm25_local import BM25Local
+
+def _zipf_corpus(n_docs: int = 2000, vocab: int = 800, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab + 1)
+    p /= p.sum()
+    docs = []
+    for _ in range(n_docs):
+        toks = rng.choice(vocab, size=int(rng.integers(3, 60)), p=p)
+        docs.append(" ".join(f"w{t}" for t in toks))
+    queries = []
+    for _ in range(40):
+        toks = rng.choice(vocab, size=int(rng.integers(1, 8)), p=p)
+        queries.append(" ".join(f"w{t}" for t in toks))
+    return docs, queries
+
+def test_bm25_scores_match_rank_bm25():
+    docs, queries = _zipf_corpus()
+    bm = BM25Local()
+    bm.build([(f"d{i}", t) for i, t in enumerate(docs)])
+    ref = BM25Okapi([BM25Local._tokenize(t) for t in docs])
+    for q in queries:
+        expected = ref.get_scores(BM25Local._tokenize(q))
+        assert np.allclose(bm.get_scores(q), expected, rtol=1e-5, atol=1e-6)
+
+        # pruned top-k returns the same scores as a full sort
+        top = bm.query(q, k=10)
+        best = np.sort(expected[expected != 0])[::-1][:10]
+        assert np.allclose([s for _, s in top], best, rtol=1e-5, atol=1e-6)
+        for doc_id, s in top:
+            assert np.isclose(expected[int(doc_id[1:])], s, rtol=1e-5, atol=1e-6)
+
+def test_bm25_save_load_roundtrip(tmp_path):
+    docs, queries = _zipf_corpus(n_docs=300)
+    bm = BM25Local()
+    bm.build([(f"d{i}", t) for i, t in enumerate(docs)])
+    bm.save(str(tmp_path / "bm25"))
+    other = BM25Local()
+    other.load(str(tmp_path / "bm25"))
+    assert isinstance(other.postings, np.memmap)
+    assert len(other.doc_ids) == len(docs) and other.doc_ids[7] == "d7"
+    for q in queries[:10]:
+        assert other.query(q, k=5) == bm.query(q, k=5)
+    assert other.query("term-not-in-vocab", k=5) == []
+
+def test_bm25_query_many_matches_single_queries():
+    docs, queries = _zipf_corpus(n_docs=500)
+    bm = BM25Local()
+    bm.build([(f"d{i}", t) for i, t in enumerate(docs)])
+    batched = bm.query_many(queries, k=10)
+    assert batched == [bm.query(q, k=10) for q in queries]
+
+def test_bm25_allow_mask_returns_exact_filtered_top_k():
+    docs, queries = _zipf_corpus(n_docs=1500)
+    bm = BM25Local()
+    bm.build([(f"d{i}", t) for i, t in enumerate(docs)])
+    allow = np.random.default_rng(1).random(len(docs)) < 0.03
+    for q, hits in zip(queries, bm.query_many(queries, k=10, allow=allow)):
+        scores = bm.get_scores(q)
+        scores[~allow] = 0.0
+        best = np.sort(scores[scores != 0])[::-1][:10]
+        assert all(allow[int(d[1:])] for d, _ in hits)
+        assert np.allclose([s for _, s in hits], best, rtol=1e-5, atol=1e-6)
+
+def test_bm25_incremental_updates_match_rebuild(tmp_path):
+    docs, queries = _zipf_corpus(n_docs=600)
+    items = [(f"d{i}", t) for i, t in enumerate(docs)]
+    bm = BM25Local()
+    bm.build(items[:400])
+    bm.save(str(tmp_path / "bm25"))
+    bm = BM25Local()
+    bm.load(str(tmp_path / "bm25"))
+
+    bm.add(items[400:500])
+    bm.add(items[500:])
+    bm.delete(["d3", "d450"])
+    bm.add([("d10", "w1 w2 w3 freshly rewritten")])  # upsert
+    hits = {d for d, _ in bm.query("freshly rewritten", k=5)}
+    assert hits == {"d10"}
+    for q in queries[:10]:
+        assert not {"d3", "d450"} & {d for d, _ in bm.query(q, k=50)}
+
+    compacted = bm.compacted()
+    compacted.save(str(tmp_path / "bm25"))
+    reloaded = BM25Local()
+    reloaded.load(str(tmp_path / "bm25"))
+
+    live = [(d, t) for d, t in items if d not in ("d3", "d450", "d10")] + [("d10", "w1 w2 w3 freshly rewritten")]
+    fresh = BM25Local()
+    fresh.build(live)
+    for q in queries:
+        got, want = reloaded.query(q, k=10), fresh.query(q, k=10)
+        assert np.allclose([s for _, s in got], [s for _, s in want], rtol=1e-5, atol=1e-6)
+    assert reloaded.live_docs == len(live)
+
+def test_bm25_builds_from_streamed_corpus(tmp_path):
+    import json
+    from retrieval.beir_acord_loader import iter_corpus
+
+    docs, queries = _zipf_corpus(n_docs=300)
+    with (tmp_path / "corpus.jsonl").open("w") as fh:
+        for i, t in enumerate(docs):
+            fh.write(json.dumps({"_id": f"d{i}", "text": t}) + "\n")
+        fh.write(json.dumps({"_id": "d0", "text": "duplicate"}) + "\n")
+    streamed = BM25Local()
+    streamed.build(iter_corpus(tmp_path))
+    ref = BM25Local()
+    ref.build([(f"d{i}", t) for i, t in enumerate(docs)])
+    assert streamed.doc_ids == ref.doc_ids
+    for q in queries:
+        assert streamed.query(q, k=10) == ref.query(q, k=10)
@@ -0,0 +1,39 @@
+import json
+from retrieval.delta_log import ARCHIVE, LOG, archive, iter_ops, position, rebase, spool, spooled_docs, spooled_ids
+
+def _append(root, op):
+    with open(root / LOG, "a") as fh:
+        fh.write(json.dumps(op) + "\n")
+
+def _doc(d, text="t", **meta):
+    return {"doc_id": d, "text": text, **({"meta": meta} if meta else {})}
+
+def test_spool_keeps_the_net_effect(tmp_path):
+    _append(tmp_path, {"op": "upsert", "docs": [_doc("a", "old"), _doc("b"), _doc("c#p0", parent="c")]})
+    archive(tmp_path)
+    _append(tmp_path, {"op": "upsert", "docs": [_doc("a", "new")]})
+    _append(tmp_path, {"op": "delete", "doc_ids": ["b", "c", "x"]})
+    _append(tmp_path, {"op": "upsert", "docs": [_doc("x")]})
+    spool(tmp_path, position(tmp_path), tmp_path / "spool.jsonl")
+    assert {doc["doc_id"]: doc["text"] for doc in spooled_docs(tmp_path / "spool.jsonl")} == {"a": "new", "x": "t"}
+    assert spooled_ids(tmp_path / "spool.jsonl") == ({"a", "x"}, {"b", "c", "c#p0"})
+
+def test_rebase_keeps_updates_made_during_a_build(tmp_path):
+    _append(tmp_path, {"op": "upsert", "docs": [_doc("a")]})
+    archive(tmp_path)  # compaction
+    _append(tmp_path, {"op": "delete", "doc_ids": ["z"]})
+    end = position(tmp_path)
+    # while the build runs: another update, and a compaction that archives it
+    _append(tmp_path, {"op": "upsert", "docs": [_doc("b")]})
+    archive(tmp_path)
+    _append(tmp_path, {"op": "upsert", "docs": [_doc("c")]})
+    spool(tmp_path, end, tmp_path / "spool.jsonl")
+    assert spooled_ids(tmp_path / "spool.jsonl") == ({"a"}, {"z"})
+
+    published = []
+    rebase(tmp_path, end, tmp_path / "spool.jsonl", lambda: published.append(True))
+    assert published and not (tmp_path / "spool.jsonl").exists()
+    # the archive holds what the build contains; the log whatever came after the snapshot
+    assert spooled_ids(tmp_path / ARCHIVE) == ({"a"}, {"z"})
+    with open(tmp_path / LOG, "rb") as fh:
+        assert [d["doc_id"] for op in iter_ops(fh) for d in op["docs"]] == ["b", "c"]
@@ -0,0 +1,63 @@
+import json
+import numpy as np
+from retrieval import doc_store
+from retrieval.doc_store import DocStore
+from retrieval.meta_columns import MetaColumns
+
+def _meta():
+    meta = {f"d{i}": {"title": f"Doc {i}", "jurisdiction": "NY" if i % 2 else "DE"} for i in range(20)}
+    meta["c1"] = {"title": "Contract"}
+    meta.update({f"c1#{j}": {"parent": "c1", "date": "2020-01-0%d" % (j + 1)} for j in range(3)})
+    return meta
+
+def test_doc_store_lookups_updates_and_columns(tmp_path):
+    meta = _meta()
+    DocStore.write(str(tmp_path / "docs"), reversed(list(meta.items())))
+    store = DocStore.load(str(tmp_path / "docs"))
+    assert len(store) == len(meta) and store.get("d7") == meta["d7"] and store.get("nope", {}) == {}
+    assert sorted(store.children("c1")) == ["c1#0", "c1#1", "c1#2"] and store.children("c") == []
+    assert [d for d, _ in store.items()] == sorted(meta)
+
+    # updates go to an overlay; the original store is unchanged for its readers
+    updated = store.with_updates({"c1#9": {"parent": "c1"}, "a0": {"title": "new"}, "d3": {"title": "edited"}})
+    updated = updated.without(["c1#0", "d4"])
+    assert store.get("d3") == meta["d3"] and "d4" in store
+    assert updated.get("d3") == {"title": "edited"} and "d4" not in updated and "a0" in updated
+    assert sorted(updated.children("c1")) == ["c1#1", "c1#2", "c1#9"] and len(updated) == len(meta)
+    updated.save(str(tmp_path / "saved"))
+    saved = DocStore.load(str(tmp_path / "saved"))
+    assert list(saved.items()) == list(updated.items()) and sorted(saved.children("c1")) == ["c1#1", "c1#2", "c1#9"]
+
+    # generations written before the store: docs_meta.json is still read
+    (tmp_path / "legacy").mkdir()
+    (tmp_path / "legacy" / "docs_meta.json").write_text(json.dumps(meta))
+    assert DocStore.open(tmp_path / "legacy").get("c1#1") == meta["c1#1"] and len(DocStore.open(tmp_path / "cols")) == 0
+
+    # columns compiled at build time load memory-mapped and filter the same
+    slots = [f"d{i}" for i in range(20)] + ["c1#0", "c1#1", "c1#2"]
+    cols = MetaColumns.build(slots, store)
+    cols.save(str(tmp_path / "cols"))
+    loaded = MetaColumns.load(str(tmp_path / "cols"))
+    for filters in ({"jurisdiction": "NY"}, {"date_from": "2020-01-02"}):
+        assert np.array_equal(loaded.mask(filters), cols.mask(filters))
+    assert loaded.key_doc_id(int(loaded.group[-1])) == "c1"
+    grown = loaded.extended(["c2#0", "c1#5"], {"c2#0": {"parent": "c2"}, "c1#5": {"parent": "c1"}})
+    assert [grown.key_doc_id(int(g)) for g in grown.group[-2:]] == ["c2", "c1"]
+    # re-laid out slots keep their metadata and fusion keys
+    perm = np.asarray([22, 0, 1, 21])
+    moved = loaded.take(perm)
+    assert np.array_equal(moved.mask({"jurisdiction": "NY"}), cols.mask({"jurisdiction": "NY"})[perm])
+    assert moved.group[1:3].tolist() == [1, 2] and moved.group[0] == moved.group[3] < 0
+
+def test_unsorted_writes_merge_sorted_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_store, "SORT_RUN_SIZE", 4)
+    meta = _meta()
+    items = list(reversed(list(meta.items())))
+    # duplicates across runs: the last one written wins
+    items = [("d3", {"title": "first"})] + items + [("c1#1", {"parent": "c1", "title": "last"})]
+    DocStore.write(str(tmp_path / "docs"), items)
+    store = DocStore.load(str(tmp_path / "docs"))
+    want = {**meta, "c1#1": {"parent": "c1", "title": "last"}}
+    assert list(store.items()) == sorted(want.items())
+    assert sorted(store.children("c1")) == ["c1#0", "c1#1", "c1#2"]
+    assert not (tmp_path / "docs" / "runs").exists()
@@ -0,0 +1,50 @@
+import numpy as np
+from retrieval.embedding_store import EmbeddingStore, text_key
+
+def _fake_encoder(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        rng = np.random.default_rng(0)
+        return np.stack([rng.standard_normal(8).astype(np.float32) + len(t) for t in texts])
+    return encode
+
+def test_embedding_store_only_encodes_unseen_texts(tmp_path):
+    calls = []
+    store = EmbeddingStore(tmp_path, "demo/model", dtype="float32")
+    first = store.encode(["a", "bb", "a"], _fake_encoder(calls))
+    assert calls == [["a", "bb"]]
+    np.testing.assert_array_equal(first[0], first[2])
+
+    # a second process sees the shard written by the first
+    other = EmbeddingStore(tmp_path, "demo/model", dtype="float32")
+    again = other.encode(["bb", "ccc", "a"], _fake_encoder(calls))
+    assert calls[-1] == ["ccc"]
+    np.testing.assert_array_equal(again[0], first[1])
+    np.testing.assert_array_equal(again[2], first[0])
+    assert other.stats()["hits"] == 2 and len(other) == 3
+
+    other.consolidate(max_shards=1)
+    store.encode(["a", "bb", "ccc"], _fake_encoder(calls))
+    assert calls[-1] == ["ccc"] and len(calls) == 2
+
+def test_runtime_puts_go_to_the_delta_index(tmp_path):
+    calls = []
+    store = EmbeddingStore(tmp_path, "demo/model", dtype="float32")
+    base = store.encode(["a", "bb"], _fake_encoder(calls))
+    main = sorted(p.name for p in store.dir.glob("index_*"))
+    mtimes = [(store.dir / n).stat().st_mtime_ns for n in main]
+    store.encode(["ccc"], _fake_encoder(calls))
+    store.encode(["dddd", "a"], _fake_encoder(calls))
+    # the main index is left as it was; new keys are found through the delta
+    assert sorted(p.name for p in store.dir.glob("index_*")) == main
+    assert [(store.dir / n).stat().st_mtime_ns for n in main] == mtimes
+    other = EmbeddingStore(tmp_path, "demo/model", dtype="float32")
+    assert len(other) == 4 and len(other._delta_keys) == 2
+    found, vecs = other.get_many([text_key("bb"), text_key("dddd")])
+    assert found.all()
+    np.testing.assert_array_equal(vecs[0], base[1])
+
+    other.consolidate()
+    assert len(other._delta_keys) == 0 and len(other) == 4 and len(list(store.dir.glob("delta_*_keys.npy"))) == 1
+    store.encode(["a", "bb", "ccc", "dddd"], _fake_encoder(calls))
+    assert calls[-1] == ["dddd"] and len(calls) == 3
@@ -0,0 +1,29 @@
+import numpy as np
+from retrieval.beir_acord_loader import load_qrels, mrr_at_k, ndcg_at_k
+from retrieval.evaluation import evaluate_rankings
+
+def test_vectorized_metrics_match_reference_loops():
+    rng = np.random.default_rng(0)
+    qrels = {f"q{i}": {f"d{j}": int(rng.integers(0, 3)) for j in rng.choice(200, size=5, replace=False)}
+             for i in range(300)}
+    rankings = {f"q{i}": [(f"d{j}", 1.0) for j in rng.choice(200, size=int(rng.integers(0, 15)), replace=False)]
+                for i in range(320)}  # some queries have no judgements
+    m = evaluate_rankings(rankings, qrels, k=10)
+    ranked = {q: [d for d, _ in r] for q, r in rankings.items()}
+    assert np.isclose(m["MRR@10"], np.mean([mrr_at_k(ranked[q], qrels.get(q, {}), 10) for q in ranked]))
+    assert np.isclose(m["nDCG@10"], np.mean([ndcg_at_k(ranked[q], qrels.get(q, {}), 10) for q in ranked]))
+    recall = [
+        len([d for d in ranked[q][:10] if qrels.get(q, {}).get(d, 0) > 0])
+        / max(1, sum(r > 0 for r in qrels.get(q, {}).values()))
+        for q in ranked
+    ]
+    assert np.isclose(m["Recall@10"], np.mean(recall))
+
+def test_qrels_formats(tmp_path):
+    (tmp_path / "qrels").mkdir()
+    (tmp_path / "qrels" / "a.tsv").write_text("query-id\tcorpus-id\tscore\nq1\td1\t1\nq1\td2\t2.0\n")
+    (tmp_path / "qrels" / "b.tsv").write_text("q2\td3\t1\nq2\td4\tx\n")
+    (tmp_path / "qrels" / "c.tsv").write_text("q3\tQ0\td5\t2\nq1\tQ0\td1\t0\n")
+    assert load_qrels(tmp_path) == {
+        "q1": {"d1": 0, "d2": 2}, "q2": {"d3": 1, "d4": 1}, "q3": {"d5": 2},
+    }
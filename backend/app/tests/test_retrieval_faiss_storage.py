@@ -0,0 +1,49 @@
+import numpy as np
+from retrieval.embed_faiss import EmbedFAISS, IndexConfig, VectorSample
+
+def test_compressed_storage_is_memory_mapped(tmp_path, fake_encoder):
+    def _faiss(**cfg):
+        return EmbedFAISS("test", IndexConfig(**cfg), model_loader=lambda: fake_encoder)
+
+    items = [(f"doc{i}", f"text {i}") for i in range(600)]
+    exact = _faiss()
+    exact.build(items)
+    qv = exact.encode_queries([f"text {i}" for i in range(0, 600, 60)])
+    want = [slots[0] for slots, _ in exact.search_slots(qv, k=5)]
+
+    for index_type, storage, saving in [("flat", "fp16", 0.5), ("flat", "sq8", 0.75), ("hnsw", "sq8", 0.75)]:
+        built = _faiss(index_type=index_type, storage=storage)
+        built.build(items)
+        built.save(str(tmp_path / storage / index_type))
+        f = _faiss(mmap=True)
+        f.load(str(tmp_path / storage / index_type))
+        mem = f.memory_stats()
+        assert f.mapped and f.config.storage == storage and mem["heap_bytes"] == 0
+        assert np.isclose(mem["memory_saving"], saving) and mem["vectors"] == 600
+        # compressed vectors still find every query's own document first, with and without filters
+        assert [slots[0] for slots, _ in f.search_slots(qv, k=5)] == want
+        allow = np.zeros(600, dtype=bool)
+        allow[::60] = True
+        assert [slots[0] for slots, _ in f.search_slots(qv, k=5, allow=allow)] == want
+
+        # updates go to the in-memory delta; compaction copies the mapped vectors out first
+        f.add([("new", "text new")], [600])
+        f.delete([0])
+        c = f.compacted()
+        assert not c.mapped and c.ntotal == (601 if index_type == "hnsw" else 600)
+        assert c.memory_stats()["heap_bytes"] > 0 and c.delta is None
+        # the serving instance is left as it was
+        assert f.mapped and f.delta is not None and f.tombstones == {0}
+
+def test_build_samples_a_bounded_set_of_corpus_vectors(fake_encoder):
+    items = [(f"doc{i}", f"text {i}") for i in range(1000)]
+    sample = VectorSample(100)
+    f = EmbedFAISS("test", IndexConfig(), model_loader=lambda: fake_encoder)
+    assert f.build(items, chunk_size=64, sample=sample) is None
+    assert sample.seen == 1000 and sample.vectors.shape == (100, fake_encoder.dim)
+    # every sampled row is a distinct corpus vector, drawn from across the whole stream
+    _, slots = f.index.search(sample.vectors, 1)
+    assert len(set(slots[:, 0])) == 100 and slots.max() >= 500
+    small = VectorSample(100)
+    small.add(f.encode_corpus(["a", "b"]))
+    assert small.vectors.shape == (2, fake_encoder.dim)
@@ -0,0 +1,65 @@
+import numpy as np
+from retrieval.fusion import fuse, fuse_all, fused_page
+from retrieval.rrf import rrf_fuse, rrf_fuse_arrays
+
+def test_rrf_fuse_arrays_matches_rrf_fuse():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        lists = [rng.choice(100, size=int(rng.integers(0, 40)), replace=False) for _ in range(2)]
+        expected = rrf_fuse([[(f"d{i}", 0.0) for i in r] for r in lists], k=10)
+        ids, scores = rrf_fuse_arrays(lists, k=10)
+        assert [f"d{i}" for i in ids.tolist()] == [d for d, _ in expected]
+        assert np.allclose(scores, [s for _, s in expected])
+
+def test_rrf_fuse_arrays_scores_repeats_like_rrf_fuse():
+    # id 5 is repeated: both score it once, at its last position (3), not its first
+    ids, scores = rrf_fuse_arrays([np.array([5, 7, 5]), np.array([7])], k=10)
+    assert ids.tolist() == [7, 5] and np.allclose(scores, [1 / 62 + 1 / 61, 1 / 63])
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        lists = [rng.integers(0, 20, size=int(rng.integers(0, 30))) for _ in range(2)]
+        expected = rrf_fuse([[(f"d{i}", 0.0) for i in r] for r in lists], k=10)
+        ids, scores = rrf_fuse_arrays(lists, k=10)
+        assert [f"d{i}" for i in ids.tolist()] == [d for d, _ in expected]
+        assert np.allclose(scores, [s for _, s in expected])
+
+def test_fuse_collapses_passages_to_best_member():
+    # slots 1 and 2 are passages of the same document (key -1)
+    group = np.array([0, -1, -1, 3])
+    bm25 = (np.array([2, 0, 1]), np.array([3.0, 2.0, 1.0]))
+    faiss = (np.array([1, 3]), np.array([0.9, 0.1]))
+    for strategy in ("weighted_rrf", "weighted", "rrf"):
+        keys, best, _ = fuse([bm25[0], faiss[0]], [bm25[1], faiss[1]], [0.6, 0.4], 3, strategy,
+                             keys=[group[bm25[0]], group[faiss[0]]])
+        assert keys.tolist()[0] == -1 and len(set(keys.tolist())) == len(keys)
+        assert best.tolist()[0] == 2  # 0.6 * 1.0 from bm25 beats slot 1's 0.6 * 0.0 + 0.4 * 1.0
+
+def test_fused_pages_continue_fuse():
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        lists = [rng.choice(200, size=int(rng.integers(1, 80)), replace=False) for _ in range(2)]
+        scores = [np.sort(rng.random(len(r)))[::-1] for r in lists]
+        group = rng.integers(0, 60, size=200)
+        keys = [group[r] for r in lists]
+        for strategy in ("weighted_rrf", "weighted", "rrf"):
+            fused = fuse_all(lists, scores, [0.6, 0.4], strategy, keys=keys)
+            # the first page is fuse()'s top k, and pages partition the candidates
+            first = fused_page(fused, 0, 10)
+            expected = fuse(lists, scores, [0.6, 0.4], 10, strategy, keys=keys)
+            assert all(np.array_equal(a, b) for a, b in zip(first, expected))
+            pages = [fused_page(fused, o, 10)[0] for o in range(0, len(fused[0]), 10)]
+            assert sorted(np.concatenate(pages).tolist()) == sorted(set(np.concatenate(keys).tolist()))
+
+def test_single_bm25_match_survives_minmax():
+    # BM25 only returns matching documents: a lone match must not normalize to 0
+    bm25 = (np.array([7]), np.array([2.3]))
+    faiss = (np.array([1, 2, 3, 4]), np.array([0.52, 0.51, 0.50, 0.49]))
+    for strategy in ("weighted_rrf", "weighted", "rrf"):
+        keys, _, scores = fuse([bm25[0], faiss[0]], [bm25[1], faiss[1]], [0.5, 0.5], 3, strategy, depth=50)
+        assert 7 in keys.tolist()
+    keys, _, scores = fuse([bm25[0], faiss[0]], [bm25[1], faiss[1]], [0.5, 0.5], 3, "weighted", depth=50)
+    assert keys.tolist()[0] == 7 and scores[0] == 0.5
+    # a full-depth list still spans [0, 1]
+    keys, _, scores = fuse([np.array([7, 8]), faiss[0]], [np.array([2.3, 1.0]), faiss[1]], [0.5, 0.5], 6,
+                           "weighted", depth=2)
+    assert scores[keys.tolist().index(8)] == 0.0
@@ -0,0 +1,19 @@
+from retrieval.generations import LEGACY, change_token, current, new_generation, publish
+
+def test_generations_publish_atomically_and_prune(tmp_path):
+    assert current(tmp_path) == (LEGACY, tmp_path)
+    assert change_token(tmp_path) is None
+    (tmp_path / "meta.json").write_text("{}")
+    legacy_token = change_token(tmp_path)
+
+    names = []
+    for _ in range(3):
+        name, path = new_generation(tmp_path)
+        (path / "meta.json").write_text("{}")
+        # unpublished generations are invisible to readers
+        assert current(tmp_path)[0] != name
+        publish(tmp_path, name, keep=2)
+        names.append(name)
+        assert current(tmp_path) == (name, path)
+    assert change_token(tmp_path) != legacy_token
+    assert sorted(p.name for p in (tmp_path / "generations").iterdir()) == names[1:]
@@ -0,0 +1,27 @@
+import asyncio
+import pytest
+from retrieval.micro_batch import MicroBatcher
+
+def test_micro_batcher_coalesces_concurrent_calls():
+    sizes = []
+
+    def double(items):
+        sizes.append(len(items))
+        if "boom" in items:
+            raise ValueError("boom")
+        return [2 * x for x in items]
+
+    batcher = MicroBatcher(double, max_batch=8, window_ms=5.0)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(20)))
+
+    assert asyncio.run(main()) == [2 * i for i in range(20)]
+    assert sizes == [8, 8, 4]
+    assert batcher.stats()["histogram"] == {"le_4": 1, "le_8": 2}
+
+    # an isolated call goes out on its own, a failing batch fails its callers
+    assert asyncio.run(batcher.submit(5)) == 10
+    with pytest.raises(ValueError):
+        asyncio.run(batcher.submit("boom"))
+    assert sizes[-2:] == [1, 1]
@@ -0,0 +1,43 @@
+import numpy as np
+from retrieval.minhash import MinHashIndex
+
+def _texts():
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(500)]
+    return [" ".join(rng.choice(words, size=120)) for _ in range(40)]
+
+def _version(text: str, edits: int) -> str:
+    toks = text.split()
+    for j in range(0, edits * 12, 12):
+        toks[j] = "amended"
+    return " ".join(toks)
+
+def test_minhash_version_clusters(tmp_path):
+    texts = _texts()
+    items = [(f"doc{i}", t) for i, t in enumerate(texts)]
+    items += [("doc3_v2", _version(texts[3], 3)), ("doc3_v3", _version(texts[3], 5)), ("doc8_v2", _version(texts[8], 2))]
+    # passages fold into their contract: the same text split in two clauses is a version of doc12
+    items += [("contract#c1", texts[12][:300]), ("contract#c2", texts[12][300:])]
+    mh = MinHashIndex(num_perm=128, bands=32, shingle=3)
+    mh.build(items, key=lambda d: d.split("#")[0])
+    assert len(mh) == 44 and "contract" in mh and "contract#c1" not in mh
+
+    clusters = [sorted(d for d, _ in c) for c in mh.clusters(0.7) if len(c) > 1]
+    assert sorted(clusters) == [["contract", "doc12"], ["doc3", "doc3_v2", "doc3_v3"], ["doc8", "doc8_v2"]]
+    assert [d for d, _ in mh.similar("doc3", 0.7)] == ["doc3_v2", "doc3_v3"]
+    # restricted to a page of hits; unknown ids stay singletons
+    page = mh.clusters(0.7, ["doc8_v2", "doc1", "doc8", "missing"])
+    assert sorted(d for d, _ in page[0]) == ["doc8", "doc8_v2"] and [len(c) for c in page] == [2, 1, 1]
+
+    # updates: a rewritten version leaves its cluster, a deleted one disappears, new versions join
+    mh.add([("doc3_v3", texts[20]), ("doc30_v2", _version(texts[30], 2))])
+    mh.delete(["doc8_v2"])
+    assert [d for d, _ in mh.similar("doc20", 0.7)] == ["doc3_v3"]
+    assert [d for d, _ in mh.similar("doc30", 0.7)] == ["doc30_v2"]
+    assert mh.similar("doc8", 0.7) == []
+
+    mh.save(str(tmp_path / "minhash"))
+    loaded = MinHashIndex.load(str(tmp_path / "minhash"))
+    assert len(loaded) == len(mh) == 44
+    assert sorted(sorted(d for d, _ in c) for c in loaded.clusters(0.7) if len(c) > 1) == \
+        sorted(sorted(d for d, _ in c) for c in mh.clusters(0.7) if len(c) > 1)
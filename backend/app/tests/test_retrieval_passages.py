@@ -0,0 +1,16 @@
+from retrieval.contract_passages import clause_spans, contract_passages
+
+def test_clause_spans_split_at_headings():
+    text = "MASTER AGREEMENT\nThe parties agree.\nGoverning Law\nDelaware.\n"
+    assert clause_spans(text) == [("C1", "MASTER AGREEMENT", 0, 36), ("C2", "Governing Law", 36, len(text))]
+    assert clause_spans("the parties agree.\nno headings here.") == [("C1", "the parties agree.", 0, 36)]
+
+def test_contract_passages_carry_clause_offsets():
+    text = "MASTER AGREEMENT\nThe parties agree.\nINDEMNIFICATION\n" + "Supplier shall indemnify Buyer. " * 100 + "\nGOVERNING LAW\nDelaware.\n"
+    passages = list(contract_passages("doc", text, max_chars=500))
+    assert all(hi - lo <= 500 for _, lo, hi, _ in passages)
+    # the windows of a long clause tile it without gaps
+    spans = [(lo, hi) for pid, lo, hi, _ in passages if pid.startswith("doc#C2.")]
+    assert len(spans) > 1 and all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+    gov = [(lo, hi) for _, lo, hi, heading in passages if heading == "GOVERNING LAW"]
+    assert text[gov[0][0]: gov[0][1]].startswith("GOVERNING LAW\nDelaware.")
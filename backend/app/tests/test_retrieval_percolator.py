@@ -0,0 +1,36 @@
+import numpy as np
+from retrieval.bm25_local import BM25Local
+from retrieval.embed_faiss import EmbedFAISS
+from retrieval.meta_columns import MetaColumns
+from retrieval.percolator import Percolator
+
+def test_percolator_matches_new_docs_that_enter_the_top_k():
+    corpus = [(f"d{i}", f"clause {i} governing law of the state") for i in range(20)]
+    corpus += [("d20", "escrow agent holds the escrow funds"), ("d21", "escrow release conditions")]
+    bm = BM25Local()
+    bm.build(corpus)
+    docs_meta = {"d0": {"jurisdiction": "NY"}}
+    saved = {
+        "escrow": {"query": "escrow funds", "k": 2, "bm25_weight": 1.0, "faiss_weight": 0.0},
+        "escrow_de": {"query": "escrow funds", "k": 2, "bm25_weight": 1.0, "faiss_weight": 0.0,
+                      "filters": {"jurisdiction": "DE"}},
+        "empty": {"query": "  ", "k": 2},
+    }
+    perc = Percolator.build(saved, bm, EmbedFAISS("unused"), MetaColumns.build(bm.doc_ids, docs_meta))
+    assert perc.names == ["escrow", "escrow_de"]
+
+    items = [("n0", "escrow funds escrow funds held"), ("n1", "governing law"), ("n2", "escrow funds")]
+    docs_meta.update({"n0": {"jurisdiction": "NY"}, "n1": {}, "n2": {"jurisdiction": "DE"}})
+    new, _ = bm.add(items)
+    cols = MetaColumns.build(bm.doc_ids, {}).extended([d for d, _ in items], docs_meta)
+    matches = perc.match(items, new, None, bm, cols)
+    assert {(name, items[j][0]) for name, j, _, _ in matches} == {("escrow", "n0"), ("escrow", "n2"), ("escrow_de", "n2")}
+
+    # scores are the ones a live search returns for the new slot
+    live = dict(zip(*(a.tolist() for a in bm.query_slots(["escrow funds"], k=5)[0])))
+    for name, j, b, _ in matches:
+        assert np.isclose(b, live[new[j]], rtol=1e-5)
+
+    # the bar rose: a weaker copy no longer enters the top-2
+    more = [("n3", "escrow funds")]
+    assert perc.match(more, bm.add(more)[0], None, bm, cols.extended(["n3"], {})) == []
@@ -0,0 +1,21 @@
+import json
+from retrieval.saved_store import SavedStore
+
+def test_saved_store_migrates_json_and_sees_other_writers(tmp_path):
+    legacy = tmp_path / "saved_store.json"
+    legacy.write_text(json.dumps({"saved_queries": {"q1": {"query": "indemnity"}}, "watchlists": {"w": ["a", "b"]}}))
+    db = tmp_path / "saved_store.sqlite3"
+    store = SavedStore(db, legacy_json=legacy)
+    assert store.saved_queries() == {"q1": {"query": "indemnity"}}
+    assert store.get_watchlist("w") == ["a", "b"]
+    assert not legacy.exists() and (tmp_path / "saved_store.json.migrated").exists()
+
+    # a second worker writes; the first one's cached listing is invalidated
+    other = SavedStore(db, legacy_json=legacy)
+    other.save_query("q2", {"query": "termination"})
+    other.save_watchlist("w", ["b", "c", "b"])
+    assert set(store.saved_queries()) == {"q1", "q2"}
+    assert store.watchlists()["w"] == ["b", "c"]
+
+    assert store.delete_query("q1") and not store.delete_query("q1")
+    assert other.get_query("q1") is None and list(other.saved_queries()) == ["q2"]
@@ -0,0 +1,228 @@
+import json
+import numpy as np
+import pytest
+from retrieval import embed_faiss
+from backend.app.core.config import settings
+from backend.app.services import retrieval_service
+from backend.app.services.retrieval_service import RetrievalService
+from retrieval.bm25_local import BM25Local
+from retrieval.doc_store import DocStore
+from retrieval.embed_faiss import EmbedFAISS, IndexConfig
+from retrieval.generations import current as current_generation, new_generation, publish
+from retrieval.meta_columns import MetaColumns
+from scripts import build_indices
+
+WORDS = ["governing", "law", "termination", "notice", "indemnity", "liability", "payment", "confidential",
+         "assignment", "warranty", "insurance", "audit"]
+# (doc_id, text, meta): ACORD-style clauses, and a CUAD contract indexed as two clause passages
+CORPUS = [(f"a{i}", " ".join(WORDS[(i + j) % len(WORDS)] for j in range(i % 4 + 3)), {"title": f"Clause {i}"})
+          for i in range(30)] + [
+    ("cuad/c1#p0", "arbitration seated in geneva", {"parent": "cuad/c1", "source": "cuad"}),
+    ("cuad/c1#p1", "termination upon insolvency", {"parent": "cuad/c1", "source": "cuad"}),
+]
+
+def _publish(root, corpus, encoder):
+    """A generation over `corpus`, laid out the way scripts.build_indices writes one."""
+    name, path = new_generation(root)
+    items = [(d, t) for d, t, _ in corpus]
+    bm25 = BM25Local()
+    bm25.build(items)
+    bm25.save(str(path / "bm25"))
+    faissi = EmbedFAISS("fake", IndexConfig(), model_loader=lambda: encoder)
+    faissi.build(items)
+    faissi.save(str(path / "faiss"))
+    metas = [(d, m) for d, _, m in corpus] + [("cuad/c1", {"title": "Contract 1", "source": "cuad"})]
+    DocStore.write(str(path / "docs"), metas)
+    MetaColumns.build(bm25.doc_ids, DocStore.load(str(path / "docs"))).save(str(path / "meta_cols"))
+    (path / "meta.json").write_text(json.dumps({"docs": len(items), "passages": 2}))
+    publish(root, name)
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch, fake_encoder):
+    """Factory of RetrievalService workers over one tmp index directory (each call is another worker)."""
+    monkeypatch.setattr(settings, "INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "MODEL_NAME", f"fake-{tmp_path.name}")  # a fresh model registry entry
+    monkeypatch.setattr(settings, "INDEX_WATCH_INTERVAL_S", 0)
+    monkeypatch.setattr(settings, "EMBED_STORE_ENABLED", False)
+    monkeypatch.setattr(settings, "RETRIEVAL_COMPACT_INTERVAL_S", 3600.0)
+    monkeypatch.setattr(retrieval_service, "load_encoder", lambda *_: fake_encoder)
+    _publish(tmp_path, CORPUS, fake_encoder)
+
+    def make() -> RetrievalService:
+        svc = RetrievalService()
+        svc.load()
+        return svc
+
+    return make
+
+def _ids(hits):
+    return [h.doc_id for h in hits]
+
+def test_failed_encode_leaves_indices_and_log_untouched(worker, fake_encoder, monkeypatch):
+    svc = worker()
+    encode = fake_encoder.encode
+
+    def failing(texts, **kw):
+        if any("boom" in t for t in texts):
+            raise RuntimeError("encoder failed")
+        return encode(texts, **kw)
+
+    monkeypatch.setattr(fake_encoder, "encode", failing)
+    with pytest.raises(RuntimeError):
+        svc.upsert_documents([{"doc_id": "bad", "text": "zebra boom"}])
+    assert not svc.delta_log_path.exists() or svc.delta_log_path.read_text() == ""
+    assert svc._bm25.pending_docs == 0 and svc._faiss.pending == 0 and svc._docs_meta.get("bad") is None
+
+    # the indices stay in step: later upserts succeed and other workers see only them
+    svc.upsert_documents([{"doc_id": "new1", "text": "zebra crossing"}])
+    assert _ids(svc.search("zebra", 5, 0.5, 0.5))[0] == "new1"
+    assert "bad" not in _ids(worker().search("zebra", 5, 1.0, 0.0))
+
+def test_failed_apply_rolls_back_the_log_entry(worker, monkeypatch):
+    svc = worker()
+    svc.upsert_documents([{"doc_id": "new1", "text": "zebra crossing"}])
+    size = svc.delta_log_path.stat().st_size
+
+    def broken(*_):
+        raise ValueError("FAISS slots out of sync")
+
+    monkeypatch.setattr(svc._faiss, "add_vectors", broken)
+    with pytest.raises(ValueError):
+        svc.upsert_documents([{"doc_id": "new2", "text": "zebra stripes"}])
+    # the entry is cut off and the half-applied upsert discarded; earlier entries are kept
+    assert svc.delta_log_path.stat().st_size == size
+    assert svc._docs_meta.get("new2") is None and svc._bm25.pending_docs == 1
+    assert _ids(svc.search("zebra", 5, 1.0, 0.0)) == ["new1"]
+
+def test_single_match_upsert_is_found_by_hybrid_search(worker):
+    svc = worker()
+    svc.upsert_documents([{"doc_id": "new1", "text": "zebra crossing", "title": "Zebra"}])
+    for fusion in ("weighted_rrf", "weighted", "rrf"):
+        hits = svc.search("zebra", 3, 0.5, 0.5, fusion=fusion)
+        assert hits[0].doc_id == "new1" and hits[0].title == "Zebra"
+    assert svc.delete_documents(["new1"]) == 1
+    assert "new1" not in _ids(svc.search("zebra", 3, 0.5, 0.5))
+
+def test_workers_replay_each_others_updates(worker):
+    a, b = worker(), worker()
+    a.upsert_documents([{"doc_id": "new1", "text": "zebra crossing"}])
+    assert _ids(b.search("zebra", 3, 1.0, 0.0)) == ["new1"]
+    b.delete_documents(["new1", "a3"])
+    assert a.search("zebra", 3, 1.0, 0.0) == [] and a._docs_meta.get("a3") is None
+    assert a._bm25.live_docs == b._bm25.live_docs == len(CORPUS) - 1
+
+def test_compaction_publishes_a_generation_other_workers_load(worker):
+    a, b = worker(), worker()
+    a.upsert_documents([{"doc_id": "new1", "text": "zebra crossing"}])
+    a.delete_documents(["a3"])
+    old = a._gen.name
+    stats = a.compact()
+    assert stats.serving_generation != old and stats.pending_docs == stats.tombstones == 0
+    assert a.delta_log_path.read_text() == ""
+    for svc in (a, worker()):
+        assert _ids(svc.search("zebra", 3, 1.0, 0.0)) == ["new1"]
+        assert svc._docs_meta.get("a3") is None and svc._bm25.live_docs == len(CORPUS)
+    # a running worker notices the publish and swaps generations
+    assert b._generation_moved()
+    b._reload()
+    assert b._gen.name == stats.serving_generation and _ids(b.search("zebra", 3, 1.0, 0.0)) == ["new1"]
+
+def test_passages_aggregate_to_their_contract(worker):
+    svc = worker()
+    hits = svc.search("arbitration geneva", 5, 1.0, 0.0)
+    assert hits[0].doc_id == "cuad/c1" and hits[0].title == "Contract 1"
+    ids = _ids(svc.search("termination insolvency", 10, 0.5, 0.5))
+    assert ids.count("cuad/c1") == 1 and not any("#" in d for d in ids)
+    # deleting the contract deletes its passages
+    assert svc.delete_documents(["cuad/c1"]) == 2
+    assert "cuad/c1" not in _ids(svc.search("arbitration geneva", 5, 1.0, 0.0))
+
+def test_cursor_pages_continue_the_first_page(worker):
+    svc = worker()
+    first = svc.search_page("law termination notice", 5, 0.5, 0.5)
+    assert _ids(first.hits) == _ids(svc.search("law termination notice", 5, 0.5, 0.5))
+    seen, page = _ids(first.hits), first
+    while page.next_cursor:
+        page = svc.search_page("", 5, 0.0, 0.0, cursor=page.next_cursor)
+        assert page.offset == len(seen)
+        seen += _ids(page.hits)
+    assert len(seen) == len(set(seen))
+    assert set(seen) == set(_ids(svc.search("law termination notice", 100, 0.5, 0.5)))
+    # later pages come from the cached candidate list, a repeated first page from the result cache
+    caches = svc.stats().caches
+    assert caches["search_cursors"]["hits"] > 0 and caches["results"]["hits"] == 1  # search() above
+    again = svc.search_page("law termination notice", 5, 0.5, 0.5)
+    assert again == first and svc.stats().caches["results"]["hits"] == 2
+    with pytest.raises(ValueError):
+        svc.search_page("", 5, 0.5, 0.5, cursor="not-a-cursor")
+    # another worker (no cached list) serves the same cursor
+    assert _ids(worker().search_page("", 5, 0.0, 0.0, cursor=first.next_cursor).hits) == seen[5:10]
+
+def test_upserts_percolate_saved_queries(worker):
+    svc = worker()
+    svc.save_query("arb", {"query": "arbitration geneva", "k": 3, "bm25_weight": 1.0, "faiss_weight": 0.0})
+    svc.save_query("watch", {"query": "zebra", "k": 3, "bm25_weight": 1.0, "faiss_weight": 0.0})
+    added, replaced, alerts = svc.upsert_documents([
+        {"doc_id": "cuad/c2#p0", "text": "arbitration seated in geneva switzerland",
+         "meta": {"parent": "cuad/c2", "source": "cuad"}},
+        {"doc_id": "other", "text": "payment terms"},
+    ])
+    assert (added, replaced, alerts) == (2, 0, 1)
+    # a passage alerts as its contract
+    assert [a["doc_id"] for a in svc.alerts(kind="query", name="arb")] == ["cuad/c2"]
+    assert svc.alerts(kind="query", name="watch") == []
+
+def _rebuild_sources(tmp_path, monkeypatch, encoder):
+    """The ACORD part of CORPUS as a corpus.jsonl that scripts.build_indices can rebuild from."""
+    acord = tmp_path / "acord"
+    acord.mkdir()
+    (acord / "corpus.jsonl").write_text("".join(json.dumps({"_id": d, "text": t}) + "\n"
+                                                for d, t, _ in CORPUS if "#" not in d))
+    (acord / "qrels").mkdir()
+    (acord / "qrels" / "test.tsv").write_text("query-id\tcorpus-id\tscore\nq1\ta0\t1\n")
+    monkeypatch.setattr(settings, "ACORD_DIR", str(acord))
+    monkeypatch.setattr(settings, "INDEX_CUAD_CONTRACTS", False)
+    monkeypatch.setattr(settings, "RETRIEVAL_SHARDS", 1)
+    monkeypatch.setattr(embed_faiss, "load_encoder", lambda *_: encoder)
+
+def test_full_rebuild_keeps_api_updates(worker, tmp_path, fake_encoder, monkeypatch):
+    _rebuild_sources(tmp_path, monkeypatch, fake_encoder)
+    a = worker()
+    a.upsert_documents([{"doc_id": "new1", "text": "zebra crossing", "title": "Zebra"}])
+    a.delete_documents(["a3"])
+    a.compact()
+    a.upsert_documents([{"doc_id": "new2", "text": "zebra stripes", "title": "Stripes"}])
+
+    build_indices.main()
+    # compacted and logged updates alike are in the rebuilt generation, texts and metadata together
+    assert a.delta_log_path.read_text() == ""
+    for svc in (worker(), a):
+        if svc is a:
+            assert a._generation_moved()
+            a._reload()
+        hits = svc.search("zebra", 5, 1.0, 0.0)
+        assert sorted((h.doc_id, h.title) for h in hits) == [("new1", "Zebra"), ("new2", "Stripes")]
+        assert svc._docs_meta.get("a3") is None and "a3" not in svc._bm25.doc_ids
+        assert svc._bm25.live_docs == 31 and svc._bm25.pending_docs == 0
+        # metadata of the published generation carries over
+        assert svc._docs_meta.get("a0")["title"] == "Clause 0"
+
+def test_full_rebuild_keeps_legacy_metadata(tmp_path, fake_encoder, monkeypatch):
+    _rebuild_sources(tmp_path, monkeypatch, fake_encoder)
+    index = tmp_path / "index"
+    index.mkdir()
+    monkeypatch.setattr(settings, "INDEX_DIR", str(index))
+    monkeypatch.setattr(settings, "EMBED_STORE_ENABLED", False)
+    # indices from before generations: metadata hand-provided in INDEX_DIR/docs_meta.json
+    (index / "docs_meta.json").write_text(json.dumps({"a0": {"title": "Governing law", "jurisdiction": "NY"},
+                                                      "a1": {"title": "Notice", "jurisdiction": "CA"},
+                                                      "cuad/old": {"title": "Stale contract"}}))
+    build_indices.main()
+    docs = DocStore.open(current_generation(index)[1])
+    assert docs.get("a0") == {"title": "Governing law", "jurisdiction": "NY"} and docs.get("cuad/old") is None
+    # so the filter columns compiled from it still match
+    bm25 = BM25Local()
+    bm25.load(str(current_generation(index)[1] / "bm25"))
+    cols = MetaColumns.load(str(current_generation(index)[1] / "meta_cols"))
+    matched = {bm25.doc_ids[i] for i in np.flatnonzero(cols.mask({"jurisdiction": "NY"}))}
+    assert "a0" in matched and "a1" not in matched
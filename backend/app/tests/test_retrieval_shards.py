@@ -0,0 +1,81 @@
+import numpy as np
+from retrieval.bm25_local import BM25Local
+from retrieval.embed_faiss import EmbedFAISS, IndexConfig
+from retrieval.shards import ShardedBM25, ShardedFAISS, ShardSet, build_bm25_shards, build_faiss_shards, shard_dir, shard_of
+
+WORDS = [f"w{i}" for i in range(40)]
+QUERIES = ["w1 w2 w3", "w5 w5 w17", "w30 w8", "w39"]
+
+def _items():
+    rng = np.random.default_rng(0)
+    return [(f"doc{i // 3}#c{i % 3}", " ".join(rng.choice(WORDS, size=rng.integers(3, 30)))) for i in range(150)]
+
+def _faiss(enc):
+    return EmbedFAISS("test", IndexConfig(), model_loader=lambda: enc)
+
+def _check(bm, fa, single, corpus):
+    """Sharded top-k == the single index's top-k, and every hit carries its exact score."""
+    for q, got in zip(QUERIES, bm.query_many(QUERIES, k=7)):
+        (slots, scores), = single.query_slots([q], k=single.total_slots)
+        exact = dict(zip(map(single.doc_id, slots.tolist()), scores.tolist()))
+        assert np.allclose([s for _, s in got], scores[:7], rtol=1e-5)
+        assert all(np.isclose(s, exact[d], rtol=1e-5) for d, s in got)
+    vecs = fa.encoder.encode_corpus([t for _, t in corpus])
+    qv = fa.encode_queries(QUERIES)
+    for row, (slots, scores) in zip(qv, fa.search_slots(qv, k=5)):
+        exact = dict(zip((d for d, _ in corpus), (vecs @ row).tolist()))
+        assert np.allclose(scores, np.sort(vecs @ row)[::-1][:5], rtol=1e-5)
+        assert all(np.isclose(s, exact[fa.doc_ids[g]], rtol=1e-5) for g, s in zip(slots.tolist(), scores))
+
+def test_sharded_search_matches_one_index(tmp_path, fake_encoder):
+    corpus = _items()
+    root = tmp_path / "shards"
+    sizes = build_bm25_shards(_items, (), 3, root)
+    assert sum(sizes) == len(corpus) and all(sizes)
+    # one pass over the corpus routes each encoded chunk's rows to their shard, in the same order as BM25
+    assert build_faiss_shards(iter(corpus), _faiss(fake_encoder), 3, root, chunk_size=7) == sizes
+    for s in range(3):
+        part, bm25 = _faiss(fake_encoder), BM25Local()
+        part.load(str(shard_dir(root, s) / "faiss"))
+        bm25.load(str(shard_dir(root, s) / "bm25"))
+        assert part.doc_ids == list(bm25.doc_ids)
+    # a contract's passages share a shard
+    assert len({shard_of(f"doc7#c{j}", 3) for j in range(3)}) == 1
+
+    single = BM25Local()
+    single.build(corpus)
+    shards = ShardSet.open(root, IndexConfig(), transport="inline")
+    bm, fa = ShardedBM25(shards), ShardedFAISS(shards, _faiss(fake_encoder))
+    assert bm.live_docs == len(corpus) and fa.ntotal == len(corpus)
+    _check(bm, fa, single, corpus)
+
+    # filters are pushed into every shard
+    allow = np.zeros(bm.total_slots, dtype=bool)
+    allow[::4] = True
+    for slots, _ in bm.query_slots(QUERIES, k=5, allow=allow) + fa.query_slots(QUERIES, k=5, allow=allow):
+        assert len(slots) and allow[slots].all()
+
+    # updates are routed by doc id; idf stays collection-wide while deltas are pending
+    new_items = [("doc3#c0", "w1 w1 w2 replaced"), ("fresh#c0", "w5 w17 w17 new"), ("other", "w30 w8 w8")]
+    new, replaced = bm.add(new_items)
+    fa.delete(replaced)
+    fa.add(new_items, new)
+    single.add(new_items)
+    assert [bm.doc_id(g) for g in replaced] == ["doc3#c0"]
+    removed = bm.delete(["doc9#c1"])
+    fa.delete(removed)
+    single.delete(["doc9#c1"])
+    corpus = [(d, t) for d, t in corpus if d not in ("doc3#c0", "doc9#c1")] + new_items
+    _check(bm, fa, single, corpus)
+
+    # shard servers in their own processes answer the same; compaction keeps the merge exact
+    shards.save_compacted(tmp_path / "compacted")
+    shards.close()
+    procs = ShardSet.open(tmp_path / "compacted", IndexConfig(), transport="process")
+    try:
+        bm, fa = ShardedBM25(procs), ShardedFAISS(procs, _faiss(fake_encoder))
+        single = single.compacted()
+        assert bm.live_docs == single.live_docs == len(corpus) and not bm.segments
+        _check(bm, fa, single, corpus)
+    finally:
+        procs.close()
@@ -14,6 +14,7 @@ from backend.app.api.v1.calibration_routes import router as calib_router
 from backend.app.api.v1.governance_audit_routes import router as gov_router
 from backend.app.api.v1.exports_routes import router as exports_router
 from backend.app.api.v1.auth_routes import router as auth_router
+from backend.app.api.v1.admin_routes import router as admin_router
 
 configure_logging()
 app = FastAPI(title="Contract Risk Analyzer (Local)")
@@ -40,3 +41,4 @@ app.include_router(calib_router, prefix="/api/v1")
 app.include_router(gov_router, prefix="/api/v1")
 app.include_router(exports_router, prefix="/api/v1")
 app.include_router(auth_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import streamlit as st
 from typing import List
-from frontend.streamlit_app.utils import api_post, api_get, api_delete, role_badge, init_session, cluster_similar, code_block
+from frontend.streamlit_app.utils import api_post, api_get, api_delete, role_badge, init_session, code_block
 
 st.set_page_config(page_title="Search & Compare", layout="wide")
 init_session()
@@ -54,12 +54,19 @@ if st.session_state.get("last_search"):
     hits = st.session_state["last_search"]["hits"]
     st.write(f"{len(hits)} hits")
     st.dataframe(hits, use_container_width=True)
+    # later pages come from the backend's cached candidate list, not a deeper re-search
+    cursor = st.session_state["last_search"].get("next_cursor")
+    if cursor and st.button("More results"):
+        more = api_post("/api/v1/retrieval/search", {"cursor": cursor, "k": k})
+        st.session_state["last_search"] = {**more, "hits": hits + more.get("hits", [])}
+        st.experimental_rerun()
 
-    texts = [h.get("snippet") or h.get("title") or h["doc_id"] for h in hits]
-    clusters = cluster_similar(texts, threshold=0.75)
+    # clustered by the backend's MinHash/LSH index over the full documents, not just these snippets
+    clusters = api_post("/api/v1/retrieval/clusters",
+                        {"doc_ids": [h["doc_id"] for h in hits], "min_size": 1}).get("clusters", [])
     with st.expander("Near-duplicate / Version Clusters"):
         for c in clusters:
-            st.write("• " + ", ".join(hits[i]["doc_id"] for i in c))
+            st.write("• " + ", ".join(f"{m['doc_id']} ({m['similarity']:.2f})" for m in c["members"]))
 
     # Watchlists
     st.subheader("Watchlists")
@@ -5,8 +5,6 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 import streamlit as st
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 EXPORTS_DIR = Path("./exports")
@@ -165,31 +163,6 @@ def mask_pii(text: str, enable: bool = True) -> str:
 def can_unmask() -> bool:
     return st.session_state.get("role") == "legal"
 
-# ---------- Clustering / near-duplicates ----------
-
-def cluster_similar(texts: List[str], threshold: float = 0.8) -> List[List[int]]:
-    if not texts:
-        return []
-    vec = TfidfVectorizer(max_features=4096, ngram_range=(1,2))
-    X = vec.fit_transform(texts)
-    sims = cosine_similarity(X)
-    n = len(texts)
-    visited = set()
-    clusters = []
-    for i in range(n):
-        if i in visited:
-            continue
-        group = [i]
-        visited.add(i)
-        for j in range(i+1, n):
-            if j in visited:
-                continue
-            if sims[i, j] >= threshold:
-                group.append(j)
-                visited.add(j)
-        clusters.append(group)
-    return clusters
-
 # ---------- File helpers ----------
 
 def save_artifact(path: Path, bytes_data: bytes):
@@ -1,97 +1,105 @@
 import argparse
 import json
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Tuple, List
+from typing import Dict, Iterator, Tuple, List
 import numpy as np
 import pandas as pd
 
-def load_corpus(acord_dir: Path) -> Dict[str, str]:
+def _iter_jsonl(path: Path) -> Iterator[dict]:
+    # line by line: the file is never held in memory as a whole
+    with path.open(encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_corpus(acord_dir: Path) -> Iterator[Tuple[str, str]]:
+    """Stream (doc_id, text) from corpus.jsonl; a repeated id keeps its first record."""
     corpus_p = acord_dir / "corpus.jsonl"
     if not corpus_p.exists():
-        return {}
-    data = {}
-    for line in corpus_p.read_text(encoding="utf-8").splitlines():
-        obj = json.loads(line)
-        _id = obj.get("_id") or obj.get("id")
-        txt = " ".join([obj.get("title") or "", obj.get("text") or ""]).strip()
-        data[str(_id)] = txt
-    return data
+        return
+    seen = set()
+    for obj in _iter_jsonl(corpus_p):
+        _id = str(obj.get("_id") or obj.get("id"))
+        if _id in seen:
+            continue
+        seen.add(_id)
+        yield _id, " ".join([obj.get("title") or "", obj.get("text") or ""]).strip()
 
-def load_queries(acord_dir: Path) -> Dict[str, str]:
+def iter_queries(acord_dir: Path) -> Iterator[Tuple[str, str]]:
     qp = acord_dir / "queries.jsonl"
     if not qp.exists():
-        return {}
-    data = {}
-    for line in qp.read_text(encoding="utf-8").splitlines():
-        obj = json.loads(line)
-        data[str(obj.get("_id") or obj.get("id"))] = obj.get("text") or ""
-    return data
+        return
+    for obj in _iter_jsonl(qp):
+        yield str(obj.get("_id") or obj.get("id")), obj.get("text") or ""
 
-def load_qrels(acord_dir: Path) -> Dict[str, Dict[str, int]]:
-    """
-    Supports both:
-      - BEIR qrels (3-col):   query-id \t corpus-id \t score
-      - TREC qrels (4-col):   qid Q0 docid rel
-    Also tolerates optional headers: ["query-id","corpus-id","score"].
+def load_corpus(acord_dir: Path) -> Dict[str, str]:
+    return dict(iter_corpus(acord_dir))
+
+def load_queries(acord_dir: Path) -> Dict[str, str]:
+    return dict(iter_queries(acord_dir))
+
+@dataclass
+class Qrels:
+    """Relevance judgements as integer-coded columns: one row per (query, doc) pair."""
+    qids: List[str]  # code -> query id
+    docs: List[str]  # code -> doc id
+    q: np.ndarray    # int32 query code per judgement
+    d: np.ndarray    # int32 doc code per judgement
+    rel: np.ndarray  # int32 relevance per judgement
+
+    def __len__(self) -> int:
+        return len(self.rel)
 
-    Returns: {qid: {docid: rel_int}}
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        for q, d, r in zip(self.q.tolist(), self.d.tolist(), self.rel.tolist()):
+            out.setdefault(self.qids[q], {})[self.docs[d]] = r
+        return out
+
+def _read_qrels_file(fp: Path) -> pd.DataFrame:
+    """One qrels file as (qid, did, rel) columns."""
+    df = pd.read_csv(fp, sep="\t", header=None, dtype=str, keep_default_na=False)
+    if df.empty:
+        return pd.DataFrame({"qid": [], "did": [], "rel": []})
+    first = [str(c).strip().lower() for c in df.iloc[0]]
+    if {"query-id", "corpus-id", "score"}.issubset(first):
+        # named BEIR columns
+        cols = [first.index("query-id"), first.index("corpus-id"), first.index("score")]
+        df = df.iloc[1:]
+    elif df.shape[1] >= 4:
+        cols = [0, 2, 3]  # TREC: qid Q0 docid rel
+    elif df.shape[1] == 3:
+        cols = [0, 1, 2]  # BEIR: query-id corpus-id score
+    else:
+        raise ValueError(f"Unexpected qrels shape in {fp}: {df.shape}")
+    out = df.iloc[:, cols].copy()
+    out.columns = ["qid", "did", "rel"]
+    # unparseable scores count as relevant, fractional ones truncate
+    out["rel"] = np.trunc(pd.to_numeric(out["rel"], errors="coerce").fillna(1)).astype(np.int32)
+    return out
+
+def load_qrels_arrays(acord_dir: Path) -> Qrels:
+    """
+    Every qrels/*.tsv (BEIR 3-col with or without header, or TREC 4-col)
+    as integer-coded arrays; a repeated (query, doc) pair keeps its last score.
     """
-    import pandas as pd
     qrels_dir = acord_dir / "qrels"
     files = sorted(qrels_dir.glob("*.tsv"))
     if not files:
         raise FileNotFoundError(f"No qrels found in {qrels_dir}")
+    df = pd.concat([_read_qrels_file(fp) for fp in files], ignore_index=True)
+    df = df.drop_duplicates(["qid", "did"], keep="last")
+    q_codes, qids = pd.factorize(df["qid"])
+    d_codes, docs = pd.factorize(df["did"])
+    return Qrels(
+        qids=list(qids), docs=list(docs),
+        q=q_codes.astype(np.int32), d=d_codes.astype(np.int32), rel=df["rel"].to_numpy(dtype=np.int32),
+    )
 
-    out: Dict[str, Dict[str, int]] = {}
-    for fp in files:
-        # Try to read with header inference; if that fails, use header=None
-        try:
-            df = pd.read_csv(fp, sep="\t", dtype=str)
-        except Exception:
-            df = pd.read_csv(fp, sep="\t", header=None, dtype=str)
-
-        cols = [c.lower() for c in df.columns.astype(str).tolist()]
-
-        # Named BEIR columns
-        if set(["query-id", "corpus-id", "score"]).issubset(set(cols)):
-            q_col = cols.index("query-id")
-            d_col = cols.index("corpus-id")
-            s_col = cols.index("score")
-            for _, row in df.iterrows():
-                qid = str(row.iloc[q_col])
-                did = str(row.iloc[d_col])
-                try:
-                    rel = int(float(row.iloc[s_col]))
-                except Exception:
-                    rel = 1
-                out.setdefault(qid, {})[did] = rel
-            continue
-
-        # No headers: handle 3 or 4 columns by position
-        if df.shape[1] >= 4:
-            # TREC: qid Q0 docid rel
-            for _, row in df.iterrows():
-                qid = str(row.iloc[0])
-                did = str(row.iloc[2])
-                try:
-                    rel = int(float(row.iloc[3]))
-                except Exception:
-                    rel = 1
-                out.setdefault(qid, {})[did] = rel
-        elif df.shape[1] == 3:
-            # BEIR: query-id corpus-id score
-            for _, row in df.iterrows():
-                qid = str(row.iloc[0])
-                did = str(row.iloc[1])
-                try:
-                    rel = int(float(row.iloc[2]))
-                except Exception:
-                    rel = 1
-                out.setdefault(qid, {})[did] = rel
-        else:
-            raise ValueError(f"Unexpected qrels shape in {fp}: {df.shape}")
-
-    return out
+def load_qrels(acord_dir: Path) -> Dict[str, Dict[str, int]]:
+    """Returns: {qid: {docid: rel_int}}"""
+    return load_qrels_arrays(acord_dir).to_dict()
 
 def mrr_at_k(ranked: List[str], relevant: Dict[str, int], k: int) -> float:
     for i, did in enumerate(ranked[:k], start=1):
@@ -113,13 +121,10 @@ def ndcg_at_k(ranked: List[str], relevant: Dict[str, int], k: int) -> float:
     return dcg / idcg if idcg > 0 else 0.0
 
 def evaluate(topk_map: Dict[str, List[Tuple[str, float]]], qrels: Dict[str, Dict[str, int]], k: int = 10):
-    mrrs, ndcgs = [], []
-    for qid, ranked in topk_map.items():
-        relevant = qrels.get(qid, {})
-        ranked_ids = [d for d, _ in ranked]
-        mrrs.append(mrr_at_k(ranked_ids, relevant, k))
-        ndcgs.append(ndcg_at_k(ranked_ids, relevant, k))
-    return float(np.mean(mrrs) if mrrs else 0.0), float(np.mean(ndcgs) if ndcgs else 0.0)
+    from retrieval.evaluation import evaluate_rankings
+
+    m = evaluate_rankings(topk_map, qrels, k=k)
+    return m[f"MRR@{k}"], m[f"nDCG@{k}"]
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
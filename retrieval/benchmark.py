@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from retrieval.beir_acord_loader import iter_corpus, load_queries
+from retrieval.bm25_bench import synthetic_corpus
+from retrieval.parallel_encode import peak_rss_mb
+
+MODES = {"bm25": (1.0, 0.0), "faiss": (0.0, 1.0), "hybrid": (0.5, 0.5)}
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def _dir_mb(path: Path) -> float:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) / (1024 * 1024)
+
+def _cuad_passages(cuad: Path, min_words: int = 20) -> Iterator[str]:
+    # paragraphs of the full contract texts
+    for fp in sorted((cuad / "full_contract_txt").glob("*.txt")):
+        for para in fp.read_text(encoding="utf-8", errors="ignore").split("\n\n"):
+            para = " ".join(para.split())
+            if len(para.split()) >= min_words:
+                yield para
+
+def seed_passages(acord: Optional[Path], cuad: Optional[Path], limit: int = 50000, min_seeds: int = 1000) -> List[str]:
+    """
+    Real passages to replicate: ACORD corpus + CUAD paragraphs, topped up
+    with synthetic Zipf text when there are fewer than `min_seeds` of them.
+    """
+    seeds = []
+    if acord is not None:
+        seeds += [t for _, t in islice(iter_corpus(acord), limit)]
+    if cuad is not None and (cuad / "full_contract_txt").exists():
+        seeds += list(islice(_cuad_passages(cuad), max(0, limit - len(seeds))))
+    if len(seeds) < min_seeds:
+        seeds += [t for _, t in synthetic_corpus(min_seeds - len(seeds))]
+    return seeds
+
+def sample_queries(seeds: List[str], n: int, real: List[str], seed: int = 1) -> List[str]:
+    """`real` queries first, then distinct 3-8 word windows of seed passages (no result-cache hits)."""
+    rng = np.random.default_rng(seed)
+    out = dict.fromkeys(real)
+    for _ in range(20 * n):
+        if len(out) >= n:
+            break
+        words = seeds[int(rng.integers(0, len(seeds)))].split()
+        width = int(rng.integers(3, 9))
+        start = int(rng.integers(0, max(1, len(words) - width)))
+        out.setdefault(" ".join(words[start: start + width]))
+    return list(out)[:n]
+
+def scaled_corpus(seeds: List[str], n: int, seed: int = 0) -> Iterator[Tuple[str, str]]:
+    """
+    `n` passages cycling through `seeds`; every copy after the first is
+    perturbed (~10% of tokens dropped, two swapped, a random number
+    appended) so replicas are distinct texts with realistic term statistics.
+    """
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        text = seeds[i % len(seeds)]
+        if i >= len(seeds):
+            toks = text.split()
+            if len(toks) > 4:
+                toks = [t for t, keep in zip(toks, rng.random(len(toks)) > 0.1) if keep] or toks
+                a, b = rng.integers(0, len(toks), size=2)
+                toks[a], toks[b] = toks[b], toks[a]
+            text = " ".join(toks) + f" {int(rng.integers(1, 10 ** 6))}"
+        yield f"B{i}", text
+
+def _latency(fn, queries: List[str]) -> dict:
+    lat = []
+    t_start = time.perf_counter()
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return _summary(lat, time.perf_counter() - t_start)
+
+def _summary(lat: List[float], total: float) -> dict:
+    arr = np.asarray(lat)
+    return {
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "mean_ms": float(arr.mean()),
+        "qps": len(lat) / total if total else 0.0,
+    }
+
+def bench_concurrent(svc, queries: List[str], k: int, concurrency: int, batched: bool) -> dict:
+    """
+    `concurrency` async searchers splitting `queries`, hybrid mode, each
+    search as the /retrieval/search route runs it: with batched=True the
+    query embedding goes through the service's micro-batcher, otherwise
+    every search encodes its own query in a worker thread.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    lat: List[float] = []
+
+    async def searcher(mine: List[str]):
+        loop = asyncio.get_running_loop()
+        for q in mine:
+            t0 = time.perf_counter()
+            qv = await svc.encode_query(q) if batched else None
+            await loop.run_in_executor(pool, lambda: svc.search(q, k, 0.5, 0.5, query_vector=qv))
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    async def main():
+        await asyncio.gather(*(searcher(queries[i::concurrency]) for i in range(concurrency)))
+
+    svc.clear_caches()
+    t_start = time.perf_counter()
+    asyncio.run(main())
+    total = time.perf_counter() - t_start
+    pool.shutdown()
+    return _summary(lat, total)
+
+def build(idx: Path, seeds: List[str], size: int, chunk_size: int) -> dict:
+    from backend.app.core.config import settings
+    from retrieval.bm25_local import BM25Local
+    from retrieval.embed_faiss import EmbedFAISS, IndexConfig
+    from retrieval.parallel_encode import EncoderPool
+
+    if idx.exists():
+        shutil.rmtree(idx)
+    idx.mkdir(parents=True)
+    row = {}
+    t0 = time.perf_counter()
+    bm25 = BM25Local()
+    bm25.build(scaled_corpus(seeds, size))
+    bm25.save(str(idx / "bm25"))
+    row["bm25_build_s"] = time.perf_counter() - t0
+    del bm25
+
+    pool = None
+    if settings.EMBED_WORKERS > 1:
+        pool = EncoderPool(settings.MODEL_NAME, settings.EMBED_BACKEND, settings.EMBED_WORKERS,
+                           settings.EMBED_THREADS_PER_WORKER)
+    faissi = EmbedFAISS(settings.MODEL_NAME, IndexConfig.from_settings(settings),
+                        model_loader=(lambda: pool) if pool is not None else None, backend=settings.EMBED_BACKEND)
+    t0 = time.perf_counter()
+    faissi.build(scaled_corpus(seeds, size), chunk_size=chunk_size)
+    faissi.save(str(idx / "faiss"))
+    row["faiss_build_s"] = time.perf_counter() - t0
+    row["faiss_config"] = faissi.config.factory_string()
+    if pool is not None:
+        pool.close()
+    del faissi
+
+    (idx / "meta.json").write_text(json.dumps({"last_build": datetime.utcnow().isoformat() + "Z", "docs": size}))
+    row["bm25_disk_mb"] = _dir_mb(idx / "bm25")
+    row["faiss_disk_mb"] = _dir_mb(idx / "faiss")
+    return row
+
+def bench_search(idx: Path, queries: List[str], k: int, modes: List[str], warmup: int = 5,
+                 concurrency: Optional[List[int]] = None) -> dict:
+    """Load the indices through RetrievalService and time search() per mode; caches are cleared between modes."""
+    from backend.app.core.config import settings
+
+    settings.INDEX_DIR = str(idx)
+    settings.EMBED_STORE_ENABLED = False
+    from backend.app.services.retrieval_service import RetrievalService
+
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    svc = RetrievalService()
+    svc.load()
+    out = {"load_s": time.perf_counter() - t0}
+    for i in range(warmup):  # loads the encoder, faults in the index pages
+        svc.search(f"warmup query {i}", k, 0.5, 0.5)
+    rss1 = _rss_mb()
+    out["service_rss_mb"] = rss1 - rss0 if rss0 is not None and rss1 is not None else None
+    for mode in modes:
+        bw, fw = MODES[mode]
+        svc.clear_caches()
+        out[mode] = _latency(lambda q: svc.search(q, k, bw, fw), queries)
+    for c in concurrency or []:
+        out[f"concurrent_{c}"] = {
+            "unbatched": bench_concurrent(svc, queries, k, c, batched=False),
+            "batched": bench_concurrent(svc, queries, k, c, batched=True),
+        }
+    if concurrency:
+        out["query_batching"] = svc.stats().query_batching
+    return out
+
+def run(sizes: List[int], n_queries: int, k: int, modes: List[str], work_dir: Path, chunk_size: int,
+        keep: bool = False, concurrency: Optional[List[int]] = None) -> dict:
+    from backend.app.core.config import settings
+    from backend.app.core.path_resolver import acord_dir, cuad_dir
+
+    def _maybe(fn) -> Optional[Path]:
+        try:
+            return fn()
+        except FileNotFoundError:
+            return None
+
+    acord, cuad = _maybe(acord_dir), _maybe(cuad_dir)
+    seeds = seed_passages(acord, cuad)
+    queries = sample_queries(seeds, n_queries, list(load_queries(acord).values()) if acord is not None else [])
+
+    rows = []
+    for size in sizes:
+        idx = work_dir / f"n{size}"
+        row = {"docs": size, **build(idx, seeds, size, chunk_size)}
+        row.update(bench_search(idx, queries, k, modes, concurrency=concurrency))
+        row["peak_rss_mb"] = peak_rss_mb()
+        rows.append(row)
+        print(json.dumps(row, indent=2), flush=True)
+        if not keep:
+            shutil.rmtree(idx, ignore_errors=True)
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "created": datetime.utcnow().isoformat() + "Z",
+        "model_name": settings.MODEL_NAME,
+        "embed_backend": settings.EMBED_BACKEND,
+        "faiss_index_type": settings.FAISS_INDEX_TYPE,
+        "seed_passages": len(seeds),
+        "queries": len(queries),
+        "k": k,
+        "rows": rows,
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build + search benchmark of RetrievalService on scaled ACORD/CUAD corpora")
+    ap.add_argument("--sizes", type=str, default="10000,100000,1000000")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--modes", type=str, default=",".join(MODES))
+    ap.add_argument("--work_dir", type=str, default="./indices_bench")
+    ap.add_argument("--chunk_size", type=int, default=8192)
+    ap.add_argument("--keep", action="store_true", help="keep the built indices")
+    ap.add_argument("--concurrency", type=str, default="",
+                    help="e.g. 1,64: also time that many concurrent searchers, with and without query micro-batching")
+    ap.add_argument("--out", type=str, default=None, help="defaults to <work_dir>/retrieval_bench_<timestamp>.json")
+    args = ap.parse_args()
+
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    report = run([int(s) for s in args.sizes.split(",")], args.queries, args.k, modes, work_dir,
+                 args.chunk_size, keep=args.keep, concurrency=concurrency)
+    out = Path(args.out) if args.out else work_dir / f"retrieval_bench_{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    out.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {out}")
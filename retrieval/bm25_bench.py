@@ -0,0 +1,72 @@
+import argparse
+import json
+import time
+from typing import List, Tuple
+import numpy as np
+from rank_bm25 import BM25Okapi
+from retrieval.bm25_local import BM25Local
+
+def synthetic_corpus(n_docs: int, vocab: int = 50000, seed: int = 0) -> List[Tuple[str, str]]:
+    """Zipf-distributed passages of 20-120 tokens, roughly shaped like clause text."""
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab + 1) ** 1.07
+    p /= p.sum()
+    lens = rng.integers(20, 120, size=n_docs)
+    toks = rng.choice(vocab, size=int(lens.sum()), p=p)
+    out, pos = [], 0
+    for i, ln in enumerate(lens):
+        out.append((f"S{i}", " ".join(f"t{t}" for t in toks[pos:pos + ln])))
+        pos += ln
+    return out
+
+def synthetic_queries(n: int, vocab: int = 50000, seed: int = 1) -> List[str]:
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab + 1) ** 1.07
+    p /= p.sum()
+    return [" ".join(f"t{t}" for t in rng.choice(vocab, size=int(rng.integers(2, 8)), p=p)) for _ in range(n)]
+
+def _latency_ms(fn, queries: List[str]) -> dict:
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+    arr = np.asarray(lat)
+    return {"p50_ms": float(np.percentile(arr, 50)), "p95_ms": float(np.percentile(arr, 95)), "mean_ms": float(arr.mean())}
+
+def bench(size: int, n_queries: int, k: int, rank_bm25_max: int) -> dict:
+    items = synthetic_corpus(size)
+    queries = synthetic_queries(n_queries)
+    row = {"docs": size}
+
+    t0 = time.perf_counter()
+    local = BM25Local()
+    local.build(items)
+    row["local_build_s"] = time.perf_counter() - t0
+    row["local"] = _latency_ms(lambda q: local.query(q, k=k), queries)
+
+    if size <= rank_bm25_max:
+        t0 = time.perf_counter()
+        ref = BM25Okapi([BM25Local._tokenize(t) for _, t in items])
+        row["rank_bm25_build_s"] = time.perf_counter() - t0
+        doc_ids = [d for d, _ in items]
+
+        def ref_query(q: str):
+            scores = ref.get_scores(BM25Local._tokenize(q))
+            return sorted(zip(doc_ids, scores), key=lambda x: x[1], reverse=True)[:k]
+
+        row["rank_bm25"] = _latency_ms(ref_query, queries)
+        row["speedup_p50"] = row["rank_bm25"]["p50_ms"] / max(row["local"]["p50_ms"], 1e-9)
+    return row
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="BM25Local vs rank_bm25 query latency on synthetic corpora")
+    ap.add_argument("--sizes", type=str, default="10000,100000,1000000")
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--k", type=int, default=50)
+    ap.add_argument("--rank_bm25_max", type=int, default=1000000,
+                    help="skip the rank_bm25 baseline above this corpus size (it is slow to build)")
+    args = ap.parse_args()
+
+    rows = [bench(int(s), args.queries, args.k, args.rank_bm25_max) for s in args.sizes.split(",")]
+    print(json.dumps(rows, indent=2))
@@ -1,37 +1,500 @@
-import pickle
-from typing import List, Tuple
-from rank_bm25 import BM25Okapi
+import shutil
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from retrieval.mmap_io import (
+    load_arrays,
+    open_string_table,
+    read_manifest,
+    replace_dir,
+    write_manifest,
+    write_string_table,
+)
+
+FORMAT = "bm25-csr-v1"
+_ARRAYS = ("indptr", "postings", "tfs", "weights", "idf", "max_weight", "doc_len", "live")
 
 class BM25Local:
-    def __init__(self):
-        self.bm25 = None
+    """
+    Okapi BM25 over an in-memory inverted index.
+
+    Scoring matches rank_bm25.BM25Okapi (same idf, epsilon floor and k1/b
+    normalization), but postings are stored per term in CSR form with the
+    tf/length part of the score precomputed, so a query only touches the
+    postings of its own terms. Top-k uses MaxScore-style pruning: terms are
+    processed in decreasing upper-bound order and, once the remaining terms
+    can no longer lift an unseen document into the top-k, the rest are only
+    probed for the surviving candidates.
+
+    On disk the index is a directory of flat .npy columns plus string tables
+    for the vocabulary and doc ids; load() memory-maps them, so workers on
+    one host share a single page-cached copy.
+
+    Incremental updates: add() appends a small in-memory delta segment and
+    delete() records tombstones. Every document keeps a stable internal id
+    (its slot), which other indices can share. While deltas are pending,
+    idf is computed from document frequencies across all segments, and
+    length normalization uses the avgdl of the last compaction. compacted()
+    folds everything back into a single exact segment.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
         self.doc_ids: List[str] = []
-        self.tokenized_corpus: List[List[str]] = []
+        self.vocab: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)     # term -> postings slice
+        self.postings = np.zeros(0, dtype=np.int32)   # doc index, ascending per term
+        self.tfs = np.zeros(0, dtype=np.int32)        # raw term frequency
+        self.weights = np.zeros(0, dtype=np.float32)  # tf*(k1+1) / (tf + k1*norm(dl))
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.max_weight = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)           # False for slots removed by compaction
+        self.avgdl = 0.0
+        self.n_docs = 0                               # live documents, the N in idf
+        self.idf_floor = 0.0                          # epsilon * mean idf
+
+        # incremental state (only ever set on the main segment): (delta segments, tombstoned slots) is
+        # swapped as one tuple, so a reader never sees a new segment without the slots it replaced
+        self.base = 0
+        self._deltas: Tuple[Tuple["BM25Local", ...], FrozenSet[int]] = ((), frozenset())
+        self._slots: Optional[Dict[str, int]] = None
+
+    @property
+    def segments(self) -> Tuple["BM25Local", ...]:
+        return self._deltas[0]
+
+    @property
+    def tombstones(self) -> FrozenSet[int]:
+        return self._deltas[1]
+
+    @property
+    def bm25(self) -> bool:
+        return self.total_slots > 0
+
+    @property
+    def total_slots(self) -> int:
+        return len(self.doc_ids) + sum(len(s.doc_ids) for s in self.segments)
+
+    @property
+    def live_docs(self) -> int:
+        segments, tombstones = self._deltas
+        return self.n_docs + sum(len(s.doc_ids) for s in segments) - len(tombstones)
+
+    @property
+    def pending_docs(self) -> int:
+        return sum(len(s.doc_ids) for s in self.segments)
 
     @staticmethod
     def _tokenize(text: str) -> List[str]:
         return text.lower().split()
 
-    def build(self, items: List[Tuple[str, str]]):
-        """items: List of (doc_id, text)"""
-        self.doc_ids = [i[0] for i in items]
-        self.tokenized_corpus = [self._tokenize(i[1]) for i in items]
-        self.bm25 = BM25Okapi(self.tokenized_corpus)
+    def build(self, items: Iterable[Tuple[str, str]]):
+        """
+        items: iterable of (doc_id, text), consumed in a single pass; only
+        the compact posting columns are kept, never the texts.
+        """
+        self.doc_ids = []
+        self._deltas, self._slots = ((), frozenset()), None
+        vocab: Dict[str, int] = {}
+        term_col, doc_col, tf_col = array("i"), array("i"), array("i")
+        doc_len = array("f")
+        for d, (doc_id, text) in enumerate(items):
+            self.doc_ids.append(doc_id)
+            toks = self._tokenize(text)
+            doc_len.append(len(toks))
+            counts = Counter(toks)
+            term_col.extend([vocab.setdefault(tok, len(vocab)) for tok in counts])
+            tf_col.extend(counts.values())
+            doc_col.extend([d] * len(counts))
+        self.live = np.ones(len(self.doc_ids), dtype=bool)
+        self._finalize(
+            vocab,
+            np.frombuffer(term_col, dtype=np.int32),
+            np.frombuffer(doc_col, dtype=np.int32),
+            np.frombuffer(tf_col, dtype=np.int32),
+            np.frombuffer(doc_len, dtype=np.float32).copy(),
+        )
+
+    def _finalize(self, vocab: Dict[str, int], terms: np.ndarray, docs: np.ndarray, tfs: np.ndarray, doc_len: np.ndarray):
+        # term ids follow sorted vocabulary order so the saved vocab table is binary-searchable
+        sorted_terms = sorted(vocab)
+        remap = np.empty(len(vocab), dtype=np.int32)
+        remap[[vocab[t] for t in sorted_terms]] = np.arange(len(vocab), dtype=np.int32)
+        terms = remap[terms]
+        # stable sort keeps doc order inside each posting list
+        order = np.argsort(terms, kind="stable")
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        n_terms = len(vocab)
+        df = np.bincount(terms, minlength=n_terms)
+        self.vocab = {t: i for i, t in enumerate(sorted_terms)}
+        self.indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=self.indptr[1:])
+        self.postings = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self._compute_stats(df)
+
+    def _compute_stats(self, df: np.ndarray):
+        self.n_docs = int(self.live.sum())
+        self.avgdl = float(self.doc_len[self.live].sum() / self.n_docs) if self.n_docs else 0.0
+
+        # rank_bm25 idf: log(N - n + 0.5) - log(n + 0.5), negatives floored at epsilon * mean idf
+        idf = np.log(self.n_docs - df + 0.5) - np.log(df + 0.5)
+        self.idf_floor = self.epsilon * (float(idf.mean()) if len(idf) else 0.0)
+        idf[idf < 0] = self.idf_floor
+        self.idf = idf.astype(np.float32)
+        self._compute_weights(self.avgdl)
+
+    def apply_collection_stats(self, n_docs: int, avgdl: float, df: np.ndarray, idf_floor: float):
+        """
+        Score with the statistics of a collection this index is one shard
+        of: `df` is the collection-wide document frequency of each of this
+        index's terms. Shards scored this way return comparable scores, so
+        their top-k lists merge exactly. n_docs stays the shard's own count.
+        """
+        idf = np.log(n_docs - np.asarray(df, dtype=np.int64) + 0.5) - np.log(np.asarray(df, dtype=np.int64) + 0.5)
+        idf[idf < 0] = idf_floor
+        self.idf = idf.astype(np.float32)
+        self.idf_floor = idf_floor
+        self.avgdl = avgdl
+        self._compute_weights(avgdl)
+
+    def _compute_weights(self, avgdl: float):
+        tf = self.tfs.astype(np.float32)
+        norm = 1.0 - self.b + self.b * self.doc_len[self.postings] / (avgdl or 1.0)
+        self.weights = (tf * (self.k1 + 1.0) / (tf + self.k1 * norm)).astype(np.float32)
+        df = np.diff(self.indptr)
+        self.max_weight = np.zeros(len(df), dtype=np.float32)
+        nonempty = df > 0
+        if nonempty.any():
+            self.max_weight[nonempty] = np.maximum.reduceat(self.weights, self.indptr[:-1][nonempty])
+
+    def _df(self, tok: str) -> int:
+        tid = self.vocab.get(tok)
+        return 0 if tid is None else int(self.indptr[tid + 1] - self.indptr[tid])
+
+    def _global_idf(self, toks: Iterable[str], segments: Optional[Sequence["BM25Local"]] = None) -> Dict[str, float]:
+        # df and N summed over the main segment and every delta (tombstoned docs included until compaction)
+        segments = self.segments if segments is None else segments
+        n = self.n_docs + sum(len(s.doc_ids) for s in segments)
+        out = {}
+        for tok in toks:
+            df = self._df(tok) + sum(s._df(tok) for s in segments)
+            idf = float(np.log(n - df + 0.5) - np.log(df + 0.5))
+            out[tok] = idf if idf >= 0 else self.idf_floor
+        return out
+
+    def _term_weights(self, counts: Dict[str, int], idf: Optional[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        # repeated query tokens count once per occurrence, as in rank_bm25
+        tids, term_w = [], []
+        for tok, c in counts.items():
+            tid = self.vocab.get(tok)
+            if tid is None:
+                continue
+            tids.append(tid)
+            term_w.append(c * (self.idf[tid] if idf is None else idf[tok]))
+        return np.asarray(tids, dtype=np.int64), np.asarray(term_w, dtype=np.float32)
+
+    def get_scores(self, q: str) -> np.ndarray:
+        """Dense score vector over the main segment (exhaustive; used for parity checks)."""
+        tids, term_w = self._term_weights(Counter(self._tokenize(q)), None)
+        return self._dense_scores(tids, term_w)
+
+    def _dense_scores(self, tids: np.ndarray, term_w: np.ndarray) -> np.ndarray:
+        scores = np.zeros(len(self.doc_ids), dtype=np.float64)
+        for tid, w in zip(tids, term_w):
+            lo, hi = self.indptr[tid], self.indptr[tid + 1]
+            scores[self.postings[lo:hi]] += w * self.weights[lo:hi]
+        return scores
 
     def query(self, q: str, k: int = 10) -> List[Tuple[str, float]]:
-        if not self.bm25:
-            return []
-        toks = self._tokenize(q)
-        scores = self.bm25.get_scores(toks)
-        ranked = sorted(zip(self.doc_ids, scores), key=lambda x: x[1], reverse=True)[:k]
-        return ranked
+        """
+        Top-k documents for `q`. Only documents sharing at least one term with
+        the query are returned, so the list may be shorter than k.
+        """
+        return self.query_many([q], k=k)[0]
+
+    def query_many(
+        self, queries: List[str], k: int = 10, allow: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k for each query; one score accumulator per segment is allocated
+        and reused across the batch. `allow` (bool per slot) restricts
+        scoring to the selected documents, so the result is the exact top-k
+        among them rather than a post-filtered top-k.
+        """
+        return [
+            [(self.doc_id(i), float(s)) for i, s in zip(slots.tolist(), scores)]
+            for slots, scores in self.query_slots(queries, k=k, allow=allow)
+        ]
+
+    def query_slots(
+        self, queries: List[str], k: int = 10, allow: Optional[np.ndarray] = None,
+        idfs: Optional[List[Dict[str, float]]] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        query_many() as (slots, scores) arrays per query, best first.
+        `idfs` (token -> idf per query) overrides this index's own
+        statistics, e.g. with collection-wide ones when it is a shard.
+        """
+        # read once: concurrent add() / delete() / merge_deltas() swap the pair, never mutate it
+        segments, tombstones = self._deltas
+        segs = [self, *segments]
+        total = sum(len(s.doc_ids) for s in segs)
+        if not total or k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        accs = [np.zeros(len(s.doc_ids), dtype=np.float32) for s in segs]
+        dead = np.fromiter(tombstones, dtype=np.int64, count=len(tombstones))
+        fetch = k + len(dead)  # over-fetch so tombstoned hits can be dropped
+        if allow is not None:
+            allow = np.array(allow[:total], dtype=bool)
+            allow[dead] = False
+            dead, fetch = dead[:0], k
+        out = []
+        for i, q in enumerate(queries):
+            counts = Counter(self._tokenize(q))
+            if idfs is not None:
+                idf = idfs[i]
+            else:
+                idf = self._global_idf(counts, segments) if segments else None
+            ids, scores = [], []
+            for seg, acc in zip(segs, accs):
+                tids, term_w = seg._term_weights(counts, idf)
+                if len(tids):
+                    seg_allow = None if allow is None else allow[seg.base: seg.base + len(seg.doc_ids)]
+                    seg_slots, seg_scores = seg._search(tids, term_w, fetch, acc, seg_allow)
+                    ids.append(seg_slots.astype(np.int64) + seg.base)
+                    scores.append(seg_scores)
+            out.append(self._merge(ids, scores, dead, k))
+        return out
+
+    @staticmethod
+    def _merge(ids: List[np.ndarray], scores: List[np.ndarray], dead: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids_a, scores_a = np.concatenate(ids), np.concatenate(scores)
+        if len(dead):
+            keep = ~np.isin(ids_a, dead)
+            ids_a, scores_a = ids_a[keep], scores_a[keep]
+        order = np.argsort(-scores_a, kind="stable")[:k]
+        return ids_a[order], scores_a[order]
+
+    def _search(
+        self, tids: np.ndarray, term_w: np.ndarray, k: int, acc: np.ndarray, allow: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # `acc` must be all-zero on entry and is left all-zero on return
+        if (term_w <= 0).any():
+            # non-positive idf breaks the "partial score is a lower bound" invariant: score every posting
+            touched = []
+            for tid, w in zip(tids, term_w):
+                lo, hi = self.indptr[tid], self.indptr[tid + 1]
+                docs = self.postings[lo:hi]
+                acc[docs] += w * self.weights[lo:hi]
+                touched.append(docs)
+            touched = np.unique(np.concatenate(touched))
+            cand = touched[acc[touched] != 0]
+            if allow is not None:
+                cand = cand[allow[cand]]
+            hits = self._top_k(cand, acc[cand], k)
+            acc[touched] = 0.0
+            return hits
+
+        ub = term_w * self.max_weight[tids]
+        order = np.argsort(-ub)
+        tids, term_w = tids[order], term_w[order]
+        # remaining[i] = best possible contribution of terms i..end
+        remaining = np.append(np.cumsum(ub[order][::-1])[::-1], 0.0)
+
+        # documents scored so far, gathered from the postings (never a scan of the accumulator)
+        cand = None
+        seen = np.zeros(0, dtype=np.int64)
+        for i, tid in enumerate(tids):
+            lo, hi = self.indptr[tid], self.indptr[tid + 1]
+            docs, w = self.postings[lo:hi], self.weights[lo:hi]
+            if allow is not None:
+                sel = allow[docs]
+                docs, w = docs[sel], w[sel]
+            acc[docs] += term_w[i] * w
+            seen = np.union1d(seen, docs)
+            if i + 1 == len(tids):
+                break
+            if len(seen) < k:
+                continue
+            theta = np.partition(acc[seen], len(seen) - k)[len(seen) - k]
+            if remaining[i + 1] >= theta:
+                continue
+            # no unseen document can reach the top-k any more: probe the rest
+            # of the terms only for candidates that can still beat theta
+            cand = seen[acc[seen] + remaining[i + 1] >= theta]
+            for j in range(i + 1, len(tids)):
+                self._probe(int(tids[j]), float(term_w[j]), cand, acc)
+            break
+        if cand is None:
+            cand = seen
+        hits = self._top_k(cand, acc[cand], k)
+        acc[seen] = 0.0
+        return hits
+
+    def _probe(self, tid: int, w: float, cand: np.ndarray, acc: np.ndarray):
+        lo, hi = self.indptr[tid], self.indptr[tid + 1]
+        plist = self.postings[lo:hi]
+        pos = np.searchsorted(plist, cand)
+        pos[pos == len(plist)] = 0
+        hit = plist[pos] == cand
+        acc[cand[hit]] += w * self.weights[lo:hi][pos[hit]]
+
+    @staticmethod
+    def _top_k(cand: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(cand) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            cand, scores = cand[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return cand[order], scores[order]
+
+    # ---- incremental updates ----
+    def doc_id(self, slot: int) -> str:
+        if slot < len(self.doc_ids):
+            return self.doc_ids[slot]
+        for seg in self.segments:
+            if slot < seg.base + len(seg.doc_ids):
+                return seg.doc_ids[slot - seg.base]
+        raise IndexError(slot)
+
+    def _slot_map(self) -> Dict[str, int]:
+        # built on the first update only; read-only workers never pay for it
+        if self._slots is None:
+            slots = {}
+            live = np.asarray(self.live, dtype=bool)
+            for j in np.flatnonzero(live):
+                slots[self.doc_ids[j]] = int(j)
+            for seg in self.segments:
+                for j, d in enumerate(seg.doc_ids):
+                    slots[d] = seg.base + j
+            for slot in self.tombstones:
+                if slots.get(self.doc_id(slot)) == slot:
+                    del slots[self.doc_id(slot)]
+            self._slots = slots
+        return self._slots
+
+    def add(self, items: List[Tuple[str, str]]) -> Tuple[List[int], List[int]]:
+        """
+        Index `items` (unique doc ids) as a new delta segment. Existing
+        versions of the same doc ids are tombstoned. Returns (new slots, replaced slots).
+        """
+        if not items:
+            return [], []
+        slots = self._slot_map()
+        replaced = [slots[d] for d, _ in items if d in slots]
+        seg = BM25Local(self.k1, self.b, self.epsilon)
+        seg.build(items)
+        seg.base = self.total_slots
+        # scores must be comparable with the main segment: use its length normalization
+        if self.n_docs:
+            seg._compute_weights(self.avgdl)
+        # readers snapshot segments/tombstones, so swap in a new pair instead of mutating
+        segments, tombstones = self._deltas
+        self._deltas = (segments + (seg,), tombstones | set(replaced))
+        new = list(range(seg.base, seg.base + len(items)))
+        for (d, _), slot in zip(items, new):
+            slots[d] = slot
+        return new, replaced
+
+    def delete(self, doc_ids: Iterable[str]) -> List[int]:
+        """Tombstone `doc_ids`; returns the slots that were removed."""
+        slots = self._slot_map()
+        removed = [slots.pop(d) for d in doc_ids if d in slots]
+        segments, tombstones = self._deltas
+        self._deltas = (segments, tombstones | set(removed))
+        return removed
+
+    def merge_deltas(self):
+        """Fold all delta segments into one so per-query segment overhead stays flat."""
+        segments = self.segments
+        if len(segments) < 2:
+            return
+        base = segments[0].base
+        live = np.ones(sum(len(s.doc_ids) for s in segments), dtype=bool)
+        merged = self._merged(list(segments), base, live, [])
+        merged.base = base
+        if self.n_docs:
+            merged._compute_weights(self.avgdl)
+        self._deltas = ((merged,), self.tombstones)
+
+    def compacted(self) -> "BM25Local":
+        """A new single-segment index over all live documents with exact statistics; slots are preserved."""
+        segments, tombstones = self._deltas
+        live = np.concatenate(
+            [np.asarray(self.live, dtype=bool)] + [np.ones(len(s.doc_ids), dtype=bool) for s in segments]
+        )
+        return self._merged([self, *segments], 0, live, sorted(tombstones))
+
+    def _merged(self, segs: List["BM25Local"], base: int, live: np.ndarray, dead: List[int]) -> "BM25Local":
+        vocab: Dict[str, int] = {}
+        terms, docs, tfs, doc_len, doc_ids = [], [], [], [], []
+        for seg in segs:
+            local = np.fromiter((vocab.setdefault(t, len(vocab)) for t in seg.vocab), dtype=np.int32, count=len(seg.vocab))
+            terms.append(np.repeat(local, np.diff(seg.indptr)))
+            docs.append(np.asarray(seg.postings, dtype=np.int32) + (seg.base - base))
+            tfs.append(np.asarray(seg.tfs))
+            doc_len.append(np.asarray(seg.doc_len))
+            doc_ids.extend(seg.doc_ids)
+        live = live.copy()
+        live[dead] = False
+        docs_a = np.concatenate(docs)
+        keep = live[docs_a]
+        out = BM25Local(self.k1, self.b, self.epsilon)
+        out.doc_ids = doc_ids
+        out.live = live
+        doc_len_a = np.concatenate(doc_len).astype(np.float32)
+        doc_len_a[~live] = 0.0
+        out._finalize(vocab, np.concatenate(terms)[keep], docs_a[keep], np.concatenate(tfs)[keep], doc_len_a)
+        return out
 
+    # ---- persistence ----
     def save(self, path: str):
-        with open(path, "wb") as f:
-            pickle.dump({"doc_ids": self.doc_ids, "bm25": self.bm25}, f)
+        """Write the index as a directory of flat columns (no pickle). Pending deltas must be compacted first."""
+        if self.segments or self.tombstones:
+            raise ValueError("BM25 index has pending deltas; save compacted() instead")
+        final = Path(path)
+        tmp = final.with_name(final.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)  # leftovers from an interrupted save
+        tmp.mkdir(parents=True)
+        for name in _ARRAYS:
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        write_string_table(tmp, "vocab", list(self.vocab))
+        write_string_table(tmp, "doc_ids", self.doc_ids)
+        write_manifest(tmp, {
+            "format": FORMAT,
+            "k1": self.k1,
+            "b": self.b,
+            "epsilon": self.epsilon,
+            "avgdl": self.avgdl,
+            "n_docs": self.n_docs,
+            "idf_floor": self.idf_floor,
+            "n_terms": len(self.vocab),
+        })
+        replace_dir(tmp, final)
 
     def load(self, path: str):
-        with open(path, "rb") as f:
-            obj = pickle.load(f)
-        self.doc_ids = obj["doc_ids"]
-        self.bm25 = obj["bm25"]
+        """Memory-map a saved index; nothing is copied onto the heap."""
+        p = Path(path)
+        manifest = read_manifest(p)
+        if manifest.get("format") != FORMAT:
+            raise ValueError(f"Unsupported BM25 index format in {p}: {manifest.get('format')}")
+        self.k1, self.b, self.epsilon = manifest["k1"], manifest["b"], manifest["epsilon"]
+        self.avgdl = manifest["avgdl"]
+        names = [n for n in _ARRAYS if (p / f"{n}.npy").exists()]
+        for name, arr in load_arrays(p, names).items():
+            setattr(self, name, arr)
+        self.vocab = open_string_table(p, "vocab")
+        self.doc_ids = open_string_table(p, "doc_ids")
+        if "live" not in names:
+            self.live = np.ones(len(self.doc_ids), dtype=bool)
+        self.n_docs = manifest.get("n_docs", len(self.doc_ids))
+        self.idf_floor = manifest.get("idf_floor", 0.0)
+        self._deltas, self._slots = ((), frozenset()), None
@@ -0,0 +1,83 @@
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+_HEADING = re.compile(r"^[A-Z][A-Za-z0-9 ,/&\\-]{2,}$")
+
+def clause_spans(text: str) -> List[Tuple[str, str, int, int]]:
+    """
+    (clause id, heading, start, end) per clause: a clause runs from a
+    heading line (all caps, or capitalized with only letters, digits,
+    spaces and , / & -) to the next one. Without headings the text is one
+    clause.
+    """
+    lines = text.splitlines()
+    offsets: List[int] = []
+    pos = 0
+    for ln in lines:
+        offsets.append(pos)
+        pos += len(ln) + 1  # + newline
+    heads = [i for i, ln in enumerate(lines) if ln.strip() and (ln.isupper() or _HEADING.match(ln.strip()))]
+    if not heads:
+        return [("C1", lines[0].strip() if lines else "Document", 0, len(text))]
+    spans = []
+    for idx, start_i in enumerate(heads):
+        end_i = heads[idx + 1] if idx + 1 < len(heads) else len(lines)
+        end = offsets[end_i - 1] + len(lines[end_i - 1]) + 1 if end_i - 1 < len(offsets) else len(text)
+        spans.append((f"C{idx + 1}", lines[start_i].strip() or f"Clause {idx + 1}", offsets[start_i], end))
+    return spans
+
+def _windows(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    """Split [start, end) into pieces of at most `max_chars`, cutting at whitespace where possible."""
+    out = []
+    while end - start > max_chars:
+        cut = start + max_chars
+        ws = max(text.rfind(" ", start + max_chars // 2, cut), text.rfind("\n", start + max_chars // 2, cut))
+        cut = ws + 1 if ws > start else cut
+        out.append((start, cut))
+        start = cut
+    out.append((start, end))
+    return out
+
+def contract_passages(doc_id: str, text: str, max_chars: int = 1500) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    (passage_id, start, end, heading) for every clause found by
+    clause_spans; clauses longer than `max_chars` are split into windows
+    so none is truncated by the encoder. Offsets index into `text`.
+    """
+    for clause_id, heading, start, end in clause_spans(text):
+        pieces = _windows(text, start, min(end, len(text)), max_chars)
+        for j, (lo, hi) in enumerate(pieces):
+            if not text[lo:hi].strip():
+                continue
+            pid = f"{doc_id}#{clause_id}" if len(pieces) == 1 else f"{doc_id}#{clause_id}.{j + 1}"
+            yield pid, lo, hi, heading
+
+def iter_cuad_passages(cuad: Path, max_chars: int = 1500) -> Iterator[Tuple[str, str, Dict]]:
+    """
+    Stream (passage_id, text, docs_meta entry) over CUAD full_contract_txt;
+    each entry carries the parent contract id and the clause's character
+    offsets in the contract text.
+    """
+    for fp in sorted((cuad / "full_contract_txt").glob("*.txt")):
+        doc_id = f"cuad/{fp.stem}"
+        title = re.sub(r"[_\s]+", " ", fp.stem).strip()
+        text = fp.read_text(encoding="utf-8", errors="ignore")
+        for pid, lo, hi, heading in contract_passages(doc_id, text, max_chars):
+            passage = text[lo:hi]
+            yield pid, passage, {
+                "parent": doc_id,
+                "clause_start": lo,
+                "clause_end": hi,
+                "title": f"{title} - {heading[:80]}",
+                "snippet": " ".join(passage.split())[:300],
+                "path": str(fp),
+                "source": "cuad",
+            }
+
+def cuad_contract_meta(cuad: Path) -> Dict[str, Dict]:
+    """docs_meta entries for the parent contracts themselves."""
+    return {
+        f"cuad/{fp.stem}": {"title": re.sub(r"[_\s]+", " ", fp.stem).strip(), "path": str(fp), "source": "cuad"}
+        for fp in sorted((cuad / "full_contract_txt").glob("*.txt"))
+    }
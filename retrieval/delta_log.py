@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, Iterator, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+# updates made through the API: every worker appends to / replays the log; compaction folds it into a
+# published generation and moves its entries to the archive, which full rebuilds read them back from
+LOG = "delta_log.jsonl"
+ARCHIVE = "delta_archive.jsonl"
+LOCK = "delta_log.lock"
+
+@contextmanager
+def file_lock(path: Path):
+    """Exclusive lock shared by every worker process on this host."""
+    with open(path, "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+def doc_entry(doc: Dict) -> Dict:
+    """The doc store entry of an upserted document."""
+    return {
+        **(doc.get("meta") or {}),
+        "title": doc.get("title") or doc["doc_id"],
+        "snippet": doc.get("snippet") or doc["text"][:300],
+        "path": doc.get("path"),
+        "source": doc.get("source") or "acord",
+    }
+
+def iter_ops(lines: Iterable[bytes]) -> Iterator[Dict]:
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+def _read(path: Path) -> bytes:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return b""
+
+def _write(path: Path, data: bytes):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+def position(root: Path) -> int:
+    """
+    End of the archive-then-log stream of every API update so far (caller
+    holds the lock). Compaction only moves entries from the log to the end
+    of the archive, so the stream is append-only and its first `position`
+    bytes stay the same after the lock is released.
+    """
+    return sum((root / name).stat().st_size for name in (ARCHIVE, LOG) if (root / name).exists())
+
+def _stream(root: Path, end: int) -> Iterator[Dict]:
+    """Entries in the first `end` bytes of the archive-then-log stream, read line by line."""
+    left = end
+    for name in (ARCHIVE, LOG):
+        try:
+            fh = open(root / name, "rb")
+        except FileNotFoundError:
+            continue
+        with fh:
+            for line in fh:
+                if left <= 0:
+                    return
+                left -= len(line)
+                yield from iter_ops([line])
+
+def spool(root: Path, end: int, path: Path):
+    """
+    Write the net effect of the first `end` bytes of updates to `path`,
+    as archive entries: one delete of the ids deleted (a deleted contract
+    takes its passages with it), then one upsert per document still live
+    (last write wins; a later upsert revives a deleted id). Two passes
+    over the stream, so only ids are held, never texts.
+    """
+    last: Dict[str, int] = {}  # doc id -> number of its last upsert
+    parents: Dict[str, str] = {}
+    gone: Set[str] = set()
+    n = 0
+    for op in _stream(root, end):
+        if op["op"] == "upsert":
+            for doc in op["docs"]:
+                d = doc["doc_id"]
+                last[d], n = n, n + 1
+                gone.discard(d)
+                parent = (doc.get("meta") or {}).get("parent")
+                if parent:
+                    parents[d] = parent
+                else:
+                    parents.pop(d, None)
+        elif op["op"] == "delete":
+            ids = set(op["doc_ids"])
+            ids |= {d for d, parent in parents.items() if parent in ids}
+            for d in ids:
+                last.pop(d, None)
+                parents.pop(d, None)
+            gone |= ids
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as out:
+        if gone:
+            out.write(json.dumps({"op": "delete", "doc_ids": sorted(gone)}, ensure_ascii=False) + "\n")
+        n = 0
+        for op in _stream(root, end):
+            if op["op"] != "upsert":
+                continue
+            for doc in op["docs"]:
+                if last.get(doc["doc_id"]) == n:
+                    out.write(json.dumps({"op": "upsert", "docs": [doc]}, ensure_ascii=False) + "\n")
+                n += 1
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, path)
+
+def spooled_ids(path: Path) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """(ids upserted, ids deleted) in a spool() file."""
+    docs, gone = set(), set()
+    with open(path, "rb") as fh:
+        for op in iter_ops(fh):
+            if op["op"] == "upsert":
+                docs.update(doc["doc_id"] for doc in op["docs"])
+            else:
+                gone.update(op["doc_ids"])
+    return frozenset(docs), frozenset(gone)
+
+def spooled_docs(path: Path) -> Iterator[Dict]:
+    """The documents upserted in a spool() file, streamed."""
+    with open(path, "rb") as fh:
+        for op in iter_ops(fh):
+            if op["op"] == "upsert":
+                yield from op["docs"]
+
+def archive(root: Path):
+    """
+    Move the log's entries to the archive once a published generation
+    contains them (caller holds the lock). A new, empty log inode tells
+    other workers to reload instead of replaying.
+    """
+    data = _read(root / LOG)
+    if data:
+        with open(root / ARCHIVE, "ab") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+    _write(root / LOG, b"")
+
+def rebase(root: Path, end: int, spooled: Path, publish):
+    """
+    Publish a full rebuild that contains the updates `spooled` from the
+    first `end` bytes (caller holds the lock): the spool file becomes the
+    archive and the log keeps only what came after `end`, which workers
+    replay on top of the rebuilt generation.
+    """
+    rest = root / (LOG + ".rebase")
+    with open(rest, "wb") as out:
+        skip = end
+        for name in (ARCHIVE, LOG):
+            try:
+                fh = open(root / name, "rb")
+            except FileNotFoundError:
+                continue
+            with fh:
+                size = os.fstat(fh.fileno()).st_size
+                if skip >= size:
+                    skip -= size
+                    continue
+                fh.seek(skip)
+                skip = 0
+                shutil.copyfileobj(fh, out)
+        out.flush()
+        os.fsync(out.fileno())
+    # archive first: until the log is cut, its entries are in both, and replaying them twice is harmless
+    os.replace(spooled, root / ARCHIVE)
+    publish()
+    os.replace(rest, root / LOG)
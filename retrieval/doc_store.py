@@ -0,0 +1,220 @@
+import bisect
+import hashlib
+import heapq
+import json
+import shutil
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from retrieval.mmap_io import load_arrays, open_string_table, read_manifest, replace_dir, write_manifest, write_string_table
+
+FORMAT = "doc-store-v1"
+LEGACY_FILE = "docs_meta.json"
+_SEP = "\x00"
+# write() sorts unsorted input in runs of this many entries; more than one run is spilled to disk and merged
+SORT_RUN_SIZE = 100000
+
+def _encode(meta: Dict) -> str:
+    return json.dumps(meta, ensure_ascii=False, separators=(",", ":"))
+
+def _hash(doc_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _sorted_rows(items: Iterable[Tuple[str, Dict]], workdir: Path,
+                 run_size: int) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """(doc_id, encoded meta, parent) of `items` in id order, the last duplicate of an id winning."""
+    def run(chunk, start):
+        return sorted(((d, start + i, _encode(meta), meta.get("parent")) for i, (d, meta) in enumerate(chunk)),
+                      key=lambda r: (r[0], r[1]))
+
+    it = iter(items)
+    first = list(islice(it, run_size))
+    nxt = list(islice(it, run_size))
+    if not nxt:
+        merged = iter(run(first, 0))
+        files = []
+    else:
+        # external merge sort: only one run is in memory at a time
+        workdir.mkdir(parents=True, exist_ok=True)
+        chunk, paths, seq = first, [], 0
+        while chunk:
+            paths.append(workdir / f"run_{len(paths):05d}.jsonl")
+            with open(paths[-1], "w", encoding="utf-8") as fh:
+                fh.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in run(chunk, seq))
+            seq += len(chunk)
+            chunk, nxt = nxt, list(islice(it, run_size))
+        files = [open(p, encoding="utf-8") for p in paths]
+        merged = heapq.merge(*(map(json.loads, fh) for fh in files), key=lambda r: (r[0], r[1]))
+    try:
+        prev = None
+        for row in merged:
+            if prev is not None and prev[0] != row[0]:
+                yield prev[0], prev[2], prev[3]
+            prev = row
+        if prev is not None:
+            yield prev[0], prev[2], prev[3]
+    finally:
+        for fh in files:
+            fh.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+class DocStore:
+    """
+    Per-document metadata (title, snippet, path, source, filter fields,
+    parent) read on demand instead of held as Python objects: JSON records
+    in a memory-mapped string table, sorted by doc id, with a sorted 64-bit
+    hash -> position index, so a lookup is one searchsorted plus one decode
+    and resident memory does not grow with the corpus. A sorted
+    "parent\\0child" table finds a contract's passages.
+
+    Runtime upserts and deletes go to a small overlay (None = deleted);
+    with_updates() / without() return a new store sharing the mapped files,
+    so readers keep a consistent view. save() writes the merged store.
+    """
+
+    def __init__(self, ids=(), records=(), children=(), overlay: Optional[Dict[str, Optional[Dict]]] = None,
+                 hashes: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        self._ids = ids
+        self._records = records
+        self._children = children
+        self._overlay: Dict[str, Optional[Dict]] = overlay or {}
+        self._hashes = hashes  # (sorted id hashes, position of each in ids)
+
+    def _find(self, doc_id: str) -> int:
+        if self._hashes is None:
+            i = bisect.bisect_left(self._ids, doc_id)
+            return i if i < len(self._ids) and self._ids[i] == doc_id else -1
+        keys, pos = self._hashes
+        h = np.uint64(_hash(doc_id))
+        j = int(np.searchsorted(keys, h))
+        while j < len(keys) and keys[j] == h:
+            if self._ids[int(pos[j])] == doc_id:
+                return int(pos[j])
+            j += 1
+        return -1
+
+    def get(self, doc_id: str, default=None) -> Optional[Dict]:
+        if doc_id in self._overlay:
+            meta = self._overlay[doc_id]
+            return default if meta is None else meta
+        i = self._find(doc_id)
+        return default if i < 0 else json.loads(self._records[i])
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+    def __len__(self) -> int:
+        n = len(self._ids)
+        for d, meta in self._overlay.items():
+            n += (meta is not None) - (self._find(d) >= 0)
+        return n
+
+    def children(self, parent: str) -> List[str]:
+        """Doc ids whose metadata names `parent` (a contract's passages)."""
+        prefix = parent + _SEP
+        out = []
+        i = bisect.bisect_left(self._children, prefix)
+        while i < len(self._children):
+            entry = self._children[i]
+            if not entry.startswith(prefix):
+                break
+            out.append(entry[len(prefix):])
+            i += 1
+        # the overlay may have added, re-parented or deleted passages
+        out = [d for d in out if d not in self._overlay]
+        out += [d for d, meta in self._overlay.items() if meta is not None and meta.get("parent") == parent]
+        return out
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        """(doc_id, meta) in doc id order, overlay applied; streamed from the mapped files."""
+        pending = sorted(self._overlay)
+        j = 0
+        for i, d in enumerate(self._ids):
+            while j < len(pending) and pending[j] < d:
+                if self._overlay[pending[j]] is not None:
+                    yield pending[j], self._overlay[pending[j]]
+                j += 1
+            if j < len(pending) and pending[j] == d:
+                j += 1
+                if self._overlay[d] is not None:
+                    yield d, self._overlay[d]
+                continue
+            yield d, json.loads(self._records[i])
+        for d in pending[j:]:
+            if self._overlay[d] is not None:
+                yield d, self._overlay[d]
+
+    def with_updates(self, entries: Dict[str, Dict]) -> "DocStore":
+        return DocStore(self._ids, self._records, self._children, {**self._overlay, **entries}, self._hashes)
+
+    def without(self, doc_ids: Iterable[str]) -> "DocStore":
+        return DocStore(self._ids, self._records, self._children, {**self._overlay, **{d: None for d in doc_ids}},
+                        self._hashes)
+
+    @property
+    def pending(self) -> int:
+        """Overlay entries not yet written by save()."""
+        return len(self._overlay)
+
+    # ---- persistence ----
+    def save(self, path: str):
+        self.write(path, self.items(), presorted=True)
+
+    @staticmethod
+    def write(path: str, items: Iterable[Tuple[str, Dict]], presorted: bool = False):
+        """
+        Write (doc_id, meta) pairs as a store under `path`; later duplicates
+        of an id win. Unless `presorted`, the pairs are sorted through runs
+        spilled to disk, so memory does not grow with the number of documents.
+        """
+        final = Path(path)
+        tmp = final.with_name(final.name + ".tmp")
+        if tmp.exists():
+            replace_dir(tmp, tmp.with_name(tmp.name + ".stale"))
+        tmp.mkdir(parents=True)
+        if presorted:
+            rows = ((d, _encode(meta), meta.get("parent")) for d, meta in items)
+        else:
+            rows = _sorted_rows(items, tmp / "runs", SORT_RUN_SIZE)
+        ids: List[str] = []
+        children: List[str] = []
+
+        def records() -> Iterator[str]:
+            for d, record, parent in rows:
+                ids.append(d)
+                if parent:
+                    children.append(f"{parent}{_SEP}{d}")
+                yield record
+
+        write_string_table(tmp, "records", records())
+        write_string_table(tmp, "ids", ids)
+        write_string_table(tmp, "children", sorted(children))
+        keys = np.fromiter((_hash(d) for d in ids), dtype=np.uint64, count=len(ids))
+        order = np.argsort(keys, kind="stable")
+        np.save(tmp / "hash_keys.npy", keys[order])
+        np.save(tmp / "hash_pos.npy", order.astype(np.int64))
+        write_manifest(tmp, {"format": FORMAT, "docs": len(ids)})
+        replace_dir(tmp, final)
+
+    @classmethod
+    def load(cls, path: str) -> "DocStore":
+        p = Path(path)
+        manifest = read_manifest(p)
+        if manifest.get("format") != FORMAT:
+            raise ValueError(f"Unsupported doc store format in {p}: {manifest.get('format')}")
+        cols = load_arrays(p, ["hash_keys", "hash_pos"])
+        return cls(open_string_table(p, "ids"), open_string_table(p, "records"), open_string_table(p, "children"),
+                   hashes=(cols["hash_keys"], cols["hash_pos"]))
+
+    @classmethod
+    def open(cls, gen_dir: Path) -> "DocStore":
+        """The store of a generation directory; older ones only have docs_meta.json (held in memory)."""
+        if (gen_dir / "docs" / "manifest.json").exists():
+            return cls.load(str(gen_dir / "docs"))
+        if (gen_dir / LEGACY_FILE).exists():
+            try:
+                return cls(overlay=json.loads((gen_dir / LEGACY_FILE).read_text()))
+            except Exception:
+                pass
+        return cls()
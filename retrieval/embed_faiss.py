@@ -1,49 +1,562 @@
+import copy
 import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, replace
 from pathlib import Path
-from typing import List, Tuple
+from itertools import islice
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+from retrieval.cache import LRUCache
+from retrieval.embedding_store import EmbeddingStore
+from retrieval.encoders import load_encoder
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "pq")
+# how flat / ivf_flat / hnsw store full vectors: float32, float16 or 8-bit scalar quantization
+STORAGE_TYPES = ("fp32", "fp16", "sq8")
+# maps the vector codes of every index type (IO_FLAG_MMAP alone only covers IVF lists)
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
 
 def _normalize(x: np.ndarray) -> np.ndarray:
     x = x.astype("float32")
     faiss.normalize_L2(x)
     return x
 
+@dataclass
+class IndexConfig:
+    """
+    FAISS index layout. `flat` is exact brute force; the others trade recall
+    for speed/memory, as does fp16 / sq8 `storage`. nprobe / hnsw_ef_search
+    and `mmap` are query-time knobs and are re-applied on load, the rest are
+    fixed when the index is built.
+    """
+    index_type: str = "flat"
+    nlist: int = 1024
+    nprobe: int = 16
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    pq_m: int = 16
+    pq_nbits: int = 8
+    storage: str = "fp32"
+    # open saved indices memory-mapped: workers share the page cache instead of each holding a copy
+    mmap: bool = False
+
+    @classmethod
+    def from_settings(cls, settings) -> "IndexConfig":
+        return cls(
+            index_type=settings.FAISS_INDEX_TYPE.lower(),
+            nlist=settings.FAISS_NLIST,
+            nprobe=settings.FAISS_NPROBE,
+            hnsw_m=settings.FAISS_HNSW_M,
+            hnsw_ef_construction=settings.FAISS_HNSW_EF_CONSTRUCTION,
+            hnsw_ef_search=settings.FAISS_HNSW_EF_SEARCH,
+            pq_m=settings.FAISS_PQ_M,
+            pq_nbits=settings.FAISS_PQ_NBITS,
+            storage=settings.FAISS_STORAGE.lower(),
+            mmap=settings.FAISS_MMAP,
+        )
+
+    def for_corpus(self, n: int, dim: int) -> "IndexConfig":
+        """Clamp build parameters so small corpora can still be trained."""
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type {self.index_type!r}; expected one of {INDEX_TYPES}")
+        if self.storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown FAISS storage {self.storage!r}; expected one of {STORAGE_TYPES}")
+        cfg = replace(self)
+        if cfg.index_type in ("ivf_pq", "pq"):
+            # product quantization already compresses the vectors
+            cfg.storage = "fp32"
+        if cfg.index_type in ("ivf_flat", "ivf_pq"):
+            # k-means wants ~39 points per centroid
+            cfg.nlist = max(1, min(cfg.nlist, n // 39))
+            cfg.nprobe = min(cfg.nprobe, cfg.nlist)
+        if cfg.index_type in ("ivf_pq", "pq"):
+            while dim % cfg.pq_m:
+                cfg.pq_m -= 1
+            if n < 2 ** cfg.pq_nbits:
+                logger.warning("Corpus of %d vectors is too small to train PQ%dx%d; using a flat index",
+                               n, cfg.pq_m, cfg.pq_nbits)
+                cfg.index_type, cfg.storage = "flat", "fp32"
+        return cfg
+
+    def train_size(self) -> int:
+        """Vectors to buffer before the index can be trained (0: no training needed)."""
+        size = 0
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            size = 39 * self.nlist
+        if self.index_type in ("ivf_pq", "pq"):
+            size = max(size, 39 * 2 ** self.pq_nbits)
+        return size
+
+    def factory_string(self) -> str:
+        codec = {"fp32": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}[self.storage]
+        return {
+            "flat": codec,
+            "ivf_flat": f"IVF{self.nlist},{codec}",
+            "ivf_pq": f"IVF{self.nlist},PQ{self.pq_m}x{self.pq_nbits}",
+            "hnsw": f"HNSW{self.hnsw_m},{codec}",
+            "pq": f"PQ{self.pq_m}x{self.pq_nbits}",
+        }[self.index_type]
+
+    def filtered_params(self, sel, n_allowed: int, exact_max: int):
+        """
+        Per-query SearchParameters carrying an IDSelector. They replace the
+        index's own nprobe/efSearch, so those are set again; IVF scans every
+        list for selective filters, which keeps the top-k exact there.
+        """
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            nprobe = self.nlist if n_allowed <= exact_max else self.nprobe
+            return faiss.SearchParametersIVF(sel=sel, nprobe=nprobe)
+        if self.index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=sel, efSearch=self.hnsw_ef_search)
+        return faiss.SearchParameters(sel=sel)
+
+    def apply_search_params(self, index):
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            faiss.extract_index_ivf(index).nprobe = self.nprobe
+        elif self.index_type == "hnsw":
+            _unwrap(index).hnsw.efSearch = self.hnsw_ef_search
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _keyed_by_id(index) -> bool:
+    return isinstance(index, faiss.IndexIDMap) or faiss.try_extract_index_ivf(index) is not None
+
+def _unwrap(index):
+    """The index inside an IndexIDMap wrapper (or the index itself)."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def _code_size(index) -> int:
+    """Bytes stored per vector by `index` (ids and graph links not included)."""
+    inner = faiss.downcast_index(_unwrap(index))
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    return int((faiss.try_extract_index_ivf(inner) or inner).code_size)
+
+def _search_subset(index, inner, qv: np.ndarray, k: int, allow: np.ndarray):
+    """Exhaustive inner-product top-k over the allowed ids of an HNSW index's storage."""
+    ids = faiss.vector_to_array(index.id_map) if isinstance(index, faiss.IndexIDMap) else np.arange(inner.ntotal)
+    pos = np.flatnonzero(allow[np.clip(ids, 0, len(allow) - 1)] & (ids < len(allow)))
+    storage = faiss.downcast_index(inner.storage)
+    if isinstance(storage, faiss.IndexFlat):
+        xb = faiss.rev_swig_ptr(storage.get_xb(), storage.ntotal * storage.d).reshape(storage.ntotal, storage.d)[pos]
+    else:
+        # fp16 / sq8 codes: decoded, so scores match what the graph search computes
+        xb = storage.reconstruct_batch(pos)
+    scores = qv @ xb.T
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, top, axis=1).astype(np.float32), ids[pos][top].astype(np.int64)
+
+def build_index(emb: np.ndarray, cfg: IndexConfig, ids: Optional[np.ndarray] = None):
+    """
+    Create, train (IVF/PQ) and fill an inner-product index for normalized
+    `emb`. With `ids` the vectors are keyed by them: IVF indices store ids
+    natively, the others are wrapped in IndexIDMap2.
+    """
+    cfg = cfg.for_corpus(len(emb), emb.shape[1])
+    index = faiss.index_factory(emb.shape[1], cfg.factory_string(), faiss.METRIC_INNER_PRODUCT)
+    if cfg.index_type == "hnsw":
+        index.hnsw.efConstruction = cfg.hnsw_ef_construction
+    if not index.is_trained:
+        index.train(emb)
+    if ids is None:
+        index.add(emb)
+    else:
+        # IndexIDMap over IVF mis-maps ids after remove_ids, so IVF keeps its own
+        if faiss.try_extract_index_ivf(index) is None:
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(emb, ids)
+    cfg.apply_search_params(index)
+    return index, cfg
+
+class VectorSample:
+    """Uniform random sample of at most `size` rows of a stream of vector chunks (reservoir sampling)."""
+
+    def __init__(self, size: int, seed: int = 0):
+        self.size, self.seen = size, 0
+        self.rng = np.random.default_rng(seed)
+        self.rows: Optional[np.ndarray] = None
+
+    def add(self, emb: np.ndarray):
+        if self.rows is None:
+            self.rows = np.zeros((self.size, emb.shape[1]), dtype=np.float32)
+        n = self.seen + np.arange(len(emb))
+        self.seen += len(emb)
+        fill = n < self.size
+        self.rows[n[fill]] = emb[fill]
+        # past the first `size`, row n replaces a random pick with probability size / (n + 1)
+        j = self.rng.integers(0, n[~fill] + 1)
+        keep = j < self.size
+        self.rows[j[keep]] = emb[~fill][keep]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self.rows is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.rows[:min(self.seen, self.size)]
+
+def ann_report(index, flat, qv: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """recall@k of `index` against exact `flat` search, plus single-query latency for both."""
+    def per_query(idx) -> Tuple[np.ndarray, np.ndarray]:
+        ids, lat = [], []
+        for row in qv:
+            t0 = time.perf_counter()
+            _, I = idx.search(row[None, :], k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            ids.append(I[0])
+        return np.stack(ids), np.asarray(lat)
+
+    ann_ids, ann_lat = per_query(index)
+    exact_ids, exact_lat = per_query(flat)
+    hits = [len(set(a[a != -1]) & set(e[e != -1])) / max(1, (e != -1).sum()) for a, e in zip(ann_ids, exact_ids)]
+    return {
+        f"recall@{k}": float(np.mean(hits)) if hits else 0.0,
+        "p50_ms": float(np.percentile(ann_lat, 50)) if len(ann_lat) else 0.0,
+        "p95_ms": float(np.percentile(ann_lat, 95)) if len(ann_lat) else 0.0,
+        "flat_p50_ms": float(np.percentile(exact_lat, 50)) if len(exact_lat) else 0.0,
+        "queries": int(len(qv)),
+    }
+
 class EmbedFAISS:
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    """
+    Dense retrieval over a FAISS index keyed by the same internal slots
+    BM25Local assigns. The main index is never
+    mutated while serving: add() copies a small exact `delta` index with the
+    new vectors and swaps it in, delete() swaps in a grown tombstone set
+    (filtered at query time), and compacted() folds both into the main
+    index of a new instance. HNSW cannot remove vectors, so its tombstones
+    persist until the next full build.
+    """
+
+    # filtered searches selecting at most this many documents are scored exhaustively
+    exact_filter_max = 20000
+
+    def __init__(self, model_name: str, config: Optional[IndexConfig] = None, query_cache_size: int = 1024,
+                 store: Optional[EmbeddingStore] = None, model_loader: Optional[Callable[[], Any]] = None,
+                 backend: str = "torch"):
+        self.model_name = model_name
+        self.backend = backend  # torch | torch_int8 | onnx, see retrieval.encoders
+        # the encoder is only loaded when something is encoded; a loader
+        # (e.g. the model registry) may own it instead of this instance
+        self._model_loader = model_loader
+        self._model = None
+        self.config = config or IndexConfig()
+        # document texts are looked up here first, so only new/changed texts hit the model
+        self.store = store
+        # normalized query text -> unit query vector; independent of the index, so it survives reloads
+        self.query_cache = LRUCache(query_cache_size)
         self.index = None
-        self.doc_ids: List[str] = []
+        self.delta = None  # IndexIDMap2(IndexFlatIP) of vectors added since the last compaction
+        self.doc_ids: List[str] = []  # slot -> doc id, append-only
+        self.tombstones: FrozenSet[int] = frozenset()
+        self.mapped = False  # the main index was opened memory-mapped
+        self._pending: List[np.ndarray] = []  # vectors buffered during a build until the index can be trained
+
+    @property
+    def model(self):
+        if self._model_loader is not None:
+            return self._model_loader()
+        if self._model is None:
+            self._model = load_encoder(self.model_name, self.backend)
+        return self._model
+
+    def encode_corpus(self, texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
+        def encode(batch: List[str]) -> np.ndarray:
+            return _normalize(self.model.encode(batch, show_progress_bar=show_progress_bar, convert_to_numpy=True))
+
+        if self.store is None:
+            return encode(texts)
+        return self.store.encode(texts, encode)
+
+    def build(self, items: Iterable[Tuple[str, str]], chunk_size: int = 8192, sample: Optional[VectorSample] = None):
+        """
+        Encode and index `items` chunk by chunk: each chunk's vectors go
+        straight into the index (IVF/PQ first buffer enough to train), so
+        only one chunk of text is held at a time. The vectors are also fed
+        to `sample`, if given (for the build's recall report).
+        """
+        self.start_build()
+        for chunk in _chunked(items, chunk_size):
+            emb = self.encode_corpus([t for _, t in chunk])
+            if sample is not None:
+                sample.add(emb)
+            self.build_add([d for d, _ in chunk], emb)
+        self.finish_build()
+
+    def start_build(self):
+        """Reset to an empty index; vectors then come in through build_add() until finish_build()."""
+        self.doc_ids, self.tombstones, self.delta, self.index = [], frozenset(), None, None
+        self.mapped = False
+        self._pending = []
 
-    def build(self, items: List[Tuple[str, str]]):
-        self.doc_ids = [i[0] for i in items]
-        texts = [i[1] for i in items]
-        emb = self.model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-        emb = _normalize(emb)
-        self.index = faiss.IndexFlatIP(emb.shape[1])
-        self.index.add(emb)
+    def build_add(self, doc_ids: List[str], emb: np.ndarray):
+        """Index the normalized vectors of `doc_ids` as the next slots of the index being built."""
+        start = len(self.doc_ids)
+        self.doc_ids.extend(doc_ids)
+        if self.index is not None:
+            self.index.add_with_ids(emb, np.arange(start, start + len(emb), dtype=np.int64))
+            return
+        self._pending.append(emb)
+        if sum(len(p) for p in self._pending) >= self.config.train_size():
+            self._start_index(np.vstack(self._pending))
+            self._pending = []
+
+    def finish_build(self):
+        if self._pending:
+            # corpus smaller than the training sample; for_corpus() clamps the layout to it
+            self._start_index(np.vstack(self._pending))
+            self._pending = []
+
+    def _start_index(self, emb: np.ndarray):
+        self.index, self.config = build_index(emb, self.config, ids=np.arange(len(emb), dtype=np.int64))
 
     def query(self, q: str, k: int = 10) -> List[Tuple[str, float]]:
-        if self.index is None:
-            return []
-        qv = self.model.encode([q], convert_to_numpy=True)
-        qv = _normalize(qv)
-        D, I = self.index.search(qv, k)
-        res = []
-        for idx, score in zip(I[0], D[0]):
-            if idx == -1:
-                continue
-            res.append((self.doc_ids[idx], float(score)))
-        return res
+        return self.query_many([q], k=k)[0]
+
+    def encode_queries(self, queries: List[str], batch_size: int = 64) -> np.ndarray:
+        """Unit query vectors; only texts missing from the LRU cache are sent to the model."""
+        keys = [" ".join(q.split()) for q in queries]
+        cached = [self.query_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, v in zip(keys, cached) if v is None))
+        if missing:
+            enc = _normalize(self.model.encode(missing, batch_size=batch_size, convert_to_numpy=True))
+            fresh = dict(zip(missing, enc))
+            for key, v in fresh.items():
+                self.query_cache.put(key, v)
+            cached = [v if v is not None else fresh[key] for key, v in zip(keys, cached)]
+        if not cached:
+            dim = self.index.d if self.index is not None else self.model.get_sentence_embedding_dimension()
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.stack(cached)
+
+    def query_many(
+        self, queries: List[str], k: int = 10, allow: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """One batched encode and one index.search over the whole query matrix."""
+        if (self.index is None and self.delta is None) or not queries:
+            return [[] for _ in queries]
+        return self.search_vectors(self.encode_queries(queries), k=k, allow=allow)
+
+    def query_slots(
+        self, queries: List[str], k: int = 10, allow: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """query_many() as (slots, scores) arrays per query."""
+        if (self.index is None and self.delta is None) or not queries:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        return self.search_slots(self.encode_queries(queries), k=k, allow=allow)
+
+    def search_vectors(
+        self, qv: np.ndarray, k: int = 10, allow: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """Top-k per query row; `allow` (bool per slot) restricts the search to the selected documents."""
+        return [
+            [(self.doc_ids[i], float(s)) for i, s in zip(slots.tolist(), scores)]
+            for slots, scores in self.search_slots(qv, k=k, allow=allow)
+        ]
+
+    def search_slots(
+        self, qv: np.ndarray, k: int = 10, allow: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search_vectors() as (slots, scores) arrays per query row, best first."""
+        # snapshot the references once; writers swap them rather than mutate
+        index, delta, dead = self.index, self.delta, self.tombstones
+        indices = [ix for ix in (index, delta) if ix is not None and ix.ntotal]
+        dead_a = np.fromiter(dead, dtype=np.int64, count=len(dead))
+        if allow is None:
+            fetch = k + len(dead)  # over-fetch so tombstoned hits can be dropped
+            parts = [ix.search(qv, min(fetch, ix.ntotal)) for ix in indices]
+        else:
+            allow = np.array(allow[: len(self.doc_ids)], dtype=bool)
+            allow[dead_a] = False
+            dead_a = dead_a[:0]
+            parts = [self._search_filtered(ix, qv, k, allow) for ix in indices]
+        if not parts:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in qv]
+        D = np.hstack([p[0] for p in parts])
+        I = np.hstack([p[1] for p in parts])
+        if len(parts) > 1:
+            order = np.argsort(-D, axis=1, kind="stable")
+            D = np.take_along_axis(D, order, axis=1)
+            I = np.take_along_axis(I, order, axis=1)
+        keep = (I != -1) & ~np.isin(I, dead_a)
+        return [(row_i[ok][:k], row_d[ok][:k]) for row_i, row_d, ok in zip(I, D, keep)]
+
+    def _search_filtered(self, index, qv: np.ndarray, k: int, allow: np.ndarray):
+        n_allowed = int(allow.sum())
+        if not n_allowed:
+            return np.zeros((len(qv), 0), dtype=np.float32), np.zeros((len(qv), 0), dtype=np.int64)
+        k = min(k, n_allowed, index.ntotal)
+        inner = _unwrap(index)
+        if isinstance(inner, faiss.IndexHNSW) and n_allowed <= self.exact_filter_max:
+            # filtered graph walks lose recall when few nodes qualify; score the few exactly
+            return _search_subset(index, inner, qv, k, allow)
+        bitmap = np.packbits(allow, bitorder="little")
+        sel = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        try:
+            return index.search(qv, k, params=self.config.filtered_params(sel, n_allowed, self.exact_filter_max))
+        except RuntimeError:
+            # IndexPQ takes no search parameters: over-fetch in proportion to the filter's selectivity
+            fetch = min(index.ntotal, k * max(1, -(-len(allow) // n_allowed)) * 2)
+            D, I = index.search(qv, fetch)
+            ok = (I >= 0) & allow[np.clip(I, 0, len(allow) - 1)]
+            D = np.where(ok, D, -np.inf).astype(np.float32)
+            order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+            D, I = np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+            I[~np.isfinite(D)] = -1
+            return D, I
+
+    # ---- incremental updates ----
+    def add(self, items: List[Tuple[str, str]], slots: List[int]) -> np.ndarray:
+        """Embed `items` and add them under `slots` (contiguous, starting at len(doc_ids)); returns their vectors."""
+        if not items:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._check_append(slots)  # before paying for the encode
+        emb = self.encode_corpus([t for _, t in items], show_progress_bar=False)
+        self.add_vectors([d for d, _ in items], slots, emb)
+        return emb
+
+    def _check_append(self, slots: List[int]):
+        if slots[0] != len(self.doc_ids):
+            raise ValueError(f"FAISS slots out of sync: expected {len(self.doc_ids)}, got {slots[0]}")
+        if self.index is not None and not _keyed_by_id(self.index):
+            raise ValueError("FAISS index predates incremental updates; rebuild it with `make index`")
+
+    def add_vectors(self, doc_ids: List[str], slots: List[int], emb: np.ndarray):
+        """add() for vectors encoded elsewhere (normalized, one row per doc id)."""
+        if not doc_ids:
+            return
+        self._check_append(slots)
+        if self.delta is None:
+            delta = faiss.IndexIDMap2(faiss.IndexFlatIP(emb.shape[1]))
+        else:
+            delta = faiss.clone_index(self.delta)
+        delta.add_with_ids(np.ascontiguousarray(emb, dtype=np.float32), np.asarray(slots, dtype=np.int64))
+        self.doc_ids.extend(doc_ids)
+        self.delta = delta
+
+    def delete(self, slots: List[int]):
+        self.tombstones = self.tombstones | {int(s) for s in slots}
+
+    @property
+    def pending(self) -> int:
+        return self.delta.ntotal if self.delta is not None else 0
+
+    @property
+    def ntotal(self) -> int:
+        """Vectors held in the main index and the delta, tombstoned ones included."""
+        return (self.index.ntotal if self.index is not None else 0) + self.pending
+
+    def compacted(self) -> "EmbedFAISS":
+        """
+        A new instance with the delta folded into a copy of the main index
+        and tombstoned vectors physically dropped where the index type
+        supports removal; slots are preserved. This one is left untouched,
+        so searches running on it never see half of the swap.
+        """
+        main, delta, tombstones, config = self.index, self.delta, self.tombstones, self.config
+        if delta is None and not tombstones:
+            return self
+        index = None
+        if main is not None:
+            # a clone of a memory-mapped index still views the mapped (read-only) codes: copy them out
+            index = faiss.deserialize_index(faiss.serialize_index(main)) if self.mapped else faiss.clone_index(main)
+        if delta is not None:
+            vecs = faiss.rev_swig_ptr(faiss.downcast_index(delta.index).get_xb(), delta.ntotal * delta.d)
+            vecs = np.array(vecs, dtype=np.float32).reshape(delta.ntotal, delta.d)
+            ids = faiss.vector_to_array(delta.id_map).astype(np.int64)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(delta.d))
+                config = replace(config, index_type="flat", storage="fp32")
+            index.add_with_ids(vecs, ids)
+        if tombstones:
+            try:
+                index.remove_ids(np.fromiter(tombstones, dtype=np.int64, count=len(tombstones)))
+                tombstones = frozenset()
+            except RuntimeError:
+                logger.info("%s index cannot remove vectors; keeping %d tombstones",
+                            config.index_type, len(tombstones))
+        config.apply_search_params(index)
+        # the encoder, embedding store and query cache are shared
+        out = copy.copy(self)
+        out.doc_ids = list(self.doc_ids)
+        out.config, out.index, out.delta, out.tombstones, out.mapped = config, index, None, tombstones, False
+        return out
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """
+        Bytes held by the vectors next to their float32 size. `heap_bytes` is
+        this process's private copy: none for a memory-mapped main index,
+        whose pages are shared with every worker mapping the same file.
+        """
+        index, delta = self.index, self.delta
+        n = index.ntotal if index is not None else 0
+        dim = index.d if index is not None else (delta.d if delta is not None else 0)
+        vector_bytes = n * _code_size(index) if index is not None else 0
+        delta_bytes = delta.ntotal * delta.d * 4 if delta is not None else 0
+        fp32_bytes = n * dim * 4
+        return {
+            "storage": self.config.storage,
+            "mmap": self.mapped,
+            "vectors": n,
+            "vector_bytes": vector_bytes,
+            "fp32_bytes": fp32_bytes,
+            "memory_saving": 1 - vector_bytes / fp32_bytes if fp32_bytes else 0.0,
+            "heap_bytes": (0 if self.mapped else vector_bytes) + delta_bytes,
+        }
 
     def save(self, dir_path: str):
+        if self.delta is not None:
+            raise ValueError("pending additions are not saved: save a compacted() copy")
         p = Path(dir_path)
         p.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self.index, str(p / "index.faiss"))
+        # write-then-rename so a concurrent load never reads a torn file
+        faiss.write_index(self.index, str(p / "index.faiss.tmp"))
+        os.replace(p / "index.faiss.tmp", p / "index.faiss")
         (p / "doc_ids.json").write_text(json.dumps(self.doc_ids, ensure_ascii=False))
+        manifest = {"model_name": self.model_name, "encoder_backend": self.backend, "dim": self.index.d,
+                    "ntotal": self.index.ntotal, "index": asdict(self.config), "tombstones": sorted(self.tombstones)}
+        (p / "manifest.json").write_text(json.dumps(manifest, indent=2))
 
     def load(self, dir_path: str):
         p = Path(dir_path)
-        self.index = faiss.read_index(str(p / "index.faiss"))
+        self.mapped = False
+        if self.config.mmap:
+            try:
+                self.index = faiss.read_index(str(p / "index.faiss"), _MMAP_FLAGS)
+                self.mapped = True
+            except RuntimeError:
+                logger.warning("Could not memory-map %s; reading it into memory", p / "index.faiss")
+        if not self.mapped:
+            self.index = faiss.read_index(str(p / "index.faiss"))
+        self.delta = None
         self.doc_ids = json.loads((p / "doc_ids.json").read_text())
+        manifest_p = p / "manifest.json"
+        self.tombstones = frozenset()
+        if manifest_p.exists():
+            manifest = json.loads(manifest_p.read_text())
+            self.tombstones = frozenset(manifest.get("tombstones", []))
+            built_with = manifest.get("encoder_backend", "torch")
+            if built_with != self.backend:
+                logger.warning("Index was encoded with the %s backend but queries use %s; "
+                               "scores shift slightly until the next rebuild", built_with, self.backend)
+            built = IndexConfig(**manifest["index"])
+            # the layout comes from the build; query-time knobs from the current config
+            self.config = replace(built, nprobe=min(self.config.nprobe, built.nlist),
+                                  hnsw_ef_search=self.config.hnsw_ef_search, mmap=self.config.mmap)
+        else:
+            # indices written before the manifest existed are always flat
+            self.config = replace(self.config, index_type="flat", storage="fp32")
+        self.config.apply_search_params(self.index)
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from retrieval.mmap_io import read_manifest
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer only
+    fcntl = None
+
+KEY_DTYPE = "S32"  # raw sha256 digest
+# keys added since the last merge live in a small sorted delta index; past this size it is merged into the main one
+DELTA_MAX_KEYS = 32768
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+def store_model_key(model_name: str, backend: str = "torch") -> str:
+    # other backends give slightly different vectors, so they get their own store
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+class EmbeddingStore:
+    """
+    On-disk embedding cache keyed by (model_name, sha256(text)).
+
+    Each model gets its own directory of append-only shards
+    (`shard_NNNNN.npy` vectors + `shard_NNNNN_keys.npy` digests), all
+    memory-mapped, plus a sorted key index (`index_G_keys.npy` /
+    `index_G_loc.npy`) that resolves a digest to (shard, row) with one
+    searchsorted. New keys go to a small sorted delta index
+    (`delta_G_*.npy`, checked after the main one), so a put costs the
+    size of the delta rather than of the store; the delta is merged into
+    the main index by consolidate() or once it holds DELTA_MAX_KEYS.
+    Writers serialize on a lock file and publish a new generation G by
+    rewriting the manifest last; readers pick it up on their next lookup. Vectors are stored in float16 by default (half the
+    disk/page cache; cosine error ~1e-3) and always returned as float32.
+    """
+
+    def __init__(self, root: Path, model_name: str, dtype: str = "float16"):
+        self.model_name = model_name
+        self.dir = Path(root) / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._generation = -1
+        self._index_generation = -1
+        self._shard_ids: List[int] = []
+        self._shards: Dict[int, np.ndarray] = {}
+        self._index_keys = np.zeros(0, dtype=KEY_DTYPE)
+        self._index_loc = np.zeros((0, 2), dtype=np.int32)
+        self._delta_keys = np.zeros(0, dtype=KEY_DTYPE)
+        self._delta_loc = np.zeros((0, 2), dtype=np.int32)
+        self._refresh()
+
+    # ---- index ----
+    def _refresh(self, retries: int = 3):
+        if not (self.dir / "manifest.json").exists():
+            return
+        manifest = read_manifest(self.dir)
+        g = manifest["generation"]
+        if g == self._generation:
+            return
+        if manifest["model_name"] != self.model_name:
+            raise ValueError(f"{self.dir} holds embeddings for {manifest['model_name']!r}")
+        # stores written before the delta index have one index per generation and no delta
+        gi = manifest.get("index", g)
+        try:
+            shards = [np.load(self.dir / f"shard_{i:05d}.npy", mmap_mode="r") for i in manifest["shards"]]
+            index_keys = np.load(self.dir / f"index_{gi}_keys.npy", mmap_mode="r")
+            index_loc = np.load(self.dir / f"index_{gi}_loc.npy", mmap_mode="r")
+            delta_keys, delta_loc = self._delta_keys[:0], self._delta_loc[:0]
+            if "index" in manifest:
+                delta_keys = np.load(self.dir / f"delta_{g}_keys.npy")
+                delta_loc = np.load(self.dir / f"delta_{g}_loc.npy")
+        except FileNotFoundError:
+            # a writer published a newer generation while we were reading this one
+            if retries:
+                return self._refresh(retries - 1)
+            raise
+        self.dim = manifest["dim"]
+        self.dtype = np.dtype(manifest["dtype"])
+        self._shard_ids = list(manifest["shards"])
+        self._shards = dict(zip(self._shard_ids, shards))
+        self._index_keys, self._index_loc = index_keys, index_loc
+        self._delta_keys, self._delta_loc = delta_keys, delta_loc
+        self._generation, self._index_generation = g, gi
+
+    def __len__(self) -> int:
+        return len(self._index_keys) + len(self._delta_keys)
+
+    @staticmethod
+    def _search(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """Row of each key in `sorted_keys`, -1 if absent."""
+        if not len(sorted_keys) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return np.where(sorted_keys[pos] == keys, pos, -1)
+
+    def _lookup(self, keys: np.ndarray) -> np.ndarray:
+        """(shard, row) of each key, main index first then the delta; (-1, -1) if absent."""
+        loc = np.full((len(keys), 2), -1, dtype=np.int64)
+        rows = self._search(self._index_keys, keys)
+        hit = rows >= 0
+        loc[hit] = np.asarray(self._index_loc)[rows[hit]]
+        rows = self._search(self._delta_keys, keys)
+        hit = rows >= 0
+        loc[hit] = self._delta_loc[rows[hit]]
+        return loc
+
+    def get_many(self, keys: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        """(found mask, float32 vectors of the found keys in input order)."""
+        self._refresh()
+        loc = self._lookup(np.asarray(keys, dtype=KEY_DTYPE))
+        found = loc[:, 0] >= 0
+        if not found.any():
+            return found, np.zeros((0, self.dim or 0), dtype=np.float32)
+        return found, self._gather(loc[found], np.float32)
+
+    def _gather(self, loc: np.ndarray, dtype) -> np.ndarray:
+        out = np.empty((len(loc), self.dim), dtype=dtype)
+        for shard in np.unique(loc[:, 0]):
+            sel = loc[:, 0] == shard
+            out[sel] = self._shards[int(shard)][loc[sel, 1]]
+        return out
+
+    @contextmanager
+    def _locked(self):
+        with open(self.dir / "store.lock", "a+") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        """Append unseen (key, vector) pairs as a new shard, indexed in the delta."""
+        if not len(keys):
+            return
+        with self._locked():
+            self._refresh()  # another writer may have added some of these already
+            keys_a = np.asarray(keys, dtype=KEY_DTYPE)
+            keys_a, first = np.unique(keys_a, return_index=True)
+            vectors = np.asarray(vectors)[first]
+            new = self._lookup(keys_a)[:, 0] < 0
+            if not new.any():
+                return
+            keys_a, vectors = keys_a[new], vectors[new]
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} != store dim {self.dim}")
+            shard = max(self._shard_ids, default=-1) + 1
+            np.save(self.dir / f"shard_{shard:05d}.npy", vectors.astype(self.dtype))
+            np.save(self.dir / f"shard_{shard:05d}_keys.npy", keys_a)
+            loc = np.stack([np.full(len(keys_a), shard, dtype=np.int32), np.arange(len(keys_a), dtype=np.int32)], axis=1)
+            # only the delta is re-sorted: O(delta) per put, not O(store)
+            delta_keys = np.concatenate([self._delta_keys, keys_a])
+            order = np.argsort(delta_keys, kind="stable")
+            delta = delta_keys[order], np.concatenate([self._delta_loc, loc])[order]
+            if len(delta[0]) > DELTA_MAX_KEYS or self._index_generation < 0:
+                self._publish(self._shard_ids + [shard], self._merged(delta))
+            else:
+                self._publish(self._shard_ids + [shard], delta=delta)
+
+    def _merged(self, delta: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """The main index with the delta folded in."""
+        delta_keys, delta_loc = delta if delta is not None else (self._delta_keys, self._delta_loc)
+        keys = np.concatenate([np.asarray(self._index_keys), delta_keys])
+        loc = np.concatenate([np.asarray(self._index_loc), delta_loc])
+        order = np.argsort(keys, kind="stable")
+        return keys[order], loc[order]
+
+    def _publish(self, shard_ids: List[int], index: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 delta: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """New generation with `delta` as the delta index; a new main `index` (or else the current one is kept)."""
+        old_g, old_gi, g = self._generation, self._index_generation, self._generation + 1
+        gi = old_gi
+        if index is not None:
+            gi = g
+            np.save(self.dir / f"index_{g}_keys.npy", index[0])
+            np.save(self.dir / f"index_{g}_loc.npy", index[1])
+        if delta is None:
+            delta = self._delta_keys[:0], self._delta_loc[:0]
+        np.save(self.dir / f"delta_{g}_keys.npy", delta[0])
+        np.save(self.dir / f"delta_{g}_loc.npy", delta[1])
+        # the manifest is the commit point; readers holding the old generation keep their mmaps
+        manifest = {"model_name": self.model_name, "dim": self.dim, "dtype": self.dtype.name,
+                    "shards": shard_ids, "generation": g, "index": gi}
+        (self.dir / "manifest.json.tmp").write_text(json.dumps(manifest, indent=2))
+        os.replace(self.dir / "manifest.json.tmp", self.dir / "manifest.json")
+        self._refresh()
+        stale = [f"delta_{old_g}_keys.npy", f"delta_{old_g}_loc.npy"]
+        if gi != old_gi:
+            stale += [f"index_{old_gi}_keys.npy", f"index_{old_gi}_loc.npy"]
+        for name in stale:
+            (self.dir / name).unlink(missing_ok=True)
+
+    def consolidate(self, max_shards: int = 32):
+        """Merge the delta into the main index, and rewrite many small shards (left by runtime upserts) into one."""
+        with self._locked():
+            self._refresh()
+            if len(self._shards) <= max_shards:
+                if len(self._delta_keys):
+                    self._publish(self._shard_ids, self._merged())
+                return
+            keys, loc = self._merged()
+            vecs = self._gather(loc, self.dtype)
+            old_ids, shard = self._shard_ids, max(self._shard_ids) + 1
+            np.save(self.dir / f"shard_{shard:05d}.npy", vecs)
+            np.save(self.dir / f"shard_{shard:05d}_keys.npy", keys)
+            loc = np.stack([np.full(len(keys), shard, dtype=np.int32), np.arange(len(keys), dtype=np.int32)], axis=1)
+            self._publish([shard], (keys, loc))
+            for i in old_ids:
+                (self.dir / f"shard_{i:05d}.npy").unlink(missing_ok=True)
+                (self.dir / f"shard_{i:05d}_keys.npy").unlink(missing_ok=True)
+
+    # ---- cache-through encoding ----
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for `texts`: stored vectors are read back, only unseen
+        texts go through `encode_fn` (once per distinct text) and are stored.
+        """
+        keys = [text_key(t) for t in texts]
+        found, vecs = self.get_many(keys)
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        if found.all():
+            return vecs
+        todo: Dict[bytes, str] = {}
+        for key, t, f in zip(keys, texts, found):
+            if not f:
+                todo.setdefault(key, t)
+        enc = np.asarray(encode_fn(list(todo.values())), dtype=np.float32)
+        self.put_many(list(todo), enc)
+        fresh = dict(zip(todo, enc))
+        out = np.zeros((len(texts), enc.shape[1]), dtype=np.float32)
+        if found.any():
+            out[found] = vecs
+        out[~found] = np.stack([fresh[k] for k, f in zip(keys, found) if not f])
+        return out
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,221 @@
+import argparse
+import inspect
+import json
+import logging
+import re
+import time
+from itertools import islice
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODER_BACKENDS = ("torch", "torch_int8", "onnx")
+ONNX_DIR = Path("models/artifacts/onnx")
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+def load_encoder(model_name: str, backend: str = "torch", onnx_dir: Path = ONNX_DIR, threads: int = 0):
+    """
+    A sentence encoder exposing SentenceTransformer's encode() /
+    get_sentence_embedding_dimension():
+
+    - torch:      the fp32 SentenceTransformer
+    - torch_int8: the same model with every nn.Linear dynamically quantized to int8
+    - onnx:       the transformer exported to ONNX (once, locally, from the
+                  same checkpoint) and run with ONNX Runtime
+
+    `threads` > 0 caps the intra-op threads of the torch / ONNX Runtime session.
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {ENCODER_BACKENDS}")
+    if backend == "onnx":
+        out_dir = Path(onnx_dir) / _slug(model_name)
+        if not (out_dir / "model.onnx").exists():
+            export_onnx(model_name, out_dir)
+        return OnnxEncoder(out_dir, intra_op_threads=threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "torch_int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def _pooling_mode(st_model) -> str:
+    for module in st_model:
+        if type(module).__name__ == "Pooling":
+            if getattr(module, "pooling_mode_cls_token", False):
+                return "cls"
+            if getattr(module, "pooling_mode_max_tokens", False):
+                return "max"
+            return "mean"
+    return "mean"
+
+def export_onnx(model_name: str, out_dir: Path) -> Path:
+    """Export the checkpoint's transformer + tokenizer to `out_dir` (pooling runs in NumPy)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    hf = st[0].auto_model.eval()
+    tok = st.tokenizer
+    out_dir.mkdir(parents=True, exist_ok=True)
+    dummy = tok(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    axes = {n: {0: "batch", 1: "seq"} for n in input_names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    class HiddenStates(torch.nn.Module):
+        # positional inputs -> last_hidden_state, independent of the model's forward() signature
+        def __init__(self):
+            super().__init__()
+            self.model = hf
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)), return_dict=True).last_hidden_state
+
+    # newer torch defaults to the dynamo exporter, which needs onnxscript; keep the tracing one
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates().eval(),
+            tuple(dummy[n] for n in input_names),
+            str(out_dir / "model.onnx.tmp"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=17,
+            **legacy,
+        )
+    tok.save_pretrained(str(out_dir))
+    (out_dir / "encoder.json").write_text(json.dumps({
+        "model_name": model_name,
+        "input_names": input_names,
+        "pooling": _pooling_mode(st),
+        "max_seq_length": st.max_seq_length,
+        "dim": st.get_sentence_embedding_dimension(),
+    }, indent=2))
+    (out_dir / "model.onnx.tmp").replace(out_dir / "model.onnx")
+    logger.info("Exported %s to %s", model_name, out_dir)
+    return out_dir
+
+class OnnxEncoder:
+    """ONNX Runtime inference for an exported transformer, with SentenceTransformer-style pooling."""
+
+    def __init__(self, model_dir: Path, intra_op_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("EMBED_BACKEND=onnx needs onnxruntime (`pip install onnxruntime`)") from e
+        from transformers import AutoTokenizer
+
+        meta = json.loads((Path(model_dir) / "encoder.json").read_text())
+        self.model_name = meta["model_name"]
+        self.input_names = meta["input_names"]
+        self.pooling = meta["pooling"]
+        self.max_seq_length = meta["max_seq_length"]
+        self.dim = meta["dim"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(str(Path(model_dir) / "model.onnx"), opts,
+                                            providers=["CPUExecutionProvider"])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, **_) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        # longest first, like SentenceTransformer, so batches pad to similar lengths
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            idx = order[start: start + batch_size]
+            enc = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feeds = {n: enc[n].astype(np.int64) for n in self.input_names}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            elif self.pooling == "max":
+                pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+            else:
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out[idx] = pooled
+        return out
+
+# ---- parity check + throughput benchmark ----
+def _sample_texts(n: int) -> List[str]:
+    try:
+        from backend.app.core.path_resolver import acord_dir
+        from retrieval.beir_acord_loader import iter_corpus
+
+        texts = [t for _, t in islice(iter_corpus(acord_dir()), n)]
+    except Exception:
+        texts = []
+    if len(texts) < n:
+        rng = np.random.default_rng(0)
+        words = ("party shall indemnify liability termination notice days agreement governing law "
+                 "confidential information breach cure period payment invoice audit assignment").split()
+        texts += [" ".join(rng.choice(words, size=int(rng.integers(8, 80)))) for _ in range(n - len(texts))]
+    return texts[:n]
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+
+def benchmark(model_name: str, backends: List[str], n: int = 512, batch_size: int = 64,
+              n_queries: int = 50, onnx_dir: Path = ONNX_DIR) -> dict:
+    """Corpus throughput, single-query latency and cosine parity against fp32 torch for each backend."""
+    texts = _sample_texts(n)
+    reference: Optional[np.ndarray] = None
+    report = {}
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        t0 = time.perf_counter()
+        enc = load_encoder(model_name, backend, onnx_dir)
+        load_s = time.perf_counter() - t0
+        enc.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+        t0 = time.perf_counter()
+        emb = _unit(enc.encode(texts, batch_size=batch_size))
+        elapsed = time.perf_counter() - t0
+        lat = []
+        for q in texts[:n_queries]:
+            t0 = time.perf_counter()
+            enc.encode([q[:200]])
+            lat.append((time.perf_counter() - t0) * 1000)
+        if reference is None:
+            reference = emb
+        cos = (emb * reference).sum(axis=1)
+        report[backend] = {
+            "load_s": load_s,
+            "docs_per_s": len(texts) / elapsed,
+            "query_p50_ms": float(np.percentile(lat, 50)),
+            "query_p95_ms": float(np.percentile(lat, 95)),
+            "cosine_vs_fp32_mean": float(cos.mean()),
+            "cosine_vs_fp32_min": float(cos.min()),
+        }
+    return {"model_name": model_name, "texts": len(texts), "batch_size": batch_size, "backends": report}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Encoder backend parity + throughput benchmark")
+    ap.add_argument("--model", type=str, default=None, help="defaults to settings.MODEL_NAME")
+    ap.add_argument("--backends", type=str, default=",".join(ENCODER_BACKENDS))
+    ap.add_argument("--n", type=int, default=512)
+    ap.add_argument("--batch_size", type=int, default=64)
+    ap.add_argument("--queries", type=int, default=50)
+    args = ap.parse_args()
+    if args.model is None:
+        from backend.app.core.config import settings
+
+        args.model = settings.MODEL_NAME
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    print(json.dumps(benchmark(args.model, backends, n=args.n, batch_size=args.batch_size,
+                               n_queries=args.queries), indent=2))
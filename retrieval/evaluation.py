@@ -0,0 +1,182 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+import numpy as np
+from retrieval.beir_acord_loader import Qrels
+
+Rankings = Dict[str, List[Tuple[str, float]]]
+_EMPTY = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+def qrels_from_dict(qrels: Dict[str, Dict[str, int]]) -> Qrels:
+    qids = list(qrels)
+    doc_code: Dict[str, int] = {}
+    q, d, rel = [], [], []
+    for i, qid in enumerate(qids):
+        for did, r in qrels[qid].items():
+            q.append(i)
+            d.append(doc_code.setdefault(did, len(doc_code)))
+            rel.append(r)
+    return Qrels(qids=qids, docs=list(doc_code), q=np.asarray(q, dtype=np.int32),
+                 d=np.asarray(d, dtype=np.int32), rel=np.asarray(rel, dtype=np.int32))
+
+def _discounts(k: int) -> np.ndarray:
+    return 1.0 / np.log2(np.arange(2, k + 2))
+
+def _ideal_dcg(qrels: Qrels, k: int) -> np.ndarray:
+    """Per query code: DCG of its k best judgements."""
+    pos = qrels.rel > 0
+    q, rel = qrels.q[pos], qrels.rel[pos]
+    order = np.lexsort((-rel, q))
+    q, rel = q[order], rel[order]
+    starts = np.flatnonzero(np.r_[True, q[1:] != q[:-1]]) if len(q) else np.zeros(0, dtype=np.int64)
+    rank = np.arange(len(q)) - np.repeat(starts, np.diff(np.r_[starts, len(q)]))
+    top = rank < k
+    gains = (np.exp2(rel[top]) - 1.0) * _discounts(k)[rank[top]]
+    return np.bincount(q[top], weights=gains, minlength=len(qrels.qids))
+
+def relevance_matrix(rankings: Rankings, qrels: Qrels, k: int) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    (query ids, query codes, rel) where rel[i, j] is the judged relevance
+    of the j-th ranked doc of query i (0 when unjudged or past the end of
+    the ranking). A query without judgements gets code -1.
+    """
+    qids = list(rankings)
+    q_code = {q: i for i, q in enumerate(qrels.qids)}
+    d_code = {d: i for i, d in enumerate(qrels.docs)}
+    ranked = np.full((len(qids), k), -1, dtype=np.int64)
+    for i, qid in enumerate(qids):
+        codes = [d_code.get(d, -1) for d, _ in rankings[qid][:k]]
+        ranked[i, : len(codes)] = codes
+    qc = np.asarray([q_code.get(q, -1) for q in qids], dtype=np.int64)
+
+    # judgements sorted by (query, doc) key, looked up with one searchsorted
+    n_docs = max(len(qrels.docs), 1)
+    keys = qrels.q.astype(np.int64) * n_docs + qrels.d
+    order = np.argsort(keys, kind="stable")
+    keys, rels = keys[order], qrels.rel[order]
+    probe = qc[:, None] * n_docs + ranked
+    valid = (ranked >= 0) & (qc[:, None] >= 0)
+    rel = np.zeros(ranked.shape, dtype=np.int32)
+    if len(keys):
+        pos = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+        hit = valid & (keys[pos] == probe)
+        rel[hit] = rels[pos[hit]]
+    return qids, qc, rel
+
+def evaluate_rankings(
+    rankings: Rankings, qrels: Union[Qrels, Dict[str, Dict[str, int]]], k: int = 10
+) -> Dict[str, float]:
+    """
+    Mean MRR@k, nDCG@k (gain 2^rel - 1) and Recall@k over every ranked
+    query; queries without judgements score 0.
+    """
+    if isinstance(qrels, dict):
+        qrels = qrels_from_dict(qrels)
+    _, qc, rel = relevance_matrix(rankings, qrels, k)
+    if not len(qc):
+        return {f"MRR@{k}": 0.0, f"nDCG@{k}": 0.0, f"Recall@{k}": 0.0, "queries": 0}
+    relevant = rel > 0
+    judged = qc >= 0
+
+    first = relevant.argmax(axis=1)
+    mrr = np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+
+    dcg = (np.where(relevant, np.exp2(rel) - 1.0, 0.0) * _discounts(k)).sum(axis=1)
+    idcg = np.where(judged, _ideal_dcg(qrels, k)[np.maximum(qc, 0)], 0.0)
+    ndcg = np.divide(dcg, idcg, out=np.zeros_like(dcg), where=idcg > 0)
+
+    n_rel = np.bincount(qrels.q[qrels.rel > 0], minlength=len(qrels.qids))
+    total = np.where(judged, n_rel[np.maximum(qc, 0)], 0)
+    recall = np.divide(relevant.sum(axis=1), total, out=np.zeros(len(qc)), where=total > 0)
+    return {
+        f"MRR@{k}": float(mrr.mean()),
+        f"nDCG@{k}": float(ndcg.mean()),
+        f"Recall@{k}": float(recall.mean()),
+        "queries": int(len(qc)),
+    }
+
+# ---- CLI: BM25 / FAISS / hybrid quality + per-stage latency against the built indices ----
+def _timed(stages: Dict[str, float], name: str, fn):
+    t0 = time.perf_counter()
+    out = fn()
+    stages[name] = stages.get(name, 0.0) + time.perf_counter() - t0
+    return out
+
+def run(acord: Path, retrievers: List[str], k: int = 10, depth: int = 50, bm25_weight: float = 0.5,
+        faiss_weight: float = 0.5, limit: int = 0, batch_size: int = 256, fusion: str = "weighted_rrf") -> dict:
+    from backend.app.services.retrieval_service import RetrievalService
+    from retrieval.beir_acord_loader import load_qrels_arrays, load_queries
+
+    qrels = load_qrels_arrays(acord)
+    judged = set(qrels.qids)
+    queries = [(q, t) for q, t in load_queries(acord).items() if q in judged]
+    if limit:
+        queries = queries[:limit]
+    svc = RetrievalService()
+    svc.load()
+    depth = max(depth, k)
+
+    stages: Dict[str, float] = {}
+    runs: Dict[str, Rankings] = {r: {} for r in retrievers}
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start: start + batch_size]
+        qids, texts = [q for q, _ in batch], [t for _, t in batch]
+        bm25_res = faiss_res = None
+        if "bm25" in retrievers or "hybrid" in retrievers:
+            bm25_res = _timed(stages, "bm25_search", lambda: svc._bm25.query_slots(texts, k=depth))
+        if "faiss" in retrievers or "hybrid" in retrievers:
+            qv = _timed(stages, "query_encode", lambda: svc._faiss.encode_queries(texts))
+            faiss_res = _timed(stages, "faiss_search", lambda: svc._faiss.search_slots(qv, k=depth))
+        if "hybrid" in retrievers:
+            fused = _timed(stages, "fusion", lambda: [
+                svc._fuse(b, f, k, bm25_weight, faiss_weight, fusion, depth=depth) for b, f in zip(bm25_res, faiss_res)
+            ])
+            runs["hybrid"].update({q: [(h.doc_id, h.score) for h in hits] for q, hits in zip(qids, fused)})
+        # single-retriever runs go through the same fusion with the other weight at 0 (passages collapse alike)
+        if "bm25" in retrievers:
+            runs["bm25"].update({q: [(h.doc_id, h.score) for h in svc._fuse(r, _EMPTY, k, 1.0, 0.0, "weighted",
+                                                                            depth=depth)]
+                                 for q, r in zip(qids, bm25_res)})
+        if "faiss" in retrievers:
+            runs["faiss"].update({q: [(h.doc_id, h.score) for h in svc._fuse(_EMPTY, r, k, 0.0, 1.0, "weighted",
+                                                                             depth=depth)]
+                                  for q, r in zip(qids, faiss_res)})
+
+    n = max(len(queries), 1)
+    t0 = time.perf_counter()
+    quality = {r: evaluate_rankings(runs[r], qrels, k=k) for r in retrievers}
+    stages["evaluation"] = time.perf_counter() - t0
+    return {
+        "queries": len(queries),
+        "k": k,
+        "depth": depth,
+        "quality": quality,
+        "latency": {s: {"total_s": t, "per_query_ms": t * 1000 / n} for s, t in stages.items()},
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="BEIR-style evaluation of the built BM25 / FAISS / hybrid indices")
+    ap.add_argument("--acord_dir", type=str, default=None, help="defaults to settings.ACORD_DIR")
+    ap.add_argument("--retrievers", type=str, default="bm25,faiss,hybrid")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--depth", type=int, default=50, help="candidates per retriever before fusion")
+    ap.add_argument("--bm25_weight", type=float, default=0.5)
+    ap.add_argument("--faiss_weight", type=float, default=0.5)
+    ap.add_argument("--fusion", type=str, default="weighted_rrf", help="weighted_rrf | weighted | rrf")
+    ap.add_argument("--limit", type=int, default=0, help="evaluate only the first N judged queries")
+    ap.add_argument("--out", type=str, default=None, help="also write the report to this JSON file")
+    args = ap.parse_args()
+    if args.acord_dir is None:
+        from backend.app.core.path_resolver import acord_dir
+
+        acord = acord_dir()
+    else:
+        acord = Path(args.acord_dir)
+    retrievers = [r.strip() for r in args.retrievers.split(",") if r.strip()]
+    report = run(acord, retrievers, k=args.k, depth=args.depth, bm25_weight=args.bm25_weight,
+                 faiss_weight=args.faiss_weight, limit=args.limit, fusion=args.fusion)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,134 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from retrieval.rrf import first_occurrence, rrf_fuse_arrays
+
+# weighted_rrf: top-k by weighted min-max score, ordered by RRF rank (the original hybrid ranker)
+FUSION_STRATEGIES = ("weighted_rrf", "weighted", "rrf")
+
+def minmax(scores: np.ndarray, floor: Optional[float] = None) -> np.ndarray:
+    """Min-max normalize; `floor` lowers the minimum (unlisted candidates score it)."""
+    if not len(scores):
+        return np.zeros(0, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    mn, mx = scores.min(), scores.max()
+    if floor is not None:
+        mn = min(mn, floor)
+    return (scores - mn) / ((mx - mn) or 1.0)
+
+def fuse(
+    ids: List[np.ndarray],
+    scores: List[np.ndarray],
+    weights: List[float],
+    k: int,
+    strategy: str = "weighted_rrf",
+    keys: Optional[List[np.ndarray]] = None,
+    k_rrf: int = 60,
+    depth: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fuse ranked candidate lists of integer ids (best first, one list per
+    retriever). `keys` maps every candidate to the result it belongs to
+    (e.g. the parent document of a passage; defaults to the id itself):
+    a key scores as its best member (max-passage) and ranks in each list
+    where its best member ranks.
+
+    `depth` is how many candidates each list was asked for: a shorter list
+    holds every match, so it is normalized against 0 (as if the rest of
+    the corpus followed with score 0) and its weakest match keeps a score.
+
+    Returns (keys, best member id, score) of the fused top-k. Ties keep
+    the order in which candidates first appear across the lists.
+    """
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy {strategy!r}; expected one of {FUSION_STRATEGIES}")
+    ids = [np.asarray(i, dtype=np.int64) for i in ids]
+    keys = ids if keys is None else [np.asarray(g, dtype=np.int64) for g in keys]
+    if not sum(len(i) for i in ids):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+    g_key, g_best, g_score, g_first = _best_members(ids, scores, weights, keys, depth)
+
+    if strategy == "rrf":
+        r_key, r_score = rrf_fuse_arrays([first_occurrence(g) for g in keys], k=k, k_rrf=k_rrf)
+        return r_key, g_best[np.searchsorted(g_key, r_key)], r_score
+
+    top = np.lexsort((g_first, -g_score))[:k]
+    if strategy == "weighted":
+        return g_key[top], g_best[top], g_score[top]
+
+    r_key, _ = rrf_fuse_arrays([first_occurrence(g) for g in keys], k=k, k_rrf=k_rrf)
+    rank = np.full(len(top), len(r_key), dtype=np.int64)  # not in the RRF top-k: after every ranked key
+    if len(r_key):
+        sorter = np.argsort(r_key)
+        pos = np.minimum(np.searchsorted(r_key, g_key[top], sorter=sorter), len(r_key) - 1)
+        hit = r_key[sorter[pos]] == g_key[top]
+        rank[hit] = sorter[pos[hit]]
+    final = top[np.lexsort((np.arange(len(top)), -g_score[top], rank))]
+    return g_key[final], g_best[final], g_score[final]
+
+def fuse_all(
+    ids: List[np.ndarray],
+    scores: List[np.ndarray],
+    weights: List[float],
+    strategy: str = "weighted_rrf",
+    keys: Optional[List[np.ndarray]] = None,
+    k_rrf: int = 60,
+    depth: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    fuse() over every candidate key, for paging: (keys, best member id,
+    score, rank) in the order pages are cut from (weighted score, or RRF
+    for rrf). `rank` is each key's RRF position, which orders weighted_rrf
+    keys within a page; fused_page(fuse_all(...), 0, k) equals fuse(k).
+    """
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy {strategy!r}; expected one of {FUSION_STRATEGIES}")
+    ids = [np.asarray(i, dtype=np.int64) for i in ids]
+    keys = ids if keys is None else [np.asarray(g, dtype=np.int64) for g in keys]
+    if not sum(len(i) for i in ids):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64), empty
+    g_key, g_best, g_score, g_first = _best_members(ids, scores, weights, keys, depth)
+    r_key, r_score = rrf_fuse_arrays([first_occurrence(g) for g in keys], k=len(g_key), k_rrf=k_rrf)
+    if strategy == "rrf":
+        return r_key, g_best[np.searchsorted(g_key, r_key)], r_score, np.arange(len(r_key), dtype=np.int64)
+    top = np.lexsort((g_first, -g_score))
+    if strategy == "weighted":
+        rank = np.arange(len(top), dtype=np.int64)
+    else:
+        # every key is in some list, so every key has an RRF position
+        rank = np.empty(len(r_key), dtype=np.int64)
+        rank[np.searchsorted(g_key, r_key)] = np.arange(len(r_key))
+        rank = rank[top]
+    return g_key[top], g_best[top], g_score[top], rank
+
+def fused_page(
+    fused: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], offset: int, k: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Keys [offset, offset + k) of a fuse_all() list, in display order: by
+    RRF position where it falls inside the first offset + k (as fuse()
+    does for the top k), then by score.
+    """
+    keys, best, score, rank = (a[offset: offset + k] for a in fused)
+    final = np.lexsort((np.arange(len(keys)), -score, np.minimum(rank, offset + k)))
+    return keys[final], best[final], score[final]
+
+def _best_members(
+    ids: List[np.ndarray], scores: List[np.ndarray], weights: List[float], keys: List[np.ndarray],
+    depth: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Per key (sorted): the best member, its weighted score and the key's first position across the lists."""
+    members = np.concatenate(ids)
+    # weighted min-max score per member, then the best member of every key
+    contrib = np.concatenate([w * minmax(s, 0.0 if depth is not None and len(s) < depth else None)
+                              for w, s in zip(weights, scores)])
+    uniq, first, inv = np.unique(members, return_index=True, return_inverse=True)
+    member_score = np.bincount(inv, weights=contrib)
+    member_key = np.concatenate(keys)[first]
+    order = np.lexsort((first, -member_score, member_key))
+    head = np.r_[True, member_key[order][1:] != member_key[order][:-1]]
+    best = order[head]  # sorted by key
+    g_key, g_best, g_score = member_key[best], uniq[best], member_score[best]
+    g_first = np.minimum.reduceat(first[order], np.flatnonzero(head))
+    return g_key, g_best, g_score, g_first
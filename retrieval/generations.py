@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+CURRENT = "current.json"
+GENERATIONS = "generations"
+LEGACY = "legacy"
+
+def new_generation(root: Path) -> Tuple[str, Path]:
+    """A fresh, empty generation directory under root/generations (not yet visible to readers)."""
+    name = f"g{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}"
+    path = root / GENERATIONS / name
+    path.mkdir(parents=True)
+    return name, path
+
+def publish(root: Path, name: str, keep: int = 2):
+    """
+    Make generation `name` the one served: current.json is replaced
+    atomically, so readers see either the old or the new manifest, never
+    a partial one. Older generations beyond the `keep` newest are removed.
+    """
+    manifest = {"generation": name, "path": f"{GENERATIONS}/{name}", "published": datetime.utcnow().isoformat() + "Z"}
+    tmp = root / (CURRENT + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, root / CURRENT)
+    gens = sorted(p for p in (root / GENERATIONS).iterdir() if p.is_dir())
+    for old in gens[: max(0, len(gens) - max(keep, 1))]:
+        if old.name != name:
+            shutil.rmtree(old, ignore_errors=True)
+
+def current(root: Path) -> Tuple[str, Path]:
+    """(name, directory) of the served generation; indices written straight into root are 'legacy'."""
+    try:
+        manifest = json.loads((root / CURRENT).read_text())
+        return manifest["generation"], root / manifest["path"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return LEGACY, root
+
+def change_token(root: Path) -> Optional[Tuple[int, int]]:
+    """Cheap stat that changes whenever a generation is published (or, without a manifest, a legacy build lands)."""
+    for p in (root / CURRENT, root / "meta.json"):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        return st.st_ino, st.st_mtime_ns
+    return None
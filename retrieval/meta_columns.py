@@ -0,0 +1,163 @@
+import json
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from retrieval.mmap_io import load_arrays, open_string_table, read_manifest, replace_dir, write_manifest, write_string_table
+
+FORMAT = "meta-columns-v1"
+
+CATEGORICAL_FIELDS = ("type", "BU", "jurisdiction", "counterparty")
+NO_DATE = np.iinfo(np.int32).min
+
+def _ordinal(value: Optional[str]) -> Optional[int]:
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+class MetaColumns:
+    """
+    docs_meta compiled into per-slot columns so a filter becomes one
+    vectorized boolean mask. Categorical fields are int32 codes (-1 =
+    missing), dates are ordinals (NO_DATE = missing or unparseable).
+
+    Semantics follow the original per-hit filter: slots without any
+    metadata pass every filter, a categorical filter needs an exact string
+    match, and a date range only excludes documents with a parseable date
+    outside it.
+
+    `group` is the fusion key of each slot: the slot itself, or -(1 + code)
+    of its parent document for passages (parent_ids[code]).
+
+    Builds save the columns next to the indices; workers memory-map them
+    instead of compiling them from every document's metadata.
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, Dict[str, int]] = {f: {} for f in CATEGORICAL_FIELDS}
+        # parent id -> code; None after load() until a new parent needs a code
+        self.parent_codes: Optional[Dict[str, int]] = {}
+        self.parent_ids: Sequence[str] = []
+        self.group = np.zeros(0, dtype=np.int64)
+        self.codes: Dict[str, np.ndarray] = {f: np.zeros(0, dtype=np.int32) for f in CATEGORICAL_FIELDS}
+        self.dates = np.zeros(0, dtype=np.int32)
+        self.has_meta = np.zeros(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.has_meta)
+
+    @classmethod
+    def build(cls, slot_doc_ids: Iterable[str], docs_meta: Dict[str, Dict[str, str]]) -> "MetaColumns":
+        return cls().extended(slot_doc_ids, docs_meta)
+
+    def extended(self, slot_doc_ids: Iterable[str], docs_meta: Dict[str, Dict[str, str]]) -> "MetaColumns":
+        """A copy with columns for the next slots appended; concurrent readers keep a consistent view."""
+        metas = [docs_meta.get(d) or {} for d in slot_doc_ids]
+        if self.parent_codes is None and any(m.get("parent") for m in metas):
+            # loaded parents are a read-only table: copy them out once, before `out` shares them
+            self.parent_ids = list(self.parent_ids)
+            self.parent_codes = {p: i for i, p in enumerate(self.parent_ids)}
+        out = MetaColumns()
+        out.vocab = self.vocab  # append-only, shared
+        out.parent_codes, out.parent_ids = self.parent_codes, self.parent_ids
+        for f in CATEGORICAL_FIELDS:
+            vocab = self.vocab[f]
+            col = [-1 if m.get(f) is None else vocab.setdefault(str(m[f]), len(vocab)) for m in metas]
+            out.codes[f] = np.concatenate([self.codes[f], np.asarray(col, dtype=np.int32)])
+        ords = [_ordinal(m["date"]) if m.get("date") else None for m in metas]
+        out.dates = np.concatenate([self.dates, np.asarray([NO_DATE if o is None else o for o in ords], dtype=np.int32)])
+        out.has_meta = np.concatenate([self.has_meta, np.asarray([bool(m) for m in metas], dtype=bool)])
+        group = np.arange(len(self), len(self) + len(metas), dtype=np.int64)
+        for j, m in enumerate(metas):
+            if m.get("parent"):
+                group[j] = -1 - self._parent_code(str(m["parent"]))
+        out.group = np.concatenate([self.group, group])
+        return out
+
+    def _parent_code(self, parent: str) -> int:
+        code = self.parent_codes.get(parent)
+        if code is None:
+            code = self.parent_codes[parent] = len(self.parent_ids)
+            self.parent_ids.append(parent)
+        return code
+
+    def take(self, slots: np.ndarray) -> "MetaColumns":
+        """The columns re-laid out so new slot i carries old slot slots[i]."""
+        out = MetaColumns()
+        out.vocab, out.parent_codes, out.parent_ids = self.vocab, self.parent_codes, self.parent_ids
+        out.codes = {f: np.asarray(self.codes[f])[slots] for f in CATEGORICAL_FIELDS}
+        out.dates = np.asarray(self.dates)[slots]
+        out.has_meta = np.asarray(self.has_meta)[slots]
+        group = np.asarray(self.group)[slots]
+        # plain slots are keyed by themselves, so they take their new position
+        out.group = np.where(group >= 0, np.arange(len(slots), dtype=np.int64), group)
+        return out
+
+    def save(self, path: str):
+        final = Path(path)
+        tmp = final.with_name(final.name + ".tmp")
+        if tmp.exists():
+            replace_dir(tmp, tmp.with_name(tmp.name + ".stale"))
+        tmp.mkdir(parents=True)
+        for f in CATEGORICAL_FIELDS:
+            np.save(tmp / f"codes_{f}.npy", np.asarray(self.codes[f]))
+        np.save(tmp / "dates.npy", np.asarray(self.dates))
+        np.save(tmp / "has_meta.npy", np.asarray(self.has_meta))
+        np.save(tmp / "group.npy", np.asarray(self.group))
+        write_string_table(tmp, "parent_ids", self.parent_ids)
+        (tmp / "vocab.json").write_text(json.dumps(self.vocab, ensure_ascii=False))
+        write_manifest(tmp, {"format": FORMAT, "slots": len(self)})
+        replace_dir(tmp, final)
+
+    @classmethod
+    def load(cls, path: str) -> "MetaColumns":
+        p = Path(path)
+        manifest = read_manifest(p)
+        if manifest.get("format") != FORMAT:
+            raise ValueError(f"Unsupported metadata columns format in {p}: {manifest.get('format')}")
+        out = cls()
+        cols = load_arrays(p, [f"codes_{f}" for f in CATEGORICAL_FIELDS] + ["dates", "has_meta", "group"])
+        out.codes = {f: cols[f"codes_{f}"] for f in CATEGORICAL_FIELDS}
+        out.dates, out.has_meta, out.group = cols["dates"], cols["has_meta"], cols["group"]
+        out.vocab = {f: {} for f in CATEGORICAL_FIELDS}
+        out.vocab.update(json.loads((p / "vocab.json").read_text()))
+        out.parent_ids = open_string_table(p, "parent_ids")
+        out.parent_codes = None
+        return out
+
+    def key_doc_id(self, key: int) -> Optional[str]:
+        """Parent doc id of a negative group key, None for a plain slot."""
+        return self.parent_ids[-1 - key] if key < 0 else None
+
+    def mask(self, filters: Optional[Dict[str, str]], slots: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Boolean mask over slots (or just over `slots`, in that order), or None when no filter is set."""
+        if not filters:
+            return None
+
+        def col(a: np.ndarray) -> np.ndarray:
+            return a if slots is None else a[slots]
+
+        keep = None
+        for f in CATEGORICAL_FIELDS:
+            value = filters.get(f)
+            if not value:
+                continue
+            code = self.vocab[f].get(str(value), -2)  # -2 matches nothing
+            m = col(self.codes[f]) == code
+            keep = m if keep is None else keep & m
+        lo = _ordinal(filters.get("date_from")) if filters.get("date_from") else None
+        hi = _ordinal(filters.get("date_to")) if filters.get("date_to") else None
+        bad_bound = (filters.get("date_from") and lo is None) or (filters.get("date_to") and hi is None)
+        if (lo is not None or hi is not None) and not bad_bound:
+            dates = col(self.dates)
+            dated = dates != NO_DATE
+            m = np.ones(len(dates), dtype=bool)
+            if lo is not None:
+                m &= ~dated | (dates >= lo)
+            if hi is not None:
+                m &= ~dated | (dates <= hi)
+            keep = m if keep is None else keep & m
+        if keep is None:
+            return None
+        return keep | ~col(self.has_meta)
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+def _bucket(size: int) -> str:
+    # power-of-two upper bounds: 1, 2, 4, 8, ...
+    bound = 1
+    while bound < size:
+        bound *= 2
+    return f"le_{bound}"
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item async calls into batched calls of
+    `fn` (a list of items -> a sequence of results in the same order).
+
+    The first waiting item opens a batch; when calls are arriving less
+    than `window_ms` apart, the batch stays open that long for others to
+    join (up to `max_batch`), otherwise it goes out at once so an isolated
+    call pays no window. Batches run one at a time on a
+    dedicated thread, so concurrent requests share one forward pass
+    instead of contending for cores, and whatever queues up while a batch
+    runs goes out together in the next one.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], max_batch: int = 32, window_ms: float = 2.0):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batch")
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._last_arrival = float("-inf")
+        self._stats_lock = threading.Lock()
+        self.histogram: Counter = Counter()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # first call on this event loop (tests and scripts may run several loops)
+            self._loop, self._queue = loop, asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+        fut = loop.create_future()
+        now = loop.time()
+        busy = now - self._last_arrival < self.window_s
+        self._last_arrival = now
+        self._queue.put_nowait((item, fut, busy))
+        return await fut
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            if batch[0][2] and queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.window_s)  # concurrent traffic: let the others join
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            batch = [(item, fut) for item, fut, _ in batch if not fut.done()]  # callers that gave up
+            if not batch:
+                continue
+            with self._stats_lock:
+                self.histogram[_bucket(len(batch))] += 1
+                self.batches += 1
+                self.items += len(batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self.fn, [item for item, _ in batch])
+            except Exception as exc:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                continue
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch": self.items / self.batches if self.batches else 0.0,
+                "max_batch": self.max_batch,
+                "window_ms": self.window_s * 1000.0,
+                "histogram": dict(sorted(self.histogram.items(), key=lambda kv: int(kv[0][3:]))),
+            }
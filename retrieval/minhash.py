@@ -0,0 +1,267 @@
+import re
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from retrieval.mmap_io import load_arrays, open_string_table, read_manifest, replace_dir, write_manifest, write_string_table
+
+FORMAT = "minhash-lsh-v1"
+_WORD = re.compile(r"\w+")
+_MAX = np.uint32(0xFFFFFFFF)
+
+def _union_labels(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Connected-component labels (smallest member index) of n nodes joined by edges a[i]-b[i]."""
+    labels = np.arange(n, dtype=np.int64)
+    while len(a):
+        low = np.minimum(labels[a], labels[b])
+        before = labels.copy()
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        labels = labels[labels]  # pointer jumping
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+class MinHashIndex:
+    """
+    MinHash signatures (num_perm uint32 minima of hashed word shingles)
+    per document, banded for LSH: two documents land in the same bucket
+    of a band when its `num_perm / bands` values all agree, which for
+    Jaccard similarity J happens with probability 1 - (1 - J^rows)^bands.
+    Bucket-mates are verified against the threshold with the estimated
+    Jaccard (the fraction of equal signature values), so clustering costs
+    O(N * bands * log N) instead of comparing all pairs.
+
+    Documents are keyed by their version key: clause passages fold into
+    their contract's signature (the element-wise minimum, which is exactly
+    the MinHash of the union of their shingles).
+
+    On disk: signatures, band keys and per-band sort orders as .npy
+    columns (memory-mapped on load). Documents added later sit in a small
+    delta scanned linearly; superseded rows are masked until save().
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm, self.bands, self.shingle, self.seed = num_perm, bands, shingle, seed
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: the high 32 bits of (a * x + b) mod 2^64, a odd
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._band_mult = rng.integers(1, 2 ** 63, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+        self.keys: List[str] = []
+        self.sigs = np.zeros((0, num_perm), dtype=np.uint32)
+        self.band_keys = np.zeros((0, bands), dtype=np.uint64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.order = np.zeros((bands, 0), dtype=np.int64)  # main rows sorted by band key, per band
+        self.sorted_keys = np.zeros((bands, 0), dtype=np.uint64)  # band keys in that order (searchsorted)
+        self.n_main = 0
+        self._rows: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._row_map()
+
+    # ---- signatures ----
+    def signature(self, text: str) -> np.ndarray:
+        """num_perm minima over the text's word shingles (all 0xFFFFFFFF for an empty text)."""
+        toks = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in _WORD.findall(text.lower())), dtype=np.uint64)
+        if not len(toks):
+            return np.full(self.num_perm, _MAX, dtype=np.uint32)
+        k = min(self.shingle, len(toks))
+        shingles = np.zeros(len(toks) - k + 1, dtype=np.uint64)
+        for j in range(k):
+            shingles = shingles * np.uint64(0x100000001B3) + toks[j: len(toks) - k + 1 + j]
+        shingles = np.unique(shingles)
+        with np.errstate(over="ignore"):
+            hashed = (shingles[:, None] * self._a + self._b) >> np.uint64(32)
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def _bands(self, sigs: np.ndarray) -> np.ndarray:
+        rows = self.num_perm // self.bands
+        with np.errstate(over="ignore"):
+            parts = sigs.reshape(len(sigs), self.bands, rows).astype(np.uint64) * self._band_mult
+        return parts.sum(axis=2, dtype=np.uint64)
+
+    # ---- building and updates ----
+    def build(self, items: Iterable[Tuple[str, str]], key: Callable[[str], str] = lambda d: d):
+        """items: (doc_id, text), streamed; documents sharing key(doc_id) get one folded signature."""
+        rows: Dict[str, int] = {}
+        sigs: List[np.ndarray] = []
+        for doc_id, text in items:
+            k = key(doc_id)
+            sig = self.signature(text)
+            row = rows.get(k)
+            if row is None:
+                rows[k] = len(sigs)
+                sigs.append(sig)
+            else:
+                np.minimum(sigs[row], sig, out=sigs[row])
+        self.keys = list(rows)
+        self.sigs = np.vstack(sigs) if sigs else np.zeros((0, self.num_perm), dtype=np.uint32)
+        self.band_keys = self._bands(self.sigs)
+        self.alive = self.sigs[:, 0] != _MAX if len(self.sigs) else np.zeros(0, dtype=bool)
+        self._sort_main()
+        self.n_main = len(self.keys)
+        self._rows = rows
+
+    def _sort_main(self):
+        self.order = np.argsort(self.band_keys.T, axis=1, kind="stable").astype(np.int64)
+        self.sorted_keys = np.take_along_axis(self.band_keys.T, self.order, axis=1)
+
+    def _row_map(self) -> Dict[str, int]:
+        if self._rows is None:
+            self._rows = {k: i for i, k in enumerate(self.keys) if self.alive[i]}
+        return self._rows
+
+    def add(self, items: List[Tuple[str, str]], key: Callable[[str], str] = lambda d: d):
+        """
+        Index upserted documents: a document replaces its own signature, a
+        passage folds into its document's. Changed rows move to the delta.
+        """
+        if not items:
+            return
+        rows = self._row_map()
+        fresh: Dict[str, np.ndarray] = {}
+        for doc_id, text in items:
+            k = key(doc_id)
+            sig = self.signature(text)
+            if k != doc_id:
+                base = fresh.get(k)
+                if base is None and k in rows:
+                    base = self.sigs[rows[k]]
+                sig = sig if base is None else np.minimum(base, sig)
+            fresh[k] = sig
+        alive = np.concatenate([self.alive, np.zeros(len(fresh), dtype=bool)])
+        for k in fresh:
+            if k in rows:
+                alive[rows[k]] = False
+        new = np.vstack(list(fresh.values()))
+        start = len(self.keys)
+        alive[start:] = new[:, 0] != _MAX
+        # arrays before keys: a reader sizing itself on keys never indexes past the arrays
+        self.sigs = np.concatenate([self.sigs, new])
+        self.band_keys = np.concatenate([self.band_keys, self._bands(new)])
+        self.alive = alive
+        self.keys = self.keys + list(fresh)
+        for j, k in enumerate(fresh):
+            rows[k] = start + j
+
+    def delete(self, keys: Iterable[str]):
+        rows = self._row_map()
+        gone = [rows.pop(k) for k in keys if k in rows]
+        if gone:
+            alive = self.alive.copy()
+            alive[gone] = False
+            self.alive = alive
+
+    # ---- queries ----
+    def _verified(self, sigs: np.ndarray, a: np.ndarray, b: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        sim = (sigs[a] == sigs[b]).mean(axis=1)
+        ok = sim >= threshold
+        return np.stack([a[ok], b[ok]]), sim[ok]
+
+    def similar(self, key: str, threshold: float) -> List[Tuple[str, float]]:
+        """Other documents whose estimated Jaccard with `key` reaches `threshold`, most similar first."""
+        rows = self._row_map()
+        r = rows.get(key)
+        if r is None:
+            return []
+        keys, sigs, bkeys, alive, n_main = self.keys, self.sigs, self.band_keys, self.alive, self.n_main
+        order, srt_keys = self.order, self.sorted_keys
+        cand = []
+        for band in range(self.bands):
+            srt = srt_keys[band]
+            lo, hi = np.searchsorted(srt, bkeys[r, band], "left"), np.searchsorted(srt, bkeys[r, band], "right")
+            cand.append(np.asarray(order[band][lo:hi]))
+            cand.append(n_main + np.flatnonzero(bkeys[n_main: len(alive), band] == bkeys[r, band]))
+        cand = np.unique(np.concatenate(cand))
+        cand = cand[alive[cand] & (cand != r)]
+        sim = (sigs[cand] == sigs[r]).mean(axis=1)
+        keep = np.argsort(-sim, kind="stable")[: np.count_nonzero(sim >= threshold)]
+        return [(keys[i], float(s)) for i, s in zip(cand[keep].tolist(), sim[keep].tolist())]
+
+    def clusters(self, threshold: float, keys: Optional[List[str]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Version clusters among `keys` (default: the whole index), largest
+        first; each is [(key, estimated Jaccard with its first member)].
+        Unknown keys come back as singletons. Bucket-mates adjacent in each
+        band's sort order are verified and joined, so a cluster is a
+        connected component of verified near-duplicate pairs.
+        """
+        sigs, bkeys, alive = self.sigs, self.band_keys, self.alive
+        if keys is None:
+            rows = np.flatnonzero(alive)
+            names = [self.keys[i] for i in rows.tolist()]
+            unknown: List[str] = []
+        else:
+            row_map = self._row_map()
+            picked = list(dict.fromkeys(k for k in keys if k in row_map))
+            rows = np.asarray([row_map[k] for k in picked], dtype=np.int64)
+            names = picked
+            unknown = list(dict.fromkeys(k for k in keys if k not in row_map))
+        a_all, b_all = [], []
+        for band in range(self.bands):
+            col = bkeys[rows, band]
+            srt = np.argsort(col, kind="stable")
+            same = np.flatnonzero(col[srt[1:]] == col[srt[:-1]])
+            a_all.append(srt[same])
+            b_all.append(srt[same + 1])
+        a = np.concatenate(a_all) if a_all else np.zeros(0, dtype=np.int64)
+        b = np.concatenate(b_all) if b_all else np.zeros(0, dtype=np.int64)
+        if len(a):
+            pairs = np.unique(np.stack([np.minimum(a, b), np.maximum(a, b)]), axis=1)
+            (a, b), _ = self._verified(sigs, rows[pairs[0]], rows[pairs[1]], threshold)
+            pos = {r: i for i, r in enumerate(rows.tolist())}
+            a = np.asarray([pos[r] for r in a.tolist()], dtype=np.int64)
+            b = np.asarray([pos[r] for r in b.tolist()], dtype=np.int64)
+        labels = _union_labels(len(rows), a, b)
+        groups: Dict[int, List[int]] = {}
+        for i, lab in enumerate(labels.tolist()):
+            groups.setdefault(lab, []).append(i)
+        out = []
+        for members in groups.values():
+            head = sigs[rows[members[0]]]
+            sim = (sigs[rows[members]] == head).mean(axis=1)
+            out.append([(names[i], float(s)) for i, s in zip(members, sim.tolist())])
+        out.extend([[(k, 1.0)] for k in unknown])
+        out.sort(key=len, reverse=True)
+        return out
+
+    # ---- persistence ----
+    def save(self, path: str):
+        """Write the live rows as a fresh main segment (re-sorted per band)."""
+        final = Path(path)
+        tmp = final.with_name(final.name + ".tmp")
+        if tmp.exists():
+            replace_dir(tmp, tmp.with_name(tmp.name + ".stale"))
+        tmp.mkdir(parents=True)
+        live = np.flatnonzero(self.alive)
+        sigs, bkeys = np.asarray(self.sigs)[live], np.asarray(self.band_keys)[live]
+        np.save(tmp / "sigs.npy", sigs)
+        np.save(tmp / "band_keys.npy", bkeys)
+        order = np.argsort(bkeys.T, axis=1, kind="stable").astype(np.int64)
+        np.save(tmp / "order.npy", order)
+        np.save(tmp / "sorted_keys.npy", np.take_along_axis(bkeys.T, order, axis=1))
+        write_string_table(tmp, "keys", [self.keys[i] for i in live.tolist()])
+        write_manifest(tmp, {"format": FORMAT, "num_perm": self.num_perm, "bands": self.bands,
+                             "shingle": self.shingle, "seed": self.seed, "docs": int(len(live))})
+        replace_dir(tmp, final)
+
+    @classmethod
+    def load(cls, path: str) -> "MinHashIndex":
+        p = Path(path)
+        manifest = read_manifest(p)
+        if manifest.get("format") != FORMAT:
+            raise ValueError(f"Unsupported MinHash index format in {p}: {manifest.get('format')}")
+        out = cls(manifest["num_perm"], manifest["bands"], manifest["shingle"], manifest["seed"])
+        cols = load_arrays(p, ["sigs", "band_keys", "order", "sorted_keys"])
+        out.sigs, out.band_keys = cols["sigs"], cols["band_keys"]
+        out.order, out.sorted_keys = cols["order"], cols["sorted_keys"]
+        out.keys = list(open_string_table(p, "keys"))
+        out.alive = np.ones(len(out.keys), dtype=bool)
+        out.n_main = len(out.keys)
+        return out
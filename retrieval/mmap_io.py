@@ -0,0 +1,85 @@
+import bisect
+import json
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import numpy as np
+
+class StringTable:
+    """
+    Read-only sequence of strings backed by a UTF-8 blob plus an int64
+    offsets array, both memory-mapped. Indexing decodes a single entry, so
+    opening a table costs the same regardless of how many strings it holds.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        lo, hi = self._offsets[i], self._offsets[i + 1]
+        return self._blob[lo:hi].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get(self, key: str, default=None) -> Optional[int]:
+        """Position of `key` in a table written with sorted=True (binary search)."""
+        i = bisect.bisect_left(self, key)
+        if i < len(self) and self[i] == key:
+            return i
+        return default
+
+def write_string_table(dir_path: Path, name: str, strings: Iterable[str]):
+    # streamed: only the offsets (8 bytes per string) are held while writing
+    offsets = array("q", [0])
+    with open(dir_path / f"{name}.bin", "wb") as fh:
+        for s in strings:
+            b = s.encode("utf-8")
+            fh.write(b)
+            offsets.append(offsets[-1] + len(b))
+    np.save(dir_path / f"{name}_offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+
+def open_string_table(dir_path: Path, name: str) -> StringTable:
+    blob_p = dir_path / f"{name}.bin"
+    # np.memmap refuses zero-length files
+    if blob_p.stat().st_size:
+        blob = np.memmap(blob_p, dtype=np.uint8, mode="r")
+    else:
+        blob = np.zeros(0, dtype=np.uint8)
+    return StringTable(blob, np.load(dir_path / f"{name}_offsets.npy", mmap_mode="r"))
+
+def load_arrays(dir_path: Path, names: Iterable[str]) -> Dict[str, np.ndarray]:
+    return {n: np.load(dir_path / f"{n}.npy", mmap_mode="r") for n in names}
+
+def replace_dir(tmp: Path, final: Path):
+    """
+    Move a fully written `tmp` directory into place. Processes that already
+    mapped files from the old directory keep reading the old inodes.
+    """
+    old = final.with_name(final.name + ".old")
+    if old.exists():
+        shutil.rmtree(old)
+    if final.exists():
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+
+def write_manifest(dir_path: Path, manifest: dict):
+    (dir_path / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+def read_manifest(dir_path: Path) -> dict:
+    return json.loads((dir_path / "manifest.json").read_text())
@@ -0,0 +1,98 @@
+import multiprocessing as mp
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from retrieval.encoders import ONNX_DIR, load_encoder
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_encoder = None  # per worker process
+
+def _init_worker(model_name: str, backend: str, onnx_dir: str, threads: int):
+    # must run before torch / onnxruntime size their thread pools in this process
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    global _encoder
+    _encoder = load_encoder(model_name, backend, Path(onnx_dir), threads=threads)
+
+def _encode(texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(_encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+
+class EncoderPool:
+    """
+    Sentence encoder spread over worker processes, each holding its own
+    model copy with a capped torch/ORT thread count. encode() has the
+    SentenceTransformer signature, so it can stand in for the model: each
+    call splits its texts across the workers and returns rows in input
+    order. workers <= 1 encodes in-process.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", workers: int = 1,
+                 threads_per_worker: int = 0, onnx_dir: Path = ONNX_DIR):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self._local = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dim: Optional[int] = None
+        if self.workers > 1:
+            if backend == "onnx":
+                load_encoder(model_name, backend, onnx_dir)  # export once here, not in every worker
+            # spawn: forked children would inherit the parent's torch thread pools
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name, backend, str(onnx_dir), self.threads),
+            )
+        else:
+            self._local = load_encoder(model_name, backend, onnx_dir, threads=threads_per_worker)
+
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, **_) -> np.ndarray:
+        if self._executor is None:
+            return np.asarray(self._local.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # one slice per worker, but no slice smaller than a batch
+        n_parts = max(1, min(self.workers, len(texts) // batch_size))
+        bounds = np.linspace(0, len(texts), n_parts + 1).astype(int)
+        parts = [texts[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+        out = np.vstack(list(self._executor.map(_encode, parts, [batch_size] * len(parts))))
+        self._dim = out.shape[1]
+        return out
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._local is not None:
+            return self._local.get_sentence_embedding_dimension()
+        if self._dim is None:
+            self._dim = self.encode(["dimension probe"], batch_size=1).shape[1]
+        return self._dim
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak RSS of this process and of the largest finished child process."""
+    if resource is None:
+        return {}
+    scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024  # bytes on macOS, KiB elsewhere
+    return {
+        "main": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "worker": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
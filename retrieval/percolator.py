@@ -0,0 +1,146 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from retrieval.bm25_local import BM25Local
+from retrieval.embed_faiss import EmbedFAISS
+from retrieval.meta_columns import MetaColumns
+
+Match = Tuple[str, int, Optional[float], Optional[float]]  # (saved query, new doc position, bm25, faiss)
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.sort(np.asarray(scores, dtype=np.float64))[::-1][:k]
+
+class Percolator:
+    """
+    Saved queries indexed for reverse matching. A new document is scored
+    only against the saved queries sharing a term with it (inverted index
+    term -> queries, BM25 with the live index statistics) and against the
+    saved query vectors (one matrix product), never against the corpus.
+
+    A document matches a saved query when it would enter the query's top-k
+    in a retriever the query weights: its score beats the k-th best score
+    the query had when the percolator was built (its bar). Bars rise as
+    matching documents come in; deletions are not tracked until the next
+    rebuild, so a stale bar only ever suppresses alerts.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.filter_groups: Dict[Tuple, List[int]] = {}
+        self.term_queries: Dict[str, List[Tuple[int, int]]] = {}  # token -> [(query, count in query)]
+        self.k = np.zeros(0, dtype=np.int64)
+        self.use_bm25 = np.zeros(0, dtype=bool)
+        self.use_faiss = np.zeros(0, dtype=bool)
+        self.qv = np.zeros((0, 0), dtype=np.float32)
+        self.bm25_top: List[np.ndarray] = []
+        self.faiss_top: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def build(cls, saved: Dict[str, Dict], bm25: BM25Local, faissi: EmbedFAISS, meta_cols: MetaColumns) -> "Percolator":
+        """Index `saved` (name -> QueryRequest payload) and take each query's bars from one top-k search."""
+        out = cls()
+        texts = []
+        for name, payload in saved.items():
+            text = " ".join(str(payload.get("query") or "").split())
+            if not text:
+                continue
+            i = len(out.names)
+            out.names.append(name)
+            texts.append(text)
+            key = tuple(sorted((payload.get("filters") or {}).items()))
+            out.filter_groups.setdefault(key, []).append(i)
+            for tok, c in Counter(BM25Local._tokenize(text)).items():
+                out.term_queries.setdefault(tok, []).append((i, c))
+        n = len(out.names)
+        pick = [saved[name] for name in out.names]
+        out.k = np.asarray([int(p.get("k") or 10) for p in pick], dtype=np.int64)
+        out.use_bm25 = np.asarray([bool(p.get("bm25_weight", 0.5)) for p in pick], dtype=bool) & bool(bm25.bm25)
+        has_faiss = faissi.ntotal > 0
+        out.use_faiss = np.asarray([bool(p.get("faiss_weight", 0.5)) for p in pick], dtype=bool) & has_faiss
+        out.bm25_top = [np.zeros(0) for _ in range(n)]
+        out.faiss_top = [np.zeros(0) for _ in range(n)]
+        if out.use_faiss.any():
+            out.qv = faissi.encode_queries(texts)
+
+        # one batched search per filter and retriever
+        for key, members in out.filter_groups.items():
+            allow = meta_cols.mask(dict(key))
+            k = int(out.k[members].max())
+            rows = [i for i in members if out.use_bm25[i]]
+            for i, (_, scores) in zip(rows, bm25.query_slots([texts[i] for i in rows], k=k, allow=allow) if rows else []):
+                out.bm25_top[i] = _top(scores, out.k[i])
+            rows = [i for i in members if out.use_faiss[i]]
+            if rows:
+                for i, (_, scores) in zip(rows, faissi.search_slots(out.qv[rows], k=k, allow=allow)):
+                    out.faiss_top[i] = _top(scores, out.k[i])
+        return out
+
+    def _bars(self, tops: List[np.ndarray]) -> np.ndarray:
+        # fewer than k results so far: anything the retriever returns gets in
+        return np.asarray([t[k - 1] if len(t) >= k else -np.inf for t, k in zip(tops, self.k)], dtype=np.float64)
+
+    def match(
+        self,
+        items: List[Tuple[str, str]],
+        slots: List[int],
+        vectors: Optional[np.ndarray],
+        bm25: BM25Local,
+        meta_cols: MetaColumns,
+    ) -> List[Match]:
+        """
+        Saved queries matched by the just-indexed `items` at `slots`
+        (`vectors`: their embeddings). Cost is O(new docs x (terms +
+        candidate queries)) for BM25 plus one (new docs x queries) product.
+        """
+        n, q = len(items), len(self)
+        if not n or not q:
+            return []
+        allowed = np.ones((q, n), dtype=bool)
+        slots_a = np.asarray(slots, dtype=np.int64)
+        for key, members in self.filter_groups.items():
+            m = meta_cols.mask(dict(key), slots=slots_a)
+            if m is not None:
+                allowed[members] = m
+
+        # BM25 exactly as the delta segment scores it: live idf, main-segment length normalisation
+        bm25_s = np.zeros((q, n), dtype=np.float64)
+        if self.use_bm25.any():
+            toks = [bm25._tokenize(t) for _, t in items]
+            idf = bm25._global_idf({t for ts in toks for t in ts if t in self.term_queries})
+            avgdl = bm25.avgdl or (sum(map(len, toks)) / n) or 1.0
+            k1, b = bm25.k1, bm25.b
+            for j, ts in enumerate(toks):
+                norm = 1.0 - b + b * len(ts) / avgdl
+                for tok, tf in Counter(ts).items():
+                    posting = self.term_queries.get(tok)
+                    if posting is None:
+                        continue
+                    w = idf[tok] * tf * (k1 + 1.0) / (tf + k1 * norm)
+                    for i, c in posting:
+                        bm25_s[i, j] += c * w
+        bm25_hit = self.use_bm25[:, None] & allowed & (bm25_s > 0) & (bm25_s > self._bars(self.bm25_top)[:, None])
+
+        faiss_s = np.zeros((q, n), dtype=np.float64)
+        faiss_hit = np.zeros((q, n), dtype=bool)
+        if self.use_faiss.any() and vectors is not None and len(vectors):
+            faiss_s = self.qv.astype(np.float64) @ np.asarray(vectors, dtype=np.float64).T
+            faiss_hit = self.use_faiss[:, None] & allowed & (faiss_s > self._bars(self.faiss_top)[:, None])
+
+        out: List[Match] = []
+        for i in np.flatnonzero((bm25_hit | faiss_hit).any(axis=1)).tolist():
+            k = int(self.k[i])
+            if bm25_hit[i].any():
+                self.bm25_top[i] = _top(np.r_[self.bm25_top[i], bm25_s[i, bm25_hit[i]]], k)
+            if faiss_hit[i].any():
+                self.faiss_top[i] = _top(np.r_[self.faiss_top[i], faiss_s[i, faiss_hit[i]]], k)
+            for j in np.flatnonzero(bm25_hit[i] | faiss_hit[i]).tolist():
+                out.append((
+                    self.names[i],
+                    j,
+                    float(bm25_s[i, j]) if bm25_hit[i, j] else None,
+                    float(faiss_s[i, j]) if faiss_hit[i, j] else None,
+                ))
+        return out
@@ -1,5 +1,6 @@
 from collections import defaultdict
 from typing import List, Tuple, Dict
+import numpy as np
 
 def rrf_fuse(rankings: List[List[Tuple[str, float]]], k: int = 10, k_rrf: int = 60) -> List[Tuple[str, float]]:
     """
@@ -20,3 +21,31 @@ def rrf_fuse(rankings: List[List[Tuple[str, float]]], k: int = 10, k_rrf: int =
 
     fused = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
     return fused
+
+def first_occurrence(ids: np.ndarray) -> np.ndarray:
+    """`ids` with repeats dropped, order kept."""
+    _, first = np.unique(ids, return_index=True)
+    return ids[np.sort(first)]
+
+def rrf_fuse_arrays(rankings: List[np.ndarray], k: int = 10, k_rrf: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    rrf_fuse over integer id arrays (best first). As in rrf_fuse, an id
+    repeated within a ranking is scored once, at its last position, and
+    ties keep the order in which ids first appear across the rankings.
+    Returns (ids, scores) of the fused top-k.
+    """
+    lists = [np.asarray(r, dtype=np.int64) for r in rankings]
+    if not lists or not sum(len(r) for r in lists):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    ids = np.concatenate(lists)
+    contrib = []
+    for r in lists:
+        last = len(r) - 1 - np.unique(r[::-1], return_index=True)[1]
+        c = np.zeros(len(r))
+        c[last] = 1.0 / (k_rrf + last + 1)
+        contrib.append(c)
+    contrib = np.concatenate(contrib)
+    uniq, first, inv = np.unique(ids, return_index=True, return_inverse=True)
+    scores = np.bincount(inv, weights=contrib)
+    order = np.lexsort((first, -scores))[:k]
+    return uniq[order], scores[order]
@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS saved_queries (name TEXT PRIMARY KEY, payload TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS watchlists (name TEXT PRIMARY KEY, doc_ids TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, name TEXT NOT NULL, doc_id TEXT NOT NULL,
+    bm25_score REAL, faiss_score REAL, created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_by_name ON alerts (kind, name, id);
+"""
+
+class SavedStore:
+    """
+    Saved queries and watchlists in an SQLite database (WAL mode), keyed
+    by name. Every write is a single-row upsert/delete in its own
+    transaction, so concurrent workers never lose each other's updates.
+
+    Listings are served from an in-process cache that is dropped on our
+    own writes and, when PRAGMA data_version shows another process
+    committed, for the tables whose revision counter moved (so a stream of
+    alert inserts does not evict the saved queries). The returned dicts
+    are shared and replaced rather than mutated: treat them as read-only.
+
+    Alerts (percolator matches) are append-only rows per saved query or
+    watchlist, read back in id order.
+    """
+
+    def __init__(self, path: Path, legacy_json: Optional[Path] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._cache: Dict[str, Dict] = {}
+        self._version: Optional[int] = None
+        self._revs: Dict[str, str] = {}
+        if legacy_json is not None:
+            self._migrate(Path(legacy_json))
+
+    def _migrate(self, legacy: Path):
+        """Import a saved_store.json once; later starts (and other workers) skip it."""
+        if not legacy.exists():
+            return
+        with self._lock, self._tx() as cur:
+            done = cur.execute("SELECT 1 FROM store_meta WHERE key = 'migrated_json'").fetchone()
+            if not done:
+                try:
+                    data = json.loads(legacy.read_text())
+                except ValueError:
+                    data = {}
+                now = time.time()
+                # existing rows win: they were written after the JSON store was retired
+                cur.executemany(
+                    "INSERT OR IGNORE INTO saved_queries VALUES (?, ?, ?)",
+                    [(n, json.dumps(p), now) for n, p in (data.get("saved_queries") or {}).items()],
+                )
+                cur.executemany(
+                    "INSERT OR IGNORE INTO watchlists VALUES (?, ?, ?)",
+                    [(n, json.dumps(list(d)), now) for n, d in (data.get("watchlists") or {}).items()],
+                )
+                cur.execute("INSERT INTO store_meta VALUES ('migrated_json', ?)", (str(legacy),))
+                self._bump(cur, "saved_queries")
+                self._bump(cur, "watchlists")
+        if not done:
+            os.replace(legacy, legacy.with_name(legacy.name + ".migrated"))
+
+    @contextmanager
+    def _tx(self):
+        # caller holds the lock; IMMEDIATE takes the write lock up front so concurrent writers queue
+        cur = self._conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            yield cur
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("COMMIT")
+
+    def _bump(self, cur: sqlite3.Cursor, table: str):
+        key = f"rev:{table}"
+        cur.execute("INSERT INTO store_meta VALUES (?, '1') ON CONFLICT(key) DO UPDATE SET value = value + 1", (key,))
+        self._revs[key] = cur.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()[0]
+        self._cache.pop(table, None)
+
+    # ---- cache ----
+    def _fresh(self):
+        # caller holds the lock
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            revs = dict(self._conn.execute("SELECT key, value FROM store_meta WHERE key LIKE 'rev:%'").fetchall())
+            for table in list(self._cache):
+                if revs.get(f"rev:{table}") != self._revs.get(f"rev:{table}"):
+                    del self._cache[table]
+            self._revs, self._version = revs, version
+
+    def _all(self, table: str, column: str) -> Dict:
+        with self._lock:
+            self._fresh()
+            if table not in self._cache:
+                rows = self._conn.execute(f"SELECT name, {column} FROM {table} ORDER BY name").fetchall()
+                self._cache[table] = {name: json.loads(value) for name, value in rows}
+            return self._cache[table]
+
+    def _get(self, table: str, column: str, name: str):
+        with self._lock:
+            self._fresh()
+            cached = self._cache.get(table)
+            if cached is not None:
+                return cached.get(name)
+            row = self._conn.execute(f"SELECT {column} FROM {table} WHERE name = ?", (name,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def _put(self, table: str, column: str, name: str, value):
+        with self._lock, self._tx() as cur:
+            cur.execute(
+                f"INSERT INTO {table} VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                f"{column} = excluded.{column}, updated_at = excluded.updated_at",
+                (name, json.dumps(value), time.time()),
+            )
+            self._bump(cur, table)
+
+    def _delete(self, table: str, kind: str, name: str) -> bool:
+        with self._lock, self._tx() as cur:
+            deleted = cur.execute(f"DELETE FROM {table} WHERE name = ?", (name,)).rowcount > 0
+            cur.execute("DELETE FROM alerts WHERE kind = ? AND name = ?", (kind, name))
+            self._bump(cur, table)
+            return deleted
+
+    # ---- saved queries ----
+    def saved_queries(self) -> Dict[str, Dict]:
+        return self._all("saved_queries", "payload")
+
+    def get_query(self, name: str) -> Optional[Dict]:
+        return self._get("saved_queries", "payload", name)
+
+    def save_query(self, name: str, payload: Dict):
+        self._put("saved_queries", "payload", name, payload)
+
+    def delete_query(self, name: str) -> bool:
+        return self._delete("saved_queries", "query", name)
+
+    # ---- watchlists ----
+    def watchlists(self) -> Dict[str, List[str]]:
+        return self._all("watchlists", "doc_ids")
+
+    def get_watchlist(self, name: str) -> Optional[List[str]]:
+        return self._get("watchlists", "doc_ids", name)
+
+    def save_watchlist(self, name: str, doc_ids: List[str]):
+        self._put("watchlists", "doc_ids", name, list(dict.fromkeys(doc_ids)))
+
+    def delete_watchlist(self, name: str) -> bool:
+        return self._delete("watchlists", "watchlist", name)
+
+    # ---- alerts ----
+    def add_alerts(self, rows: Iterable[Tuple[str, str, str, Optional[float], Optional[float]]]) -> int:
+        """rows: (kind, name, doc_id, bm25_score, faiss_score); one transaction for the batch."""
+        now = time.time()
+        rows = [(kind, name, doc_id, b, f, now) for kind, name, doc_id, b, f in rows]
+        if not rows:
+            return 0
+        with self._lock, self._tx() as cur:
+            cur.executemany(
+                "INSERT INTO alerts (kind, name, doc_id, bm25_score, faiss_score, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def alerts(self, kind: Optional[str] = None, name: Optional[str] = None, since: int = 0,
+               limit: int = 100) -> List[Dict]:
+        """Alerts with id > `since`, oldest first; pass the last id back as `since` to page."""
+        where, args = ["id > ?"], [since]
+        if kind:
+            where.append("kind = ?")
+            args.append(kind)
+        if name:
+            where.append("name = ?")
+            args.append(name)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, name, doc_id, bm25_score, faiss_score, created_at FROM alerts "
+                f"WHERE {' AND '.join(where)} ORDER BY id LIMIT ?",
+                (*args, limit),
+            ).fetchall()
+        cols = ("id", "kind", "name", "doc_id", "bm25_score", "faiss_score", "created_at")
+        return [dict(zip(cols, r)) for r in rows]
+
+    def clear_alerts(self, kind: str, name: str) -> int:
+        with self._lock, self._tx() as cur:
+            return cur.execute("DELETE FROM alerts WHERE kind = ? AND name = ?", (kind, name)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,674 @@
+import multiprocessing as mp
+import os
+import threading
+import weakref
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+import faiss
+from retrieval.bm25_local import BM25Local
+from retrieval.embed_faiss import EmbedFAISS, IndexConfig, VectorSample
+from retrieval.mmap_io import load_arrays, open_string_table, read_manifest, write_manifest, write_string_table
+
+SHARDS = "shards"
+FORMAT = "shards-v1"
+TRANSPORTS = ("process", "inline")
+
+Hits = Tuple[np.ndarray, np.ndarray]
+
+def _empty() -> Hits:
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+def shard_key(doc_id: str) -> str:
+    # passages ("<doc>#<clause>") hash as their document, so a contract never straddles shards
+    return doc_id.split("#", 1)[0]
+
+def shard_of(doc_id: str, n_shards: int) -> int:
+    """Stable shard of `doc_id` (crc32, identical across processes and runs)."""
+    if n_shards <= 1:
+        return 0
+    return zlib.crc32(shard_key(doc_id).encode("utf-8")) % n_shards
+
+def shard_dir(root: Path, shard: int) -> Path:
+    return Path(root) / f"{shard:03d}"
+
+# ---- building ----
+def _build_bm25_shard(corpus: Callable[..., Iterable[Tuple[str, str]]], args: tuple, shard: int, n_shards: int,
+                      root: str) -> int:
+    bm25 = BM25Local()
+    bm25.build((d, t) for d, t in corpus(*args) if shard_of(d, n_shards) == shard)
+    bm25.save(str(shard_dir(root, shard) / "bm25"))
+    return len(bm25.doc_ids)
+
+def build_bm25_shards(corpus: Callable[..., Iterable[Tuple[str, str]]], args: tuple, n_shards: int, root: Path,
+                      workers: int = 1) -> List[int]:
+    """
+    Build the BM25 index of every shard under `root`, one worker process
+    per shard (up to `workers`): each streams `corpus(*args)` and keeps
+    the documents hashing to its shard. Collection statistics are then
+    applied to all shards. Returns the shard sizes.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    shards = list(range(n_shards))
+    jobs = ([corpus] * n_shards, [args] * n_shards, shards, [n_shards] * n_shards, [str(root)] * n_shards)
+    if workers > 1 and n_shards > 1:
+        with ProcessPoolExecutor(min(workers, n_shards), mp_context=mp.get_context("spawn")) as ex:
+            sizes = list(ex.map(_build_bm25_shard, *jobs))
+    else:
+        sizes = list(map(_build_bm25_shard, *jobs))
+    write_collection(root, n_shards, workers)
+    return sizes
+
+def build_faiss_shards(items: Iterable[Tuple[str, str]], encoder: EmbedFAISS, n_shards: int, root: Path,
+                       chunk_size: int = 8192, sample: Optional[VectorSample] = None) -> List[int]:
+    """
+    Build the FAISS index of every shard under `root` in one pass over
+    `items`: each chunk is encoded once by `encoder` (with its embedding
+    store / encoder pool) and its vectors are routed to the index of the
+    shard each document hashes to. Returns the shard sizes.
+    """
+    parts = [EmbedFAISS(encoder.model_name, encoder.config, model_loader=lambda: encoder.model, backend=encoder.backend)
+             for _ in range(n_shards)]
+    for part in parts:
+        part.start_build()
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            break
+        emb = encoder.encode_corpus([t for _, t in chunk])
+        if sample is not None:
+            sample.add(emb)
+        shard = np.fromiter((shard_of(d, n_shards) for d, _ in chunk), dtype=np.int64, count=len(chunk))
+        for s in np.unique(shard):
+            rows = np.flatnonzero(shard == s)
+            parts[s].build_add([chunk[i][0] for i in rows], emb[rows])
+    for s, part in enumerate(parts):
+        part.finish_build()
+        if part.index is not None:
+            part.save(str(shard_dir(root, s) / "faiss"))
+    return [len(part.doc_ids) for part in parts]
+
+def _apply_collection(root: str, shard: int):
+    root_p = Path(root)
+    manifest = read_manifest(root_p)
+    vocab = {t: i for i, t in enumerate(open_string_table(root_p, "vocab"))}
+    df = np.load(root_p / "df.npy")
+    path = shard_dir(root_p, shard) / "bm25"
+    bm25 = BM25Local()
+    bm25.load(str(path))
+    own = np.fromiter((vocab[t] for t in bm25.vocab), dtype=np.int64, count=len(bm25.vocab))
+    bm25.apply_collection_stats(manifest["n_docs"], manifest["avgdl"], df[own], manifest["idf_floor"])
+    bm25.save(str(path))
+
+def write_collection(root: Path, n_shards: int, workers: int = 1):
+    """
+    Merge the document frequencies, sizes and lengths of the saved BM25
+    shards under `root` into collection statistics (written to `root`,
+    with the shard manifest) and re-weight every shard with them, so each
+    scores exactly as one index over the whole corpus would.
+    """
+    root = Path(root)
+    df_total: Counter = Counter()
+    n_docs, total_len, params = 0, 0.0, None
+    for s in range(n_shards):
+        path = shard_dir(root, s) / "bm25"
+        manifest = read_manifest(path)
+        cols = load_arrays(path, ["indptr", "doc_len", "live"])
+        df_total.update(dict(zip(open_string_table(path, "vocab"), np.diff(cols["indptr"]).tolist())))
+        n_docs += manifest["n_docs"]
+        total_len += float(np.asarray(cols["doc_len"], dtype=np.float64)[np.asarray(cols["live"], dtype=bool)].sum())
+        params = (manifest["k1"], manifest["b"], manifest["epsilon"])
+    k1, b, epsilon = params or (1.5, 0.75, 0.25)
+    terms = sorted(df_total)
+    df = np.asarray([df_total[t] for t in terms], dtype=np.int64)
+    # the same idf and floor BM25Local computes for a single index
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    write_string_table(root, "vocab", terms)
+    np.save(root / "df.npy", df)
+    write_manifest(root, {
+        "format": FORMAT,
+        "shards": n_shards,
+        "n_docs": n_docs,
+        "avgdl": total_len / n_docs if n_docs else 0.0,
+        "idf_floor": epsilon * (float(idf.mean()) if len(idf) else 0.0),
+        "k1": k1,
+        "b": b,
+        "epsilon": epsilon,
+    })
+    jobs = ([str(root)] * n_shards, list(range(n_shards)))
+    if workers > 1 and n_shards > 1:
+        with ProcessPoolExecutor(min(workers, n_shards), mp_context=mp.get_context("spawn")) as ex:
+            list(ex.map(_apply_collection, *jobs))
+    else:
+        list(map(_apply_collection, *jobs))
+
+# ---- serving ----
+class Shard:
+    """
+    One shard's BM25 and FAISS indices, addressed by local slots: what a
+    shard server holds. Vectors are encoded by the caller, so no model is
+    ever loaded here.
+    """
+
+    def __init__(self, path: str, config: IndexConfig, model_name: str = "", backend: str = "torch"):
+        p = Path(path)
+        self.bm25 = BM25Local()
+        if (p / "bm25" / "manifest.json").exists():
+            self.bm25.load(str(p / "bm25"))
+        self.faiss = EmbedFAISS(model_name, config, query_cache_size=0, backend=backend)
+        if (p / "faiss" / "index.faiss").exists():
+            self.faiss.load(str(p / "faiss"))
+
+    def bm25_search(self, queries: List[str], k: int, allow: Optional[np.ndarray],
+                    idfs: Optional[List[Dict[str, float]]]) -> List[Hits]:
+        return self.bm25.query_slots(queries, k=k, allow=allow, idfs=idfs)
+
+    def faiss_search(self, qv: np.ndarray, k: int, allow: Optional[np.ndarray]) -> List[Hits]:
+        return self.faiss.search_slots(qv, k=k, allow=allow)
+
+    def bm25_add(self, items: List[Tuple[str, str]]) -> Tuple[List[int], List[int]]:
+        return self.bm25.add(items)
+
+    def bm25_delete(self, doc_ids: List[str]) -> List[int]:
+        return self.bm25.delete(doc_ids)
+
+    def faiss_add(self, doc_ids: List[str], slots: List[int], emb: np.ndarray):
+        self.faiss.add_vectors(doc_ids, slots, emb)
+
+    def faiss_delete(self, slots: List[int]):
+        self.faiss.delete(slots)
+
+    def faiss_memory(self) -> Dict[str, Any]:
+        return self.faiss.memory_stats()
+
+    def merge_deltas(self):
+        self.bm25.merge_deltas()
+
+    def save_compacted(self, path: str):
+        """Write this shard with its deltas and tombstones folded in (slots are preserved)."""
+        p = Path(path)
+        self.bm25.compacted().save(str(p / "bm25"))
+        # a compacted copy: the shard keeps serving from the one it has
+        faissi = self.faiss.compacted()
+        if faissi.index is not None:
+            faissi.save(str(p / "faiss"))
+
+def _serve(conn, path: str, config: IndexConfig, model_name: str, backend: str, threads: int):
+    """Shard server loop: (method, args) requests in, (ok, result) replies out, until None."""
+    faiss.omp_set_num_threads(threads)
+    try:
+        shard = Shard(path, config, model_name, backend)
+    except Exception as exc:
+        conn.send((False, exc))
+        return
+    conn.send((True, None))
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            return
+        name, args = msg
+        try:
+            conn.send((True, getattr(shard, name)(*args)))
+        except Exception as exc:
+            conn.send((False, exc))
+
+class _InlineShard:
+    """A shard held in this process; requests are plain method calls."""
+
+    def __init__(self, path: Path, config: IndexConfig, model_name: str, backend: str):
+        self._shard = Shard(str(path), config, model_name, backend)
+        self._request: Optional[Tuple[str, tuple]] = None
+        self.lock = threading.Lock()
+
+    def ready(self):
+        pass
+
+    def send(self, name: str, args: tuple):
+        self._request = (name, args)
+
+    def recv(self) -> Any:
+        (name, args), self._request = self._request, None
+        return getattr(self._shard, name)(*args)
+
+    def close(self):
+        pass
+
+class _ProcessShard:
+    """
+    A shard server in its own process. Requests and replies are pickled
+    over a pipe, a stand-in for a network transport: nothing but the
+    shard directory is shared with the caller.
+    """
+
+    def __init__(self, ctx, path: Path, config: IndexConfig, model_name: str, backend: str, threads: int):
+        self._conn, child = ctx.Pipe()
+        self._proc = ctx.Process(target=_serve, args=(child, str(path), config, model_name, backend, threads),
+                                 name=f"retrieval-shard-{path.name}", daemon=True)
+        self._proc.start()
+        child.close()
+        self.lock = threading.Lock()
+
+    def ready(self):
+        self.recv()
+
+    def send(self, name: str, args: tuple):
+        self._conn.send((name, args))
+
+    def recv(self) -> Any:
+        ok, result = self._conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._proc.join(timeout=5)
+        if self._proc.is_alive():
+            self._proc.terminate()
+
+def _close_all(clients: List):
+    for c in clients:
+        c.close()
+
+class ShardSet:
+    """
+    The shards of one index generation behind their clients, plus the
+    bookkeeping that makes them look like a single index: global slots
+    (shard main segments in shard order, then additions in arrival order)
+    mapped to (shard, local slot), the collection statistics, and the
+    delta document frequencies that keep BM25 idf global between
+    compactions. ShardedBM25 / ShardedFAISS are the views the service
+    queries; each request fans out to every shard at once and the
+    per-shard top-k lists are merged.
+
+    Only the main process writes (under the service's write lock);
+    readers snapshot the slot maps, which writers replace rather than
+    mutate.
+    """
+
+    def __init__(self, root: Path, clients: List, doc_ids: List[str], sizes: List[int], collection: Dict):
+        self.root = Path(root)
+        self.clients = clients
+        self.n = len(clients)
+        self.collection = collection
+        self._vocab = open_string_table(self.root, "vocab")
+        self._df = np.load(self.root / "df.npy", mmap_mode="r")
+        self.doc_ids = doc_ids  # global slot -> doc id, append-only
+        bases = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.owner = np.repeat(np.arange(self.n, dtype=np.int32), sizes)
+        self.local = np.concatenate([np.arange(n, dtype=np.int64) for n in sizes] or [np.zeros(0, dtype=np.int64)])
+        self.to_global = [np.arange(bases[s], bases[s + 1], dtype=np.int64) for s in range(self.n)]
+        self.delta_df: Counter = Counter()
+        self.pending_docs = 0
+        self.segments: List[Tuple[int, int]] = []  # (shard, docs) of each pending BM25 delta segment
+        self.bm25_tombstones: FrozenSet[int] = frozenset()
+        self.faiss_main = 0
+        self.faiss_pending = 0
+        self.faiss_tombstones: FrozenSet[int] = frozenset()
+        self._finalizer = weakref.finalize(self, _close_all, list(clients))
+
+    @classmethod
+    def open(cls, root: Path, config: IndexConfig, model_name: str = "", backend: str = "torch",
+             transport: str = "process") -> "ShardSet":
+        """Start a server (or inline shard) per shard under `root`; they load in parallel."""
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown shard transport {transport!r}; expected one of {TRANSPORTS}")
+        root = Path(root)
+        collection = read_manifest(root)
+        if collection.get("format") != FORMAT:
+            raise ValueError(f"Unsupported shard layout in {root}: {collection.get('format')}")
+        n = collection["shards"]
+        paths = [shard_dir(root, s) for s in range(n)]
+        if transport == "process":
+            ctx = mp.get_context("spawn")
+            threads = max(1, (os.cpu_count() or 1) // n)
+            clients = [_ProcessShard(ctx, p, config, model_name, backend, threads) for p in paths]
+        else:
+            clients = [_InlineShard(p, config, model_name, backend) for p in paths]
+        try:
+            for c in clients:
+                c.ready()
+            doc_ids, sizes, faiss_main, faiss_dead = [], [], 0, []
+            for s, p in enumerate(paths):
+                ids = list(open_string_table(p / "bm25", "doc_ids"))
+                doc_ids.extend(ids)
+                sizes.append(len(ids))
+                if (p / "faiss" / "manifest.json").exists():
+                    manifest = read_manifest(p / "faiss")
+                    faiss_main += manifest["ntotal"]
+                    faiss_dead.append((s, manifest.get("tombstones", [])))
+        except Exception:
+            _close_all(clients)
+            raise
+        out = cls(root, clients, doc_ids, sizes, collection)
+        out.faiss_main = faiss_main
+        out.faiss_tombstones = frozenset(int(out.to_global[s][t]) for s, dead in faiss_dead for t in dead)
+        return out
+
+    def close(self):
+        self._finalizer()
+
+    @property
+    def total_slots(self) -> int:
+        return len(self.doc_ids)
+
+    def scatter(self, name: str, args: Sequence[Optional[tuple]]) -> List[Any]:
+        """
+        Send `name(*args[s])` to every shard s with args (None: skip) before
+        waiting on any of them, then gather the replies in shard order.
+        """
+        picked = [s for s, a in enumerate(args) if a is not None]
+        out: List[Any] = [None] * self.n
+        error = None
+        with ExitStack() as stack:
+            # fixed lock order: concurrent scatters cannot deadlock
+            for s in picked:
+                stack.enter_context(self.clients[s].lock)
+            for s in picked:
+                self.clients[s].send(name, args[s])
+            for s in picked:
+                try:
+                    out[s] = self.clients[s].recv()
+                except Exception as exc:  # keep draining: every reply must be read
+                    error = error or exc
+        if error is not None:
+            raise error
+        return out
+
+    def local_masks(self, allow: Optional[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """A global bool-per-slot mask as one mask per shard over its local slots."""
+        if allow is None:
+            return [None] * self.n
+        out = []
+        for g in self.to_global:
+            m = np.zeros(len(g), dtype=bool)
+            inside = g < len(allow)
+            m[inside] = allow[g[inside]]
+            out.append(m)
+        return out
+
+    def merge(self, parts: List[Optional[List[Hits]]], n_queries: int, k: int) -> List[Hits]:
+        """
+        Exact global top-k per query from per-shard top-k lists of
+        comparable scores; local slots become global ones.
+        """
+        to_global = self.to_global
+        out = []
+        for i in range(n_queries):
+            slots, scores = [], []
+            for s, res in enumerate(parts):
+                if res is None:
+                    continue
+                local, sc = res[i]
+                g = to_global[s]
+                seen = local < len(g)  # added on the shard a moment ago, not mapped here yet
+                slots.append(g[local[seen]])
+                scores.append(np.asarray(sc)[seen])
+            if not slots:
+                out.append(_empty())
+                continue
+            slots_a, scores_a = np.concatenate(slots), np.concatenate(scores)
+            order = np.argsort(-scores_a, kind="stable")[:k]
+            out.append((slots_a[order], scores_a[order]))
+        return out
+
+    def route(self, keys: Iterable[str]) -> Dict[int, List[int]]:
+        """Positions of `keys` (doc ids) grouped by shard."""
+        groups: Dict[int, List[int]] = {}
+        for j, d in enumerate(keys):
+            groups.setdefault(shard_of(d, self.n), []).append(j)
+        return groups
+
+    def df(self, tok: str) -> int:
+        tid = self._vocab.get(tok)
+        return self.delta_df[tok] + (0 if tid is None else int(self._df[tid]))
+
+    def save_compacted(self, root: Path):
+        """Every shard writes itself compacted under `root`; collection statistics are recomputed over them."""
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        self.scatter("save_compacted", [(str(shard_dir(root, s)),) for s in range(self.n)])
+        write_collection(root, self.n)
+
+class ShardedBM25:
+    """BM25Local's query and update interface over a ShardSet, in global slots."""
+
+    _tokenize = staticmethod(BM25Local._tokenize)
+
+    def __init__(self, shards: ShardSet):
+        self.shards = shards
+        c = shards.collection
+        self.k1, self.b, self.epsilon = c["k1"], c["b"], c["epsilon"]
+        self.avgdl = c["avgdl"]
+        self.n_docs = c["n_docs"]
+        self.idf_floor = c["idf_floor"]
+
+    @property
+    def bm25(self) -> bool:
+        return self.shards.total_slots > 0
+
+    @property
+    def total_slots(self) -> int:
+        return self.shards.total_slots
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return self.shards.doc_ids
+
+    def doc_id(self, slot: int) -> str:
+        return self.shards.doc_ids[slot]
+
+    @property
+    def pending_docs(self) -> int:
+        return self.shards.pending_docs
+
+    @property
+    def live_docs(self) -> int:
+        return self.n_docs + self.pending_docs - len(self.tombstones)
+
+    @property
+    def segments(self) -> List[Tuple[int, int]]:
+        return self.shards.segments
+
+    @property
+    def tombstones(self) -> FrozenSet[int]:
+        return self.shards.bm25_tombstones
+
+    def _global_idf(self, toks: Iterable[str]) -> Dict[str, float]:
+        # BM25Local._global_idf over the whole collection: shards score with these while deltas are pending
+        n = self.n_docs + self.pending_docs
+        out = {}
+        for tok in toks:
+            df = self.shards.df(tok)
+            idf = float(np.log(n - df + 0.5) - np.log(df + 0.5))
+            out[tok] = idf if idf >= 0 else self.idf_floor
+        return out
+
+    def query_slots(self, queries: List[str], k: int = 10, allow: Optional[np.ndarray] = None) -> List[Hits]:
+        if not self.bm25 or k <= 0 or not queries:
+            return [_empty() for _ in queries]
+        sh = self.shards
+        # without deltas the shards' own (collection-wide) idf is already exact
+        idfs = [self._global_idf(Counter(self._tokenize(q))) for q in queries] if sh.pending_docs else None
+        masks = sh.local_masks(allow)
+        parts = sh.scatter("bm25_search", [(queries, k, masks[s], idfs) for s in range(sh.n)])
+        return sh.merge(parts, len(queries), k)
+
+    def query_many(self, queries: List[str], k: int = 10,
+                   allow: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+        return [
+            [(self.doc_id(i), float(s)) for i, s in zip(slots.tolist(), scores)]
+            for slots, scores in self.query_slots(queries, k=k, allow=allow)
+        ]
+
+    def add(self, items: List[Tuple[str, str]]) -> Tuple[List[int], List[int]]:
+        """Route `items` to their shards; new global slots follow the order of `items`."""
+        if not items:
+            return [], []
+        sh = self.shards
+        groups = sh.route(d for d, _ in items)
+        # collection statistics first: once a shard holds deltas, queries must carry global idf
+        for _, text in items:
+            sh.delta_df.update(set(self._tokenize(text)))
+        sh.pending_docs += len(items)
+        replies = sh.scatter("bm25_add", [([items[j] for j in groups[s]],) if s in groups else None
+                                          for s in range(sh.n)])
+        base = sh.total_slots
+        owner = np.empty(len(items), dtype=np.int32)
+        local = np.empty(len(items), dtype=np.int64)
+        to_global = list(sh.to_global)
+        replaced = []
+        for s, pos in groups.items():
+            new_local, old_local = replies[s]
+            owner[pos], local[pos] = s, new_local
+            replaced.extend(int(to_global[s][j]) for j in old_local)
+            to_global[s] = np.concatenate([to_global[s], base + np.asarray(pos, dtype=np.int64)])
+        # doc ids, then the maps: merge() only returns slots it can already name
+        sh.doc_ids.extend(d for d, _ in items)
+        sh.owner, sh.local = np.concatenate([sh.owner, owner]), np.concatenate([sh.local, local])
+        sh.to_global = to_global
+        sh.segments = sh.segments + [(s, len(pos)) for s, pos in sorted(groups.items())]
+        sh.bm25_tombstones = sh.bm25_tombstones | set(replaced)
+        return list(range(base, base + len(items))), replaced
+
+    def delete(self, doc_ids: Iterable[str]) -> List[int]:
+        sh = self.shards
+        doc_ids = list(doc_ids)
+        groups = sh.route(doc_ids)
+        replies = sh.scatter("bm25_delete", [([doc_ids[j] for j in groups[s]],) if s in groups else None
+                                             for s in range(sh.n)])
+        removed = [int(sh.to_global[s][j]) for s in groups for j in replies[s]]
+        sh.bm25_tombstones = sh.bm25_tombstones | set(removed)
+        return removed
+
+    def merge_deltas(self):
+        sh = self.shards
+        counts = Counter(s for s, _ in sh.segments)
+        busy = {s for s, c in counts.items() if c > 1}
+        if not busy:
+            return
+        sh.scatter("merge_deltas", [() if s in busy else None for s in range(sh.n)])
+        docs = Counter()
+        for s, n in sh.segments:
+            docs[s] += n
+        sh.segments = [(s, docs[s]) for s in sorted(docs)]
+
+class ShardedFAISS:
+    """
+    EmbedFAISS's query and update interface over a ShardSet. `encoder` (an
+    EmbedFAISS without an index) owns the model, the query cache and the
+    embedding store: queries and new documents are encoded once, here, and
+    only vectors travel to the shards.
+    """
+
+    def __init__(self, shards: ShardSet, encoder: EmbedFAISS):
+        self.shards = shards
+        self.encoder = encoder
+        self.config = encoder.config
+
+    @property
+    def query_cache(self):
+        return self.encoder.query_cache
+
+    @property
+    def store(self):
+        return self.encoder.store
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return self.shards.doc_ids
+
+    @property
+    def pending(self) -> int:
+        return self.shards.faiss_pending
+
+    @property
+    def ntotal(self) -> int:
+        return self.shards.faiss_main + self.shards.faiss_pending
+
+    @property
+    def tombstones(self) -> FrozenSet[int]:
+        return self.shards.faiss_tombstones
+
+    def encode_queries(self, queries: List[str], batch_size: int = 64) -> np.ndarray:
+        return self.encoder.encode_queries(queries, batch_size=batch_size)
+
+    def query_slots(self, queries: List[str], k: int = 10, allow: Optional[np.ndarray] = None) -> List[Hits]:
+        if not self.ntotal or not queries:
+            return [_empty() for _ in queries]
+        return self.search_slots(self.encode_queries(queries), k=k, allow=allow)
+
+    def query_many(self, queries: List[str], k: int = 10,
+                   allow: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+        return [
+            [(self.doc_ids[i], float(s)) for i, s in zip(slots.tolist(), scores)]
+            for slots, scores in self.query_slots(queries, k=k, allow=allow)
+        ]
+
+    def search_slots(self, qv: np.ndarray, k: int = 10, allow: Optional[np.ndarray] = None) -> List[Hits]:
+        sh = self.shards
+        if not self.ntotal or k <= 0:
+            return [_empty() for _ in qv]
+        masks = sh.local_masks(allow)
+        qv = np.ascontiguousarray(qv, dtype=np.float32)
+        parts = sh.scatter("faiss_search", [(qv, k, masks[s]) for s in range(sh.n)])
+        return sh.merge(parts, len(qv), k)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """EmbedFAISS.memory_stats() summed over the shards (mmap: every shard is mapped)."""
+        parts = self.shards.scatter("faiss_memory", [()] * self.shards.n)
+        out = {key: sum(p[key] for p in parts) for key in ("vectors", "vector_bytes", "fp32_bytes", "heap_bytes")}
+        out["memory_saving"] = 1 - out["vector_bytes"] / out["fp32_bytes"] if out["fp32_bytes"] else 0.0
+        return {"storage": self.config.storage, "mmap": all(p["mmap"] for p in parts), **out}
+
+    def search(self, qv: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """faiss-style (D, I) matrices padded with -1, so the shard set can be benchmarked like an index."""
+        D = np.full((len(qv), k), -np.inf, dtype=np.float32)
+        I = np.full((len(qv), k), -1, dtype=np.int64)
+        for row, (slots, scores) in enumerate(self.search_slots(qv, k=k)):
+            D[row, :len(slots)], I[row, :len(slots)] = scores, slots
+        return D, I
+
+    def encode_corpus(self, texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
+        return self.encoder.encode_corpus(texts, show_progress_bar=show_progress_bar)
+
+    def add(self, items: List[Tuple[str, str]], slots: List[int]) -> np.ndarray:
+        """Embed `items` here and send each shard its vectors, under the local slots ShardedBM25.add assigned."""
+        if not items:
+            return np.zeros((0, 0), dtype=np.float32)
+        emb = self.encode_corpus([t for _, t in items], show_progress_bar=False)
+        self.add_vectors([d for d, _ in items], slots, emb)
+        return emb
+
+    def add_vectors(self, doc_ids: List[str], slots: List[int], emb: np.ndarray):
+        """add() for vectors encoded elsewhere (normalized, one row per doc id)."""
+        if not doc_ids:
+            return
+        sh = self.shards
+        slots_a = np.asarray(slots, dtype=np.int64)
+        owner, local = sh.owner[slots_a], sh.local[slots_a]
+        args: List[Optional[tuple]] = [None] * sh.n
+        for s in np.unique(owner).tolist():
+            pos = np.flatnonzero(owner == s)
+            args[s] = ([doc_ids[j] for j in pos.tolist()], local[pos].tolist(), emb[pos])
+        sh.scatter("faiss_add", args)
+        sh.faiss_pending += len(doc_ids)
+
+    def delete(self, slots: List[int]):
+        sh = self.shards
+        slots_a = np.asarray(list(slots), dtype=np.int64)
+        if not len(slots_a):
+            return
+        owner, local = sh.owner[slots_a], sh.local[slots_a]
+        sh.scatter("faiss_delete", [(local[owner == s].tolist(),) if (owner == s).any() else None
+                                    for s in range(sh.n)])
+        sh.faiss_tombstones = sh.faiss_tombstones | set(slots_a.tolist())
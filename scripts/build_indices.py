@@ -1,47 +1,198 @@
+import argparse
 import json
+import os
+import shutil
+import time
+from dataclasses import asdict, replace
 from pathlib import Path
 from datetime import datetime
+from typing import AbstractSet, Optional
+import numpy as np
 from backend.app.core.config import settings
-from backend.app.core.path_resolver import index_dir, acord_dir
+from backend.app.core.path_resolver import index_dir, acord_dir, cuad_dir
 from retrieval.bm25_local import BM25Local
-from retrieval.embed_faiss import EmbedFAISS
-from retrieval.beir_acord_loader import load_corpus, load_queries, evaluate, load_qrels
+from retrieval.contract_passages import cuad_contract_meta, iter_cuad_passages
+from retrieval.delta_log import LOCK, doc_entry, file_lock, position, rebase, spool, spooled_docs, spooled_ids
+from retrieval.doc_store import DocStore
+from retrieval.embed_faiss import EmbedFAISS, IndexConfig, VectorSample, ann_report, build_index
+from retrieval.embedding_store import EmbeddingStore, store_model_key
+from retrieval.evaluation import evaluate_rankings
+from retrieval.generations import current as current_generation, new_generation, publish
+from retrieval.meta_columns import MetaColumns
+from retrieval.minhash import MinHashIndex
+from retrieval.parallel_encode import EncoderPool, peak_rss_mb
+from retrieval.shards import SHARDS, ShardedBM25, ShardedFAISS, ShardSet, build_bm25_shards, build_faiss_shards, shard_key
+from retrieval.beir_acord_loader import iter_corpus, load_queries, load_qrels
 
-def main():
+def ann_comparison(sample: np.ndarray, qv: np.ndarray, cfg: IndexConfig, extra_types, k: int = 10):
+    """
+    recall@k vs exact flat search + per-query latency of the built index
+    type and any extra types, each rebuilt over `sample` (a bounded random
+    sample of the corpus vectors) so the report never needs the full matrix.
+    """
+    flat, _ = build_index(sample, replace(cfg, index_type="flat", storage="fp32"))
+    report = {}
+    for t in [cfg.index_type, *extra_types]:
+        if t in report:
+            continue
+        index, index_cfg = build_index(sample, replace(cfg, index_type=t))
+        report[t] = {"config": asdict(index_cfg), "sample": len(sample), **ann_report(index, flat, qv, k=k)}
+    return report
+
+def _kept(doc_id: str, api_ids: AbstractSet[str], gone: AbstractSet[str]) -> bool:
+    # a corpus document replaced or deleted through the API (deleting a contract deletes its passages)
+    return doc_id not in api_ids and doc_id not in gone and shard_key(doc_id) not in gone
+
+def write_doc_store(path: Path, served: DocStore, cuad, max_chars: int, api_path: Optional[Path]) -> int:
+    """
+    The served generation's metadata (a legacy docs_meta.json included),
+    minus CUAD entries and documents replaced or deleted through the API,
+    with fresh CUAD contract / passage entries streamed from the contracts
+    and the entries of the documents upserted through the API (streamed
+    from the spooled snapshot at `api_path`). Returns the number of CUAD
+    passages.
+    """
+    api_ids, gone = spooled_ids(api_path) if api_path is not None else (frozenset(), frozenset())
+    passages = 0
+
+    def items():
+        nonlocal passages
+        yield from ((d, m) for d, m in served.items() if not d.startswith("cuad/") and _kept(d, api_ids, gone))
+        if cuad is not None:
+            yield from ((d, m) for d, m in cuad_contract_meta(cuad).items() if d not in gone)
+            for pid, _, pmeta in iter_cuad_passages(cuad, max_chars):
+                if _kept(pid, api_ids, gone):
+                    passages += 1
+                    yield pid, pmeta
+        if api_path is not None:
+            yield from ((doc["doc_id"], doc_entry(doc)) for doc in spooled_docs(api_path))
+
+    DocStore.write(str(path), items())
+    return passages
+
+def iter_items(acord: Path, cuad: Optional[Path], max_chars: int, api_path: Optional[Path] = None):
+    """
+    ACORD passages, then every clause of the CUAD contracts as its own
+    passage, then the documents upserted through the API (streamed from
+    the spooled snapshot at `api_path`), which replace corpus documents of
+    the same id; those deleted through it are left out (module level:
+    shard builders pickle it).
+    """
+    api_ids, gone = spooled_ids(api_path) if api_path is not None else (frozenset(), frozenset())
+    yield from ((d, t) for d, t in iter_corpus(acord) if _kept(d, api_ids, gone))
+    if cuad is not None:
+        for pid, text, _ in iter_cuad_passages(cuad, max_chars):
+            if _kept(pid, api_ids, gone):
+                yield pid, text
+    if api_path is not None:
+        yield from ((doc["doc_id"], doc["text"]) for doc in spooled_docs(api_path))
+
+def main(compare_index_types=()):
     idx = index_dir()
-    bm25_path = idx / "bm25.pkl"
-    faiss_dir = idx / "faiss"
-    meta_path = idx / "meta.json"
+    # everything is written into a fresh generation directory; serving workers only see it once published
+    generation, gen_dir = new_generation(idx)
+    bm25_path = gen_dir / "bm25"
+    faiss_dir = gen_dir / "faiss"
+    meta_path = gen_dir / "meta.json"
     results_path = idx / "last_results.json"
 
     acord = acord_dir()
-    corpus = load_corpus(acord)
+    cuad = None
+    if settings.INDEX_CUAD_CONTRACTS:
+        try:
+            cuad = cuad_dir()
+        except FileNotFoundError:
+            print("No CUAD directory; indexing the ACORD corpus only")
+    # updates made through the API so far (compacted into the archive or still in the delta log) are part of the
+    # corpus: their texts are indexed and their metadata written, so nothing is left without the other. Their net
+    # effect is spooled to a file that every pass streams, so the build never holds the API documents in memory
+    with file_lock(idx / LOCK):
+        log_position = position(idx)
+    api_path = gen_dir / "api_updates.jsonl"
+    spool(idx, log_position, api_path)
+    corpus_args = (acord, cuad, settings.PASSAGE_MAX_CHARS, api_path)
 
-    if not corpus:
+    def corpus_items():
+        return iter_items(*corpus_args)
+
+    if next(corpus_items(), None) is None:
         print("No ACORD corpus.jsonl found. Seed demo first: `make seed`")
+        shutil.rmtree(gen_dir, ignore_errors=True)
         return
 
-    items = list(corpus.items())
-
+    n_shards = max(1, settings.RETRIEVAL_SHARDS)
+    shards_root = gen_dir / SHARDS
+    # each index streams the corpus from disk in its own pass, so the texts are never all in memory
     # BM25
-    bm25 = BM25Local()
-    bm25.build(items)
-    bm25.save(str(bm25_path))
+    if n_shards > 1:
+        # one process per shard, each keeping the documents that hash to it
+        sizes = build_bm25_shards(iter_items, corpus_args, n_shards, shards_root,
+                                  workers=min(n_shards, os.cpu_count() or 1))
+        n_docs = sum(sizes)
+    else:
+        bm25 = BM25Local()
+        bm25.build(corpus_items())
+        bm25.save(str(bm25_path))
+        n_docs = len(bm25.doc_ids)
+
+    # MinHash/LSH signatures for version clusters, one per contract (its passages fold into it)
+    t0 = time.perf_counter()
+    minhash = MinHashIndex(settings.MINHASH_NUM_PERM, settings.MINHASH_BANDS, settings.MINHASH_SHINGLE)
+    minhash.build(corpus_items(), key=shard_key)
+    minhash.save(str(gen_dir / "minhash"))
+    minhash_s = time.perf_counter() - t0
 
     # FAISS
-    faiss_dir.mkdir(parents=True, exist_ok=True)
-    faissi = EmbedFAISS(settings.MODEL_NAME)
-    faissi.build(items)
-    faissi.save(str(faiss_dir))
+    store = None
+    if settings.EMBED_STORE_ENABLED:
+        # unchanged texts are read back from disk instead of being re-encoded
+        store = EmbeddingStore(idx / "embeddings", store_model_key(settings.MODEL_NAME, settings.EMBED_BACKEND),
+                               settings.EMBED_STORE_DTYPE)
+    pool = None
+    if settings.EMBED_WORKERS > 1:
+        pool = EncoderPool(settings.MODEL_NAME, settings.EMBED_BACKEND, settings.EMBED_WORKERS,
+                           settings.EMBED_THREADS_PER_WORKER)
+    faissi = EmbedFAISS(settings.MODEL_NAME, IndexConfig.from_settings(settings), store=store,
+                        model_loader=(lambda: pool) if pool is not None else None,
+                        backend=settings.EMBED_BACKEND)
+    # a bounded random sample of the vectors for the recall report; the corpus matrix is never kept
+    sample = VectorSample(settings.FAISS_REPORT_SAMPLE)
+    t0 = time.perf_counter()
+    if n_shards > 1:
+        # every shard gets its own index over its own vectors, filled in one pass over the corpus:
+        # each chunk is encoded once (store / pool shared) and its rows routed to their shards
+        build_faiss_shards(corpus_items(), faissi, n_shards, shards_root, settings.EMBED_CHUNK_SIZE, sample)
+    else:
+        faissi.build(corpus_items(), chunk_size=settings.EMBED_CHUNK_SIZE, sample=sample)
+    encode_s = time.perf_counter() - t0
+    if store is not None:
+        store.consolidate()
+    if n_shards > 1:
+        # evaluated exactly as served: fan-out and merge across the shards (in this process)
+        shards = ShardSet.open(shards_root, faissi.config, settings.MODEL_NAME, settings.EMBED_BACKEND, "inline")
+        bm25, faissi = ShardedBM25(shards), ShardedFAISS(shards, faissi)
+    else:
+        faissi.save(str(faiss_dir))
 
     # Optional BEIR-style eval
     queries = load_queries(acord)
+
+    # ANN quality/latency against the exact flat baseline (ACORD queries, else sampled corpus vectors)
+    emb = sample.vectors
+    if queries:
+        ann_qv = faissi.encode_queries(list(queries.values()))
+    else:
+        ann_qv = emb[np.random.default_rng(0).choice(len(emb), size=min(200, len(emb)), replace=False)]
+    ann = ann_comparison(emb, ann_qv, faissi.config, compare_index_types)
+
     qrels = load_qrels(acord)
     topk_map = {}
     if queries:
-        for qid, qtext in list(queries.items())[:200]:  # limit for speed
-            b = bm25.query(qtext, k=10)
-            f = faissi.query(qtext, k=10)
+        qids, qtexts = list(queries.keys()), list(queries.values())
+        # batched: one encode + one FAISS search for all queries
+        bm25_all = bm25.query_many(qtexts, k=10)
+        faiss_all = faissi.query_many(qtexts, k=10)
+        for qid, b, f in zip(qids, bm25_all, faiss_all):
             # simple combine by score sum
             sc = {}
             for d, s in b:
@@ -51,17 +202,52 @@ def main():
             ranked = sorted(sc.items(), key=lambda x: x[1], reverse=True)[:10]
             topk_map[qid] = ranked
 
-    metrics = {"MRR@10": 0.0, "nDCG@10": 0.0}
+    metrics = {"MRR@10": 0.0, "nDCG@10": 0.0, "Recall@10": 0.0}
     if qrels and topk_map:
-        mrr, ndcg = evaluate(topk_map, qrels, k=10)
-        metrics = {"MRR@10": mrr, "nDCG@10": ndcg}
+        metrics = evaluate_rankings(topk_map, qrels, k=10)
+        metrics.pop("queries")
 
-    results_path.write_text(json.dumps({"metrics": metrics}, indent=2))
-    meta = {"last_build": datetime.utcnow().isoformat() + "Z", "docs": len(items)}
+    if pool is not None:
+        pool.close()  # workers must exit before their peak RSS is reported
+    embed_cache = store.stats() if store is not None else None
+    encode = {"docs": n_docs, "seconds": encode_s, "docs_per_s": n_docs / encode_s if encode_s else 0.0,
+              "workers": settings.EMBED_WORKERS, "peak_rss_mb": peak_rss_mb()}
+    dedup = {"documents": len(minhash), "seconds": minhash_s,
+             "clustered": sum(len(c) for c in minhash.clusters(settings.VERSION_CLUSTER_THRESHOLD) if len(c) > 1)}
+    results_path.write_text(json.dumps({"metrics": metrics, "ann": ann, "embedding_store": embed_cache,
+                                        "encode": encode, "version_clusters": dedup}, indent=2))
+    # hand-provided / earlier entries carry over from the serving generation; API updates come from the snapshot
+    passages = write_doc_store(gen_dir / "docs", DocStore.open(current_generation(idx)[1]), cuad,
+                               settings.PASSAGE_MAX_CHARS, api_path)
+    # filter / grouping columns per slot, so workers map them instead of compiling them from the store
+    MetaColumns.build(bm25.doc_ids, DocStore.load(str(gen_dir / "docs"))).save(str(gen_dir / "meta_cols"))
+    faiss_report = {"storage": faissi.config.storage,
+                    **{k: v for k, v in ann[faissi.config.index_type].items() if k != "config"}}
+    meta = {"last_build": datetime.utcnow().isoformat() + "Z", "docs": n_docs, "passages": passages,
+            "generation": generation, "shards": n_shards, "faiss_report": faiss_report}
     meta_path.write_text(json.dumps(meta, indent=2))
+    with file_lock(idx / LOCK):
+        # the archive becomes what this build contains, the delta log keeps only the updates made since
+        rebase(idx, log_position, api_path, lambda: publish(idx, generation, settings.INDEX_KEEP_GENERATIONS))
 
-    print("=== Build complete ===")
+    print(f"=== Build complete: generation {generation} published ===")
+    print(f"Encoded + indexed {n_docs} docs in {encode_s:.1f}s ({encode['docs_per_s']:.1f} docs/s, "
+          f"{settings.EMBED_WORKERS} worker(s)); peak RSS {encode['peak_rss_mb']}")
+    if embed_cache is not None:
+        print(f"Embedding store: {embed_cache['hits']}/{embed_cache['hits'] + embed_cache['misses']} texts reused "
+              f"(hit rate {embed_cache['hit_rate']:.1%}), {embed_cache['entries']} stored")
+    print(f"MinHash signatures for {dedup['documents']} documents in {dedup['seconds']:.1f}s; "
+          f"{dedup['clustered']} have a near-duplicate at Jaccard >= {settings.VERSION_CLUSTER_THRESHOLD}")
     print(json.dumps(metrics, indent=2))
+    print("=== FAISS recall@10 vs flat / per-query latency ===")
+    print(json.dumps({t: {k: v for k, v in r.items() if k != "config"} for t, r in ann.items()}, indent=2))
+    mem = faissi.memory_stats()
+    print(f"FAISS vectors: {mem['storage']}, {mem['vector_bytes'] / 2 ** 20:.1f} MiB "
+          f"({mem['memory_saving']:.0%} below float32)")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--compare-index-types", type=str, default="",
+                    help="comma list of extra FAISS types to benchmark against flat, e.g. ivf_flat,hnsw,ivf_pq")
+    args = ap.parse_args()
+    main([t.strip() for t in args.compare_index_types.split(",") if t.strip()])